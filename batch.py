@@ -0,0 +1,295 @@
+"""
+列式批容器：
+numpy 引擎产出的一批 orders / items 用它承载，替代 list[dict]。
+
+- 整数列：np.int64
+- status / refund_type：uint8 编码 + 取值表（字典编码）
+- 时间列：相对 base_time 的分钟偏移（int64），NULL_MINUTE 表示空；
+  导出时只对批内唯一值做一次格式化，再按下标展开（字典解码）
+
+兼容旧链路：len() / 切片 / iter_rows() 逐行产出和行模式完全相同的 dict。
+
+维表（UserDimBatch / ShopDimBatch / SkuDimBatch）也用同一套容器，
+city / shop_type / category 的取值表来自 cfg，跟着实例走。
+BatchStream 是惰性的批序列（只知道总行数），给流式写出的大维表用。
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from facts_np import STATUS_NAMES, REFUND_TYPE_NAMES, NULL_MINUTE
+from timefmt import get_minute_formatter
+
+
+class ColumnBatch:
+    # 行模式字段顺序（与 exporter.ODS_SCHEMA 一致）
+    fields = ()
+    # 字典编码列 -> 取值表
+    code_fields = {}
+    # 时间列（分钟偏移）
+    time_fields = ()
+
+    def __init__(self, columns, base_time=None, code_fields=None):
+        self.columns = columns
+        self.base_time = base_time
+        # 维表的取值表由 cfg 决定，按实例覆盖类属性
+        if code_fields is not None:
+            self.code_fields = code_fields
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(key)
+        if isinstance(key, str):
+            return self.columns[key]
+        raise TypeError(f"{type(self).__name__} indices must be slices or column names")
+
+    def take(self, index):
+        """
+        按切片 / 布尔掩码 / 下标数组取子批（切片时是零拷贝视图）
+        """
+        return type(self)(
+            {k: v[index] for k, v in self.columns.items()},
+            base_time=self.base_time,
+            code_fields=self.code_fields,
+        )
+
+    @classmethod
+    def concat(cls, batches):
+        batches = list(batches)
+        if not batches:
+            return None
+        return cls(
+            {k: np.concatenate([b.columns[k] for b in batches]) for k in cls.fields},
+            base_time=batches[0].base_time,
+            code_fields=batches[0].code_fields,
+        )
+
+    # ========= 编码（行模式 -> 列式）=========
+    @classmethod
+    def code_tables(cls, cfg):
+        return cls.code_fields
+
+    @classmethod
+    def from_rows(cls, cfg, rows):
+        """
+        list[dict] -> 列式批：
+        - 字典编码列按 code_tables(cfg) 转下标
+        - 时间列转成相对 cfg.base_time 的分钟（datetime / minute 两种模式都支持）
+        """
+        code_fields = cls.code_tables(cfg)
+        columns = {}
+
+        for name in cls.fields:
+            values = [r[name] for r in rows]
+
+            if name in code_fields:
+                names = code_fields[name]
+                index = {v: i for i, v in enumerate(names)}
+                columns[name] = np.fromiter((index[v] for v in values), dtype=code_dtype(names), count=len(values))
+            elif name in cls.time_fields:
+                columns[name] = _encode_minutes(cfg, values)
+            else:
+                columns[name] = np.asarray(values, dtype=np.int64)
+
+        return cls(columns, base_time=cfg.base_time, code_fields=code_fields)
+
+    # ========= 解码 =========
+    def _decode_times(self, minutes):
+        base_time = self.base_time
+        return [
+            None if m == NULL_MINUTE else base_time + timedelta(minutes=m)
+            for m in minutes.tolist()
+        ]
+
+    def decoded_column(self, name):
+        """
+        单列解码成 Python 值列表（与行模式取值一致）
+        """
+        col = self.columns[name]
+        if name in self.code_fields:
+            names = self.code_fields[name]
+            return [names[c] for c in col.tolist()]
+        if name in self.time_fields:
+            return self._decode_times(col)
+        return col.tolist()
+
+    def iter_rows(self):
+        """
+        惰性逐行产出 dict，只给需要行模式的旧代码用
+        """
+        names = self.fields
+        cols = [self.decoded_column(k) for k in names]
+        for values in zip(*cols):
+            yield dict(zip(names, values))
+
+    # ========= 文本化（给 exporter 用）=========
+    def _text_times(self, minutes):
+        uniq, inv = np.unique(minutes, return_inverse=True)
+        fmt = get_minute_formatter(self.base_time)
+        texts = np.array([
+            "" if m == NULL_MINUTE else fmt(m)
+            for m in uniq.tolist()
+        ], dtype=object)
+        return texts[inv].tolist()
+
+    def text_column(self, name):
+        """
+        单列转成 CSV 文本列表，和 exporter._fmt 的结果逐字节一致
+        """
+        col = self.columns[name]
+        if name in self.code_fields:
+            return np.asarray(self.code_fields[name], dtype=object)[col].tolist()
+        if name in self.time_fields:
+            return self._text_times(col)
+        return list(map(str, col.tolist()))
+
+    def csv_lines(self, fieldnames):
+        cols = [self.text_column(k) for k in fieldnames]
+        return list(map(",".join, zip(*cols)))
+
+
+class OrderBatch(ColumnBatch):
+    fields = (
+        "order_id", "user_id", "shop_id", "created_time", "status",
+        "total_qty", "total_amount",
+        "discount_amount", "paid_amount", "refund_amount",
+        "pay_time", "cancel_time", "ship_time", "complete_time", "refund_time",
+        "refund_type",
+    )
+    code_fields = {
+        "status": STATUS_NAMES,
+        "refund_type": REFUND_TYPE_NAMES,
+    }
+    time_fields = (
+        "created_time", "pay_time", "cancel_time", "ship_time", "complete_time", "refund_time",
+    )
+
+    @classmethod
+    def from_columns(cls, cfg, cols):
+        """
+        facts_np 的订单列字典（*_minute 命名）-> OrderBatch
+        """
+        columns = {
+            "order_id": cols["order_id"],
+            "user_id": cols["user_id"],
+            "shop_id": cols["shop_id"],
+            "status": cols["status"],
+            "refund_type": cols["refund_type"],
+        }
+        for name in ("total_qty", "total_amount", "discount_amount", "paid_amount", "refund_amount"):
+            columns[name] = cols[name]
+        for name in cls.time_fields:
+            columns[name] = cols[name.replace("_time", "_minute")]
+        return cls(columns, base_time=cfg.base_time)
+
+
+class ItemBatch(ColumnBatch):
+    fields = (
+        "order_item_id", "order_id", "user_id", "shop_id", "sku_id",
+        "item_qty", "sku_price", "item_amount",
+    )
+
+    @classmethod
+    def from_columns(cls, cfg, cols):
+        return cls(dict(cols), base_time=cfg.base_time)
+
+
+class UserDimBatch(ColumnBatch):
+    fields = ("user_id", "register_time", "city")
+    time_fields = ("register_time",)
+
+    @classmethod
+    def code_tables(cls, cfg):
+        return {"city": tuple(cfg.city_pool)}
+
+
+class ShopDimBatch(ColumnBatch):
+    fields = ("shop_id", "shop_type", "shop_weight")
+
+    @classmethod
+    def code_tables(cls, cfg):
+        return {"shop_type": tuple(cfg.shop_type_weights)}
+
+
+class SkuDimBatch(ColumnBatch):
+    fields = ("sku_id", "category", "sku_price")
+
+    @classmethod
+    def code_tables(cls, cfg):
+        return {"category": tuple(cfg.category_buy_weights)}
+
+
+class BatchStream:
+    """
+    惰性的列式批序列：len() 是总行数，每次迭代重新逐块生成，
+    整表从不驻留内存（exporter 按块写出）
+    """
+
+    def __init__(self, make_batches, length):
+        self.make_batches = make_batches
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.make_batches())
+
+    def materialize(self):
+        batches = list(self)
+        return type(batches[0]).concat(batches) if batches else None
+
+
+# 表 -> 列式批类型（list[dict] 转列式时用）
+ODS_BATCHES = {
+    "ods_user_dim": UserDimBatch,
+    "ods_shop_dim": ShopDimBatch,
+    "ods_sku_dim": SkuDimBatch,
+    "ods_orders": OrderBatch,
+    "ods_order_items": ItemBatch,
+}
+
+
+def iter_column_batches(cfg, table, rows):
+    """
+    list[dict] / ColumnBatch / BatchStream -> 逐个列式批
+    """
+    if isinstance(rows, BatchStream):
+        yield from rows
+    elif isinstance(rows, ColumnBatch):
+        yield rows
+    else:
+        yield ODS_BATCHES[table].from_rows(cfg, rows)
+
+
+def code_dtype(names):
+    return np.uint8 if len(names) <= 256 else np.int32
+
+
+def _encode_minutes(cfg, values):
+    """
+    时间列 -> 相对 cfg.base_time 的整数分钟（None -> NULL_MINUTE）
+    所有时间都是 base_time 加整分钟，截到分钟精度再相减是精确的
+    """
+    if cfg.time_mode == "minute":
+        return np.array([NULL_MINUTE if v is None else v for v in values], dtype=np.int64)
+
+    base = np.datetime64(cfg.base_time, "m")
+    minutes = np.array(values, dtype="datetime64[m]")
+    out = (minutes - base).astype(np.int64)
+    out[np.isnat(minutes)] = NULL_MINUTE
+    return out
+
+
+def iter_rows(rows):
+    """
+    list[dict] 原样返回，ColumnBatch / BatchStream 惰性转行
+    """
+    if isinstance(rows, ColumnBatch):
+        return rows.iter_rows()
+    if isinstance(rows, BatchStream):
+        return (r for b in rows for r in b.iter_rows())
+    return rows
@@ -0,0 +1,79 @@
+import random
+import sys
+import time
+
+import numpy as np
+
+from facts import _build_cum_sampler, _build_alias_sampler, _build_zipf_sampler, _sample_one
+from facts_np import sample_many
+
+
+# ========= 参数 =========
+DEFAULT_SIZES = [1_000, 100_000, 10_000_000]
+SCALAR_DRAWS = 200_000
+BATCH_DRAWS = 2_000_000
+ALPHA = 1.05
+
+
+def zipf_weights(n, alpha=ALPHA):
+    # 与 facts._build_user_sampler 相同的 1/(rank^alpha)
+    return [1.0 / ((i + 1) ** alpha) for i in range(n)]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def bench_one(n):
+    ids = list(range(1, n + 1))
+    weights = zipf_weights(n)
+
+    rnd = random.Random(42)
+    rng = np.random.default_rng(42)
+
+    rows = []
+    builders = (
+        ("cum", lambda: _build_cum_sampler(ids, weights)),
+        ("alias", lambda: _build_alias_sampler(ids, weights)),
+        # 无表 Zipf：rank 即 id，不需要 ids / weights
+        ("zipf", lambda: _build_zipf_sampler(n, ALPHA)),
+    )
+    for kind, build in builders:
+        sampler, t_build = timed(build)
+
+        def scalar():
+            for _ in range(SCALAR_DRAWS):
+                _sample_one(rnd, sampler)
+
+        _, t_scalar = timed(scalar)
+
+        # 先热身一次，把 numpy 数组缓存到 sampler 上
+        sample_many(rng, sampler, 1)
+        draws, t_batch = timed(lambda: sample_many(rng, sampler, BATCH_DRAWS))
+
+        head_share = float(np.mean(draws == 1))
+        rows.append((kind, t_build, t_scalar, t_batch, head_share))
+
+    return rows
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"scalar draws={SCALAR_DRAWS:,}, batch draws={BATCH_DRAWS:,}, alpha={ALPHA}")
+    print(f"{'n':>12} {'kind':>6} {'build_s':>9} {'scalar_ns/draw':>15} {'batch_ns/draw':>14} {'P(id=1)':>9}")
+
+    for n in sizes:
+        for kind, t_build, t_scalar, t_batch, head_share in bench_one(n):
+            print(
+                f"{n:>12,} {kind:>6} {t_build:>9.3f} "
+                f"{t_scalar / SCALAR_DRAWS * 1e9:>15.1f} "
+                f"{t_batch / BATCH_DRAWS * 1e9:>14.1f} "
+                f"{head_share:>9.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,42 @@
+import numpy as np
+
+from batch import ColumnBatch
+
+
+def _check_columnar(orders, items, sample_n):
+    """
+    OrderBatch / ItemBatch 版本：按 order_id 分桶求和，不构造 dict
+    """
+    sample_orders = orders[:sample_n]
+    oids = sample_orders["order_id"]
+
+    base = int(oids.min())
+    size = int(oids.max()) - base + 1
+
+    item_oids = items["order_id"]
+    mask = (item_oids >= base) & (item_oids < base + size)
+    slot = item_oids[mask] - base
+
+    qty_sum = np.bincount(slot, weights=items["item_qty"][mask], minlength=size).astype(np.int64)
+    amt_sum = np.bincount(slot, weights=items["item_amount"][mask], minlength=size).astype(np.int64)
+
+    errors = []
+
+    for oid, q, a, tq, ta in zip(
+        oids.tolist(),
+        qty_sum[oids - base].tolist(),
+        amt_sum[oids - base].tolist(),
+        sample_orders["total_qty"].tolist(),
+        sample_orders["total_amount"].tolist(),
+    ):
+        if q != tq:
+            errors.append(f"order {oid} qty mismatch {q} != {tq}")
+        if a != ta:
+            errors.append(f"order {oid} amount mismatch {a} != {ta}")
+
+    return len(sample_orders), errors
+
+
 def check_head_item_consistency(orders, items, sample_n=200):
     """
     校验订单头和明细是否一致
@@ -12,6 +51,11 @@ def check_head_item_consistency(orders, items, sample_n=200):
     if not orders or not items:
         return
 
+    if isinstance(orders, ColumnBatch):
+        checked, errors = _check_columnar(orders, items, sample_n)
+        _report(checked, errors)
+        return
+
     # 取前 sample_n 个订单
     sample_orders = orders[:sample_n]
 
@@ -49,10 +93,14 @@ def check_head_item_consistency(orders, items, sample_n=200):
                 f"{amt_sum} != {o['total_amount']}"
             )
 
+    _report(len(sample_orders), errors)
+
+
+def _report(checked, errors):
     if errors:
         print("CHECK FAILED:")
         for e in errors[:10]:
             print(e)
         raise ValueError("order head/item consistency check failed")
 
-    print(f"[check] head-item consistency OK (sample {len(sample_orders)})")
\ No newline at end of file
+    print(f"[check] head-item consistency OK (sample {checked})")
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+断点续跑：多进程生成的 chunk 清单
+
+run_once_stream_parallel 每完成一个 chunk，主进程就在 {parts_dir}/_checkpoint.json 里记一条：
+区间、行数、字节数、它写出的每个文件的大小 + crc32，局部统计（计数器另存 .npz）。
+resume=True 时按清单校验已完成的 chunk（文件都在、大小和 crc32 都对、统计能读），
+通过的直接复用，只重新生成缺失 / 损坏的 chunk。
+
+- 每个 chunk 的随机数只由 (seed, chunk_id) / 块号决定，重跑的 chunk 与原来逐字节一致，
+  所以续跑的最终输出与一次跑完相同
+- 清单带本次运行的指纹（配置 + 引擎 + batch_size + 输出选项 + chunk 切分），
+  指纹不同的清单整个作废，从头开始
+- 清单先写临时文件再 os.replace，进程在任何时刻被杀都不会留下半个清单
+"""
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from topk import COUNTER_FIELDS, counter_from_arrays
+
+
+# 清单格式变了就加 1，旧清单自动作废（2：计数器改为 topk 的定长计数器；3：分桶 spill 带 runs）
+CHECKPOINT_VERSION = 3
+
+CHECKPOINT_NAME = "_checkpoint.json"
+CHECKSUM_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Top 统计的计数器（topk.py），不进 JSON，每个 chunk 一个 .npz
+STATS_COUNTERS = ("top_users", "top_shops", "top_skus")
+
+
+# =========================
+# 1) 校验和 / 指纹
+# =========================
+def file_checksum(path):
+    """
+    {"bytes": 文件大小, "crc32": 整个文件的 crc32}
+    """
+    crc = 0
+    size = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            block = f.read(CHECKSUM_BLOCK_SIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return {"bytes": size, "crc32": crc}
+
+
+def run_fingerprint(cfg, **fields):
+    """
+    cfg 全部字段 + 其他影响输出的参数 -> 清单指纹
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CHECKPOINT_VERSION}".encode())
+    payload = {"cfg": cfg.to_dict(), **fields}
+    h.update(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+# =========================
+# 2) chunk 计数器（.npz）
+# =========================
+def chunk_stats_path(parts_dir, chunk_id):
+    return os.path.join(parts_dir, f"chunk-{chunk_id:05d}.stats.npz")
+
+
+def save_chunk_counters(path, result):
+    arrays = {}
+    for name in STATS_COUNTERS:
+        for field, value in result[name].to_arrays().items():
+            arrays[f"{name}_{field}"] = value
+    np.savez(path, **arrays)
+
+
+def load_chunk_counters(path):
+    with np.load(path) as data:
+        return {
+            name: counter_from_arrays({field: data[f"{name}_{field}"] for field in COUNTER_FIELDS})
+            for name in STATS_COUNTERS
+        }
+
+
+# =========================
+# 3) 清单
+# =========================
+class ChunkCheckpoint:
+    """
+    ckpt = ChunkCheckpoint(parts_dir, fingerprint)
+    done = ckpt.load_completed()   # resume=True 时：{chunk_id: result}，已校验
+    ckpt.record(result)            # 每完成一个 chunk 调一次（只在主进程）
+    ckpt.remove()                  # 整个 run 成功后删清单和 .npz
+
+    result 是 service.generate_chunk 的返回值，要带 "files"（{path: file_checksum}）
+    和 "stats_path"（save_chunk_counters 写的 .npz）
+    """
+
+    def __init__(self, parts_dir, fingerprint):
+        self.path = os.path.join(parts_dir, CHECKPOINT_NAME)
+        self.fingerprint = fingerprint
+        self.chunks = {}
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("fingerprint") != self.fingerprint:
+            return None
+        return data
+
+    @staticmethod
+    def _entry_valid(entry):
+        for path, expected in entry["files"].items():
+            try:
+                if os.path.getsize(path) != expected["bytes"]:
+                    return False
+            except OSError:
+                return False
+            if file_checksum(path) != expected:
+                return False
+        return os.path.exists(entry["stats_path"])
+
+    def load_completed(self):
+        """
+        读清单并逐个校验，返回通过校验的 {chunk_id: result}；
+        没有清单 / 指纹不同时返回 {}。没通过的条目从清单里去掉
+        """
+        data = self._read()
+        if data is None:
+            return {}
+
+        done = {}
+        for entry in data["chunks"]:
+            if not self._entry_valid(entry):
+                continue
+            try:
+                counters = load_chunk_counters(entry["stats_path"])
+            except (OSError, ValueError, KeyError):
+                continue
+            self.chunks[entry["chunk_id"]] = entry
+            done[entry["chunk_id"]] = {**entry, **counters}
+
+        return done
+
+    def record(self, result):
+        entry = {k: v for k, v in result.items() if k not in STATS_COUNTERS}
+        self.chunks[entry["chunk_id"]] = entry
+        self.save()
+
+    def save(self):
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "fingerprint": self.fingerprint,
+            "chunks": [self.chunks[k] for k in sorted(self.chunks)],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        for entry in self.chunks.values():
+            try:
+                os.remove(entry["stats_path"])
+            except OSError:
+                pass
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.chunks = {}
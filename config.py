@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from timefmt import TIME_MODES
+
 
 class Config:
     def __init__(self, mode="dev", **overrides):
@@ -138,13 +140,43 @@ class Config:
         self.shop_weight_max = 100
 
         # =========================
-        # 15) 参数覆盖
+        # 15) 抽样器 / 时间表示（给 facts.py 用）
+        # =========================
+        # "cum"  : 累计权重 + 二分，单次 O(log n)
+        # "alias": Walker/Vose 别名表，单次 O(1)
+        self.sampler_kind = "cum"
+
+        # user_cnt / sku_cnt 超过该值时，用户 / SKU 改用无表 Zipf 采样器，
+        # 用户画像改为哈希现算（常数内存）
+        self.table_free_threshold = 2_000_000
+
+        # 时间表示：
+        # "datetime": 内部用 datetime 对象
+        # "minute"  : 内部用相对 base_time 的整数分钟，写出时才格式化（输出不变）
+        self.time_mode = "datetime"
+
+        # 随机数切分方式：
+        # "legacy": 整条流共享一个随机数（多进程时每个 worker 用 seed + worker_id）
+        # "chunk" : 每 chunk_size 个订单一条独立随机数流（由 seed + 块号派生），
+        #           输出与 worker 数无关，任意块可单独重算
+        self.rng_mode = "legacy"
+        self.chunk_size = 100_000
+
+        # 维表生成方式：
+        # "python": 逐行生成 list[dict]（默认，输出不变）
+        # "numpy" : 每 dim_chunk_size 行一块向量化生成列式批（随机数由 seed + 块号派生），
+        #           用户维表边生成边写出，不整表驻留内存
+        self.dim_engine = "python"
+        self.dim_chunk_size = 1_000_000
+
+        # =========================
+        # 16) 参数覆盖
         # =========================
         for k, v in overrides.items():
             setattr(self, k, v)
 
         # =========================
-        # 16) 简单校验
+        # 17) 简单校验
         # =========================
         self._validate()
 
@@ -209,5 +241,20 @@ class Config:
         if self.shop_weight_min <= 0 or self.shop_weight_max < self.shop_weight_min:
             raise ValueError("shop_weight range invalid")
 
+        if self.sampler_kind not in ("cum", "alias"):
+            raise ValueError("sampler_kind must be 'cum' or 'alias'")
+        if self.table_free_threshold < 0:
+            raise ValueError("table_free_threshold must >= 0")
+        if self.time_mode not in TIME_MODES:
+            raise ValueError("time_mode must be 'datetime' or 'minute'")
+        if self.rng_mode not in ("legacy", "chunk"):
+            raise ValueError("rng_mode must be 'legacy' or 'chunk'")
+        if self.chunk_size <= 0:
+            raise ValueError("chunk_size must > 0")
+        if self.dim_engine not in ("python", "numpy"):
+            raise ValueError("dim_engine must be 'python' or 'numpy'")
+        if self.dim_chunk_size <= 0:
+            raise ValueError("dim_chunk_size must > 0")
+
     def to_dict(self):
         return self.__dict__
\ No newline at end of file
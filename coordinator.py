@@ -0,0 +1,622 @@
+"""
+弹性生成：常驻协调进程按 chunk 租约派活，worker 从任意机器连进来领 chunk
+
+    python -m simulator coordinator --port 7070 --set order_cnt=100000000
+    python -m simulator worker --connect 127.0.0.1:7070 --token <token> --processes 8    # 随时加 / 随时停
+
+token 在协调进程 stderr 的 "listening on" 一行里；stdout 只有结束时的结果摘要（JSON）
+
+协议：TCP 上一行一个 JSON 的请求 / 应答（worker 发请求，协调进程应答），
+每个请求都带本次 run 的 token（协调进程启动时随机生成并打印，或 --token 指定），不对的一律拒绝
+- {"op": "hello", "worker"}                       -> {"job": {...}}（配置 / 输出选项 / 租约时长）
+- {"op": "lease", "worker"}                       -> {"chunk": {...}} / {"wait": 秒} / {"done": true}
+- {"op": "renew", "lease_id"}                     -> {"ok": bool}（心跳，续租）
+- {"op": "complete", "lease_id", "worker", "result"} -> {"accepted": bool}
+- {"op": "fail", "lease_id", "error"}             -> {"ok": true}（chunk 立即重新派发）
+
+- chunk 切分 / 生成 / 局部统计都复用 service.generate_chunk（与 run_once_stream_parallel 一致），
+  输出与同样 chunks 的单机多进程逐字节一致
+- 租约到期（worker 退出 / 被杀 / 断网）的 chunk 重新派给别的 worker；
+  同一个 chunk 先交回的结果生效，晚到的重复结果丢弃（内容本来就一样）
+- worker 把 part 写在自己的目录里，交回绝对路径；协调进程按 chunk 顺序字节级拼接，
+  所以 worker 的目录要能被协调进程读到（本机 / 共享文件系统），
+  而且必须在 worker_roots（默认 out/elastic，解析符号链接后比较）下面，否则不采用、也不会删
+- 拼接在单独的线程里做（交回的结果进队列），大文件拷贝不阻塞续租 / 派活
+- 协调进程每收一个 chunk 记一条断点清单，resume=True 时重启后不重跑已完成的 chunk
+"""
+import hmac
+import json
+import os
+import queue
+import random
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from checkpoint import (
+    ChunkCheckpoint,
+    STATS_COUNTERS,
+    chunk_stats_path,
+    run_fingerprint,
+    save_chunk_counters,
+)
+from config import Config
+from exporter import ODS_SCHEMA
+from service import (
+    FACT_TABLES,
+    PartAssembler,
+    check_part_file,
+    chunk_ranges,
+    cleanup_dir_if_empty,
+    cleanup_files,
+    csv_path,
+    export_dim_tables,
+    generate_chunk,
+    init_chunk_worker,
+    merge_chunk_stats,
+    prepare_context,
+    prepare_output_layout,
+    top10_error,
+    validate_output_options,
+    write_ods_ddl,
+)
+from timefmt import minute_time_base
+from topk import counter_from_arrays
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7070
+
+ELASTIC_DIR = "out/elastic"
+COORDINATOR_DIR = os.path.join(ELASTIC_DIR, "_coordinator")
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_CHUNKS = 256
+# 同一个 chunk 连续失败这么多次就终止整个 run（确定性的错误重试也没用）
+MAX_CHUNK_ATTEMPTS = 3
+# 没有可派的 chunk（都租出去了）时让 worker 隔多久再来问
+LEASE_WAIT_SECONDS = 1.0
+
+
+# =========================
+# 1) 报文
+# =========================
+def _send(wfile, msg):
+    wfile.write((json.dumps(msg) + "\n").encode("utf-8"))
+    wfile.flush()
+
+
+def _recv(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    return json.loads(line)
+
+
+def _counters_to_json(result):
+    # 计数器按 to_arrays() 的各字段转成 list 传（只有非零项 / 摘要里的项）
+    return {
+        name: {field: value.tolist() for field, value in result[name].to_arrays().items()}
+        for name in STATS_COUNTERS
+    }
+
+
+def _counters_from_json(result):
+    return {name: counter_from_arrays(result[name]) for name in STATS_COUNTERS}
+
+
+# =========================
+# 2) 协调进程
+# =========================
+class ChunkCoordinator:
+    """
+    chunk 台账 + 租约；所有状态改动都在一把锁里（ThreadingTCPServer 每个连接一个线程）
+
+    - pending：还没派出去的 chunk（过期 / 失败的放回队首，优先重派）
+    - leases：lease_id -> {"chunk_id", "worker", "deadline"}
+    - 收到 complete 时校验路径和文件大小、记清单，交给拼接线程按 chunk 顺序拼接
+    """
+
+    def __init__(self, job, ranges, done, checkpoint, assemblers, lease_seconds, token, worker_roots):
+        self.job = job
+        self.ranges = ranges
+        self.checkpoint = checkpoint
+        self.assemblers = assemblers
+        self.lease_seconds = lease_seconds
+        self.token = token
+        self.worker_roots = [os.path.realpath(root) for root in worker_roots]
+
+        self.results = dict(done)
+        self.pending = deque(cid for cid in range(len(ranges)) if cid not in done)
+        self.leases = {}
+        self.attempts = {}
+        self.workers = set()
+        self.reissued = 0
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+        # 拼接线程：按到达顺序取结果，PartAssembler 自己按 chunk 顺序写
+        self.assemble_queue = queue.Queue()
+        self.assemble_thread = threading.Thread(target=self._assemble_loop, daemon=True)
+        self.assemble_thread.start()
+
+        for cid in sorted(done):
+            self.assemble_queue.put(done[cid])
+        self._check_finished()
+
+    def _check_finished(self):
+        if len(self.results) == len(self.ranges) or self.error is not None:
+            self.finished.set()
+
+    def _expire(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease["deadline"] < now:
+                del self.leases[lease_id]
+                if lease["chunk_id"] not in self.results:
+                    self.pending.appendleft(lease["chunk_id"])
+                    self.reissued += 1
+                    print(
+                        f"[coordinator] lease expired: chunk {lease['chunk_id']} ({lease['worker']}), reissued",
+                        file=sys.stderr,
+                    )
+
+    def _assemble_loop(self):
+        while True:
+            result = self.assemble_queue.get()
+            if result is None:
+                return
+            cid = result["chunk_id"]
+            try:
+                self.assemblers["ods_orders"].add(cid, result["orders_path"])
+                self.assemblers["ods_order_items"].add(cid, result["items_path"])
+            except OSError as e:
+                with self.lock:
+                    self.error = f"assembling chunk {cid} failed: {e}"
+                    self._check_finished()
+                return
+
+    def stop_assembling(self):
+        """
+        等队列里的结果都拼完再返回（run 结束 / 出错时调用）
+        """
+        self.assemble_queue.put(None)
+        self.assemble_thread.join()
+
+    def _trusted_part_paths(self, result):
+        """
+        worker 交回的 part 路径：必须正好是 files 里校验的那两个文件，且解析后在 worker_roots 下；
+        返回解析后的 (orders_path, items_path)，不合格时抛 ValueError
+        """
+        paths = (result["orders_path"], result["items_path"])
+        if set(result["files"]) != set(paths):
+            raise ValueError("orders_path / items_path do not match the reported files")
+
+        real_paths = tuple(os.path.realpath(p) for p in paths)
+        for path in real_paths:
+            if not any(os.path.commonpath([path, root]) == root for root in self.worker_roots):
+                raise ValueError(f"{path} is outside the worker roots {self.worker_roots}")
+        return real_paths
+
+    def _fail(self, chunk_id, error):
+        self.attempts[chunk_id] = self.attempts.get(chunk_id, 0) + 1
+        if self.attempts[chunk_id] >= MAX_CHUNK_ATTEMPTS:
+            self.error = f"chunk {chunk_id} failed {self.attempts[chunk_id]} times: {error}"
+            self._check_finished()
+        elif chunk_id not in self.results:
+            self.pending.appendleft(chunk_id)
+
+    # ---- 各请求 ----
+    def _hello(self, msg):
+        self.workers.add(msg["worker"])
+        print(f"[coordinator] worker joined: {msg['worker']}", file=sys.stderr)
+        return {"job": self.job}
+
+    def _lease(self, msg):
+        if self.finished.is_set():
+            return {"done": True}
+
+        self._expire(time.monotonic())
+
+        # 过期重派的 chunk 可能随后又被原 worker 交回，已有结果的跳过
+        while self.pending and self.pending[0] in self.results:
+            self.pending.popleft()
+        if not self.pending:
+            return {"wait": LEASE_WAIT_SECONDS}
+
+        cid = self.pending.popleft()
+        lease_id = uuid.uuid4().hex
+        self.leases[lease_id] = {
+            "chunk_id": cid,
+            "worker": msg["worker"],
+            "deadline": time.monotonic() + self.lease_seconds,
+        }
+        start_oid, end_oid = self.ranges[cid]
+        return {"chunk": {"chunk_id": cid, "start_oid": start_oid, "end_oid": end_oid, "lease_id": lease_id}}
+
+    def _renew(self, msg):
+        lease = self.leases.get(msg["lease_id"])
+        if lease is None:
+            return {"ok": False}
+        lease["deadline"] = time.monotonic() + self.lease_seconds
+        return {"ok": True}
+
+    def _complete(self, msg):
+        self.leases.pop(msg["lease_id"], None)
+        result = msg["result"]
+        cid = result["chunk_id"]
+
+        # 过期后被重派的 chunk：谁先交回用谁的，其余丢弃
+        if cid in self.results:
+            return {"accepted": False}
+
+        # 不合格的路径既不拼接也不删除（run 结束时只删采用了的结果的 part）
+        try:
+            orders_path, items_path = self._trusted_part_paths(result)
+        except ValueError as e:
+            print(f"[coordinator] rejected chunk {cid} from {msg['worker']}: {e}", file=sys.stderr)
+            self._fail(cid, e)
+            return {"accepted": False}
+
+        try:
+            for path, expected in result["files"].items():
+                check_part_file(path, expected, verify=False)
+        except ValueError as e:
+            self._fail(cid, f"{e} (is the worker directory readable by the coordinator?)")
+            return {"accepted": False}
+
+        counters = _counters_from_json(result)
+        stats_path = chunk_stats_path(self.checkpoint_dir, cid)
+        save_chunk_counters(stats_path, counters)
+
+        entry = {
+            **result,
+            **counters,
+            "orders_path": orders_path,
+            "items_path": items_path,
+            "files": {os.path.realpath(p): c for p, c in result["files"].items()},
+            "stats_path": stats_path,
+            "worker": msg["worker"],
+        }
+        self.checkpoint.record(entry)
+        self.results[cid] = entry
+        self.assemble_queue.put(entry)
+
+        self._check_finished()
+        return {"accepted": True}
+
+    def _fail_request(self, msg):
+        lease = self.leases.pop(msg["lease_id"], None)
+        if lease is not None:
+            print(
+                f"[coordinator] chunk {lease['chunk_id']} failed on {lease['worker']}: {msg.get('error')}",
+                file=sys.stderr,
+            )
+            self._fail(lease["chunk_id"], msg.get("error"))
+        return {"ok": True}
+
+    @property
+    def checkpoint_dir(self):
+        return os.path.dirname(self.checkpoint.path)
+
+    def handle(self, msg):
+        handlers = {
+            "hello": self._hello,
+            "lease": self._lease,
+            "renew": self._renew,
+            "complete": self._complete,
+            "fail": self._fail_request,
+        }
+        if not hmac.compare_digest(str(msg.get("token", "")), self.token):
+            return {"error": "invalid token"}
+        op = msg.get("op")
+        if op not in handlers:
+            return {"error": f"unknown op: {op}"}
+        with self.lock:
+            return handlers[op](msg)
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        while True:
+            try:
+                msg = _recv(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            _send(self.wfile, coordinator.handle(msg))
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def run_coordinator(
+    host=DEFAULT_HOST,
+    port=DEFAULT_PORT,
+    mode="prod",
+    overrides=None,
+    batch_size=100000,
+    engine="python",
+    chunks=DEFAULT_CHUNKS,
+    csv_compression=None,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+    ods_dir="out/ods",
+    do_export=True,
+    keep_parts=False,
+    resume=False,
+    cache_dir=None,
+    ready_callback=None,
+    token=None,
+    worker_roots=(ELASTIC_DIR,),
+):
+    """
+    常驻协调进程：导出维表 -> 监听 host:port 派 chunk -> 全部完成后拼接出
+    {ods_dir}/{table}.csv[.gz|.zst]，返回与 run_once_stream_parallel 相同结构的统计
+    - port=0 时由系统分配端口；ready_callback((host, port)) 在开始监听后调用
+    - token 为 None 时随机生成并打印；worker 的每个请求都要带上它
+    - worker_roots：worker 交回的 part 必须在这些目录下（共享文件系统时传挂载点）
+    - worker 可以在任意时刻加入 / 退出；租约 lease_seconds 秒没续就重派
+    - keep_parts=False 时结束后删除各 worker 的 part 文件和断点清单
+    """
+    if lease_seconds <= 0:
+        raise ValueError("lease_seconds must be > 0")
+    if chunks <= 0:
+        raise ValueError("chunks must be > 0")
+    if not worker_roots:
+        raise ValueError("worker_roots must not be empty")
+    out = validate_output_options("csv", "snappy", csv_compression)
+    if token is None:
+        token = secrets.token_hex(16)
+
+    cfg = Config(mode=mode, **(overrides or {}))
+    time_base = minute_time_base(cfg)
+    ranges = chunk_ranges(cfg, chunks)
+
+    os.makedirs(COORDINATOR_DIR, exist_ok=True)
+    os.makedirs(ods_dir, exist_ok=True)
+
+    fingerprint = run_fingerprint(cfg, engine=engine, batch_size=batch_size, out=out, ranges=ranges)
+    checkpoint = ChunkCheckpoint(COORDINATOR_DIR, fingerprint)
+    done = checkpoint.load_completed() if resume else {}
+    checkpoint.save()
+
+    # 维表协调进程自己写（只由 cfg.seed 决定，与 worker 的上下文一致）
+    ctx = prepare_context(cfg, random.Random(cfg.seed), None)
+    prepare_output_layout(ods_dir, out)
+    export_dim_tables(cfg, ctx, ods_dir, time_base, out)
+
+    job = {
+        "mode": mode,
+        "overrides": overrides or {},
+        "engine": engine,
+        "batch_size": batch_size,
+        "out": out,
+        "fingerprint": fingerprint,
+        "lease_seconds": lease_seconds,
+        "cache_dir": cache_dir,
+    }
+
+    assemblers = {
+        table: PartAssembler(csv_path(ods_dir, table, out), ODS_SCHEMA[table], csv_compression)
+        for table in FACT_TABLES
+    }
+
+    coordinator = None
+    try:
+        coordinator = ChunkCoordinator(
+            job, ranges, done, checkpoint, assemblers, lease_seconds, token, worker_roots,
+        )
+
+        server = _CoordinatorServer((host, port), _CoordinatorHandler)
+        server.coordinator = coordinator
+        address = server.server_address[:2]
+        print(
+            f"[coordinator] listening on {address[0]}:{address[1]}, token {token}, "
+            f"{len(ranges)} chunks, {len(done)} reused",
+            file=sys.stderr,
+            flush=True,
+        )
+        if ready_callback:
+            ready_callback(address)
+
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            coordinator.finished.wait()
+            # 给还在轮询的 worker 一个租约周期拿到 {"done": true} 再关
+            time.sleep(min(LEASE_WAIT_SECONDS * 2, lease_seconds))
+        finally:
+            server.shutdown()
+            server.server_close()
+    finally:
+        if coordinator is not None:
+            coordinator.stop_assembling()
+        for assembler in assemblers.values():
+            assembler.close()
+
+    if coordinator.error is not None:
+        raise RuntimeError(coordinator.error)
+
+    results = [coordinator.results[cid] for cid in sorted(coordinator.results)]
+    total_orders, total_items, stats = merge_chunk_stats(results)
+
+    ddl_path = write_ods_ddl(out) if do_export else None
+
+    if not keep_parts:
+        part_files = [r["orders_path"] for r in results] + [r["items_path"] for r in results]
+        cleanup_files(part_files)
+        for d in sorted({os.path.dirname(p) for p in part_files}):
+            cleanup_dir_if_empty(d)
+        checkpoint.remove()
+        cleanup_dir_if_empty(COORDINATOR_DIR)
+        cleanup_dir_if_empty(ELASTIC_DIR)
+
+    return {
+        "cfg": cfg.to_dict(),
+        "rows": {
+            "users": len(ctx["users"]),
+            "shops": len(ctx["shops"]),
+            "skus": len(ctx["skus"]),
+            "orders": total_orders,
+            "items": total_items,
+        },
+        "bytes": {
+            "orders": os.path.getsize(assemblers["ods_orders"].final_file),
+            "items": os.path.getsize(assemblers["ods_order_items"].final_file),
+        },
+        "status_dist": dict(stats["status_dist"]),
+        "paid_ratio": round(stats["paid_cnt"] / max(total_orders, 1), 6),
+        "refund_ratio_in_paid": round(stats["refund_paid"] / max(stats["paid_cnt"], 1), 6),
+        "top10_users": stats["top_users"].most_common(10),
+        "top10_shops": stats["top_shops"].most_common(10),
+        "top10_skus": stats["top_skus"].most_common(10),
+        "top10_error": top10_error(stats),
+        "chunks": {
+            "total": len(ranges),
+            "resumed": len(done),
+            "reissued": coordinator.reissued,
+        },
+        "workers": sorted(coordinator.workers),
+        "ddl_path": ddl_path,
+    }
+
+
+# =========================
+# 3) worker
+# =========================
+class _Connection:
+    """
+    一条到协调进程的连接；request 加锁，心跳线程和主循环可以共用
+    """
+
+    def __init__(self, address, token, timeout=None):
+        self.token = token
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.settimeout(None)
+        self.rfile = self.sock.makefile("rb")
+        self.wfile = self.sock.makefile("wb")
+        self.lock = threading.Lock()
+
+    def request(self, msg):
+        with self.lock:
+            _send(self.wfile, {**msg, "token": self.token})
+            reply = _recv(self.rfile)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def close(self):
+        for f in (self.rfile, self.wfile, self.sock):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+def _heartbeat(conn, lease_id, interval, stop):
+    while not stop.wait(interval):
+        try:
+            conn.request({"op": "renew", "lease_id": lease_id})
+        except (ConnectionError, OSError, RuntimeError):
+            return
+
+
+def run_worker(address, token, work_dir=None, name=None, connect_timeout=10):
+    """
+    连上协调进程循环领 chunk，直到协调进程说 done / 连接断开：
+    - 上下文只在开始时准备一次（service.init_chunk_worker）
+    - 生成期间后台线程每 1/3 个租约时长续一次租
+    - part 写在 work_dir（默认 out/elastic/worker-{name}，要在协调进程的 worker_roots 下），交回绝对路径
+    - 交回的结果没被采用（别人先交了）时删掉自己的 part
+    返回本 worker 完成的 chunk 数等
+    """
+    if name is None:
+        name = f"{socket.gethostname()}-{os.getpid()}"
+    if work_dir is None:
+        work_dir = os.path.join(ELASTIC_DIR, f"worker-{name}")
+    os.makedirs(work_dir, exist_ok=True)
+
+    conn = None
+    accepted = 0
+    discarded = 0
+
+    try:
+        conn = _Connection(tuple(address), token, timeout=connect_timeout)
+        job = conn.request({"op": "hello", "worker": name})["job"]
+        init_chunk_worker(job["mode"], job["overrides"], job["engine"], None, job["cache_dir"])
+        interval = job["lease_seconds"] / 3
+
+        while True:
+            reply = conn.request({"op": "lease", "worker": name})
+            if reply.get("done"):
+                break
+            if "wait" in reply:
+                time.sleep(reply["wait"])
+                continue
+
+            chunk = reply["chunk"]
+            stop = threading.Event()
+            beat = threading.Thread(target=_heartbeat, args=(conn, chunk["lease_id"], interval, stop), daemon=True)
+            beat.start()
+
+            try:
+                result = generate_chunk((
+                    chunk["chunk_id"],
+                    job["batch_size"],
+                    chunk["start_oid"],
+                    chunk["end_oid"],
+                    work_dir,
+                    job["out"],
+                    work_dir,
+                ))
+            except Exception as e:
+                stop.set()
+                conn.request({"op": "fail", "lease_id": chunk["lease_id"], "error": repr(e)})
+                continue
+            finally:
+                stop.set()
+                beat.join()
+
+            # 计数器走报文，本地的统计文件不再需要
+            cleanup_files([result["stats_path"]])
+            part_files = [os.path.abspath(p) for p in (result["orders_path"], result["items_path"])]
+            result = {
+                **result,
+                **_counters_to_json(result),
+                "orders_path": part_files[0],
+                "items_path": part_files[1],
+                "files": {os.path.abspath(p): c for p, c in result["files"].items()},
+            }
+
+            reply = conn.request({
+                "op": "complete",
+                "lease_id": chunk["lease_id"],
+                "worker": name,
+                "result": result,
+            })
+            if reply["accepted"]:
+                accepted += 1
+            else:
+                discarded += 1
+                cleanup_files(part_files)
+
+    except (ConnectionError, OSError) as e:
+        # 协调进程已经结束 / 不可达（包括 run 结束后才加入）
+        print(f"[worker {name}] disconnected: {e}", file=sys.stderr)
+    except RuntimeError as e:
+        # 协调进程拒绝（token 不对等）
+        print(f"[worker {name}] rejected by coordinator: {e}", file=sys.stderr)
+    finally:
+        if conn is not None:
+            conn.close()
+        cleanup_dir_if_empty(work_dir)
+
+    return {"worker": name, "chunks": accepted, "discarded": discarded}
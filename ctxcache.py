@@ -0,0 +1,271 @@
+"""
+上下文磁盘缓存：
+同一份配置重复跑（网页重跑 / 参数扫描 / 每晚重新生成）时，
+维表和抽样器（gen_*_dim、_build_category_sku_rank_sampler、_build_user_time_profile）
+不再重算，直接从缓存目录 mmap 加载。
+
+- key：Config 里影响上下文的字段（CONTEXT_FIELDS）+ 传入 rnd 的状态 + CACHE_VERSION，
+  取 sha256；同一 cfg 不同 rnd 状态（legacy 多进程 seed + worker_id）各自一条
+- 每条缓存一个目录：meta.json + 每个数组一个 .npy（维表列 + numpy 引擎的数组上下文）
+- 命中后把 rnd 恢复到“生成完上下文之后”的状态，后续订单随机数与不走缓存逐位一致
+- 按总字节数做 LRU 淘汰（meta.json 的 mtime 即最近使用时间）
+- 只服务 numpy 引擎（python 引擎的 dict 抽样器 / sku_map 重建本身就要逐行）
+"""
+import json
+import hashlib
+import os
+import shutil
+import time
+
+import numpy as np
+
+from batch import UserDimBatch, ShopDimBatch, SkuDimBatch, BatchStream
+from dims import user_dim_stream
+from pipeline import prepare_stream_context, prepare_stream_arrays
+
+
+# 缓存格式变了就加 1，旧条目自动失效
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = "out/ctx_cache"
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# 影响维表 / 抽样器 / 用户画像的配置字段（订单概率、时间延迟等不影响）
+CONTEXT_FIELDS = (
+    "seed",
+    "user_cnt",
+    "shop_cnt",
+    "sku_cnt",
+    "category_buy_weights",
+    "sku_price_min",
+    "sku_price_max",
+    "shop_type_weights",
+    "city_pool",
+    "register_days_back_min",
+    "register_days_back_max",
+    "shop_weight_min",
+    "shop_weight_max",
+    "sampler_kind",
+    "table_free_threshold",
+    "dim_engine",
+    "dim_chunk_size",
+)
+
+DIM_BATCHES = {
+    "users": UserDimBatch,
+    "shops": ShopDimBatch,
+    "skus": SkuDimBatch,
+}
+
+
+# =========================
+# 1) key
+# =========================
+def context_fingerprint(cfg, rnd):
+    """
+    cfg 的上下文字段 + rnd 当前状态 -> 缓存 key
+    """
+    cfg_dict = cfg.to_dict()
+    fields = {k: cfg_dict[k] for k in CONTEXT_FIELDS}
+
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}".encode())
+    h.update(json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    h.update(repr(rnd.getstate()).encode())
+    return h.hexdigest()[:32]
+
+
+# =========================
+# 2) 缓存目录
+# =========================
+class ContextCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        """
+        命中返回 (meta, arrays)，数组是只读 mmap；未命中 / 条目不完整返回 None
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            arrays = {
+                name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r")
+                for name in meta["arrays"]
+            }
+        except (OSError, ValueError, KeyError):
+            # 没有 / 被并发淘汰 / 写坏了，一律当未命中
+            return None
+
+        # LRU：刷新最近使用时间
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+        return meta, arrays
+
+    def store(self, key, meta, arrays):
+        """
+        先写临时目录再整体 rename，保证读到的条目要么完整要么不存在
+        """
+        tmp_dir = os.path.join(self.cache_dir, f".tmp-{key}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(arr))
+
+        meta = dict(meta, arrays=sorted(arrays), created=time.time())
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        try:
+            os.rename(tmp_dir, self._entry_dir(key))
+        except OSError:
+            # 其他进程已经写好了同一条
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        [(key, 字节数, 最近使用时间)]，按最近使用时间从旧到新
+        """
+        out = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            if key.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(entry_dir))
+                last_used = os.stat(os.path.join(entry_dir, "meta.json")).st_mtime
+            except OSError:
+                continue
+            out.append((key, size, last_used))
+
+        out.sort(key=lambda e: e[2])
+        return out
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        总大小超过 max_bytes 时，从最久没用的条目开始删
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.invalidate(key)
+            total -= size
+
+    def invalidate(self, key=None):
+        """
+        删除一条缓存；key 为 None 时清空整个缓存目录
+        """
+        if key is not None:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            return
+
+        for k in os.listdir(self.cache_dir):
+            shutil.rmtree(self._entry_dir(k), ignore_errors=True)
+
+
+# =========================
+# 3) 上下文 <-> 数组
+# =========================
+def _context_to_arrays(cfg, ctx, actx):
+    """
+    流式维表（BatchStream）不进缓存：按块现算本来就快，整表存盘反而违背流式的初衷
+    """
+    arrays = {}
+    for dim, batch_cls in DIM_BATCHES.items():
+        rows = ctx[dim]
+        if isinstance(rows, BatchStream):
+            continue
+        if not isinstance(rows, batch_cls):
+            rows = batch_cls.from_rows(cfg, rows)
+        for name, col in rows.columns.items():
+            arrays[f"dim.{dim}.{name}"] = col
+
+    for name, arr in actx.items():
+        arrays[f"actx.{name}"] = arr
+
+    return arrays
+
+
+def _context_from_arrays(cfg, arrays):
+    ctx = {"order_ctx": None, "item_ctx": None}
+
+    for dim, batch_cls in DIM_BATCHES.items():
+        if f"dim.{dim}.{batch_cls.fields[0]}" not in arrays:
+            ctx[dim] = user_dim_stream(cfg)
+            continue
+        columns = {name: arrays[f"dim.{dim}.{name}"] for name in batch_cls.fields}
+        ctx[dim] = batch_cls(columns, base_time=cfg.base_time, code_fields=batch_cls.code_tables(cfg))
+
+    ctx["actx"] = {
+        name[len("actx."):]: arr
+        for name, arr in arrays.items()
+        if name.startswith("actx.")
+    }
+    return ctx
+
+
+def _rnd_state_to_meta(rnd):
+    version, internal, gauss_next = rnd.getstate()
+    return {"version": version, "internal": list(internal), "gauss_next": gauss_next}
+
+
+def _rnd_state_from_meta(state):
+    return state["version"], tuple(state["internal"]), state["gauss_next"]
+
+
+# =========================
+# 4) 对外入口
+# =========================
+def prepare_cached_context(cfg, rnd, cache):
+    """
+    prepare_stream_context 的缓存版（numpy 引擎用）：
+    {
+        "users" / "shops" / "skus": UserDimBatch / ShopDimBatch / SkuDimBatch,
+        "actx": numpy 引擎的数组上下文（命中时是只读 mmap）,
+        "order_ctx" / "item_ctx": None,
+        "cache_hit": bool,
+    }
+    返回时 rnd 的状态与直接调用 prepare_stream_context 之后相同
+    """
+    key = context_fingerprint(cfg, rnd)
+
+    hit = cache.load(key)
+    if hit is not None:
+        meta, arrays = hit
+        rnd.setstate(_rnd_state_from_meta(meta["rnd_state"]))
+        ctx = _context_from_arrays(cfg, arrays)
+        ctx["cache_hit"] = True
+        return ctx
+
+    ctx = prepare_stream_context(cfg, rnd)
+    actx = prepare_stream_arrays(cfg, ctx)
+    arrays = _context_to_arrays(cfg, ctx, actx)
+
+    cache.store(key, {"rnd_state": _rnd_state_to_meta(rnd)}, arrays)
+
+    ctx = _context_from_arrays(cfg, arrays)
+    ctx["cache_hit"] = False
+    return ctx
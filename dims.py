@@ -1,4 +1,7 @@
-from datetime import timedelta
+import numpy as np
+
+from batch import UserDimBatch, ShopDimBatch, SkuDimBatch, BatchStream, code_dtype
+from timefmt import time_origin, time_unit
 
 
 def gen_user_dim(cfg, rnd):
@@ -11,11 +14,15 @@ def gen_user_dim(cfg, rnd):
     """
     users = []
 
+    # datetime 模式：base_time - n * timedelta；minute 模式：0 - n * 1
+    origin = time_origin(cfg)
+    unit = time_unit(cfg)
+
     for user_id in range(1, cfg.user_cnt + 1):
         days_ago = rnd.randint(cfg.register_days_back_min, cfg.register_days_back_max)
         minute_offset = rnd.randint(0, 24 * 60 - 1)
 
-        register_time = cfg.base_time - timedelta(days=days_ago, minutes=minute_offset)
+        register_time = origin - (days_ago * 24 * 60 + minute_offset) * unit
         city = rnd.choice(cfg.city_pool)
 
         users.append({
@@ -81,4 +88,132 @@ def gen_sku_dim(cfg, rnd):
             "sku_price": sku_price,
         })
 
-    return skus
\ No newline at end of file
+    return skus
+
+# =========================
+# 向量化分块维表（cfg.dim_engine="numpy"）
+# =========================
+# 每张维表按 dim_chunk_size 行分块，第 k 块的随机数由 (seed, 表号, k) 派生：
+# 任意一块可以单独生成，整表不需要驻留内存
+DIM_STREAM_KEY = 0x44494D  # "DIM"，与订单块的 spawn_key 区分
+DIM_TABLES = ("users", "shops", "skus")
+
+
+def dim_chunk_rng(cfg, table, chunk_index):
+    ss = np.random.SeedSequence(
+        cfg.seed,
+        spawn_key=(DIM_STREAM_KEY, DIM_TABLES.index(table), chunk_index),
+    )
+    return np.random.Generator(np.random.PCG64(ss))
+
+
+def _dim_chunks(cfg, total):
+    """
+    [(chunk_index, 起始 id, 行数)]
+    """
+    size = cfg.dim_chunk_size
+    return [
+        (k, start, min(size, total - start + 1))
+        for k, start in enumerate(range(1, total + 1, size))
+    ]
+
+
+def _pick_codes(rng, weights, n):
+    """
+    按权重抽 n 个下标（累计权重 + 二分，同 facts 的 cum 采样器）
+    """
+    cum = np.cumsum(np.asarray(weights, dtype=np.float64))
+    idx = np.searchsorted(cum, rng.random(n) * cum[-1], side="right")
+    np.minimum(idx, len(cum) - 1, out=idx)
+    return idx.astype(code_dtype(weights))
+
+
+def gen_user_dim_chunk(cfg, chunk_index, start_id, n):
+    """
+    用户维表的一块：register_time 直接是相对 base_time 的分钟（负数）
+    """
+    rng = dim_chunk_rng(cfg, "users", chunk_index)
+
+    days_ago = rng.integers(cfg.register_days_back_min, cfg.register_days_back_max, size=n, endpoint=True)
+    minute_offset = rng.integers(0, 24 * 60, size=n)
+    city = rng.integers(0, len(cfg.city_pool), size=n).astype(code_dtype(cfg.city_pool))
+
+    return UserDimBatch(
+        {
+            "user_id": np.arange(start_id, start_id + n, dtype=np.int64),
+            "register_time": -(days_ago * (24 * 60) + minute_offset),
+            "city": city,
+        },
+        base_time=cfg.base_time,
+        code_fields=UserDimBatch.code_tables(cfg),
+    )
+
+
+def gen_shop_dim_chunk(cfg, chunk_index, start_id, n):
+    rng = dim_chunk_rng(cfg, "shops", chunk_index)
+
+    shop_type = _pick_codes(rng, list(cfg.shop_type_weights.values()), n)
+    shop_weight = rng.integers(cfg.shop_weight_min, cfg.shop_weight_max, size=n, endpoint=True)
+
+    return ShopDimBatch(
+        {
+            "shop_id": np.arange(start_id, start_id + n, dtype=np.int64),
+            "shop_type": shop_type,
+            "shop_weight": shop_weight,
+        },
+        base_time=cfg.base_time,
+        code_fields=ShopDimBatch.code_tables(cfg),
+    )
+
+
+def gen_sku_dim_chunk(cfg, chunk_index, start_id, n):
+    rng = dim_chunk_rng(cfg, "skus", chunk_index)
+
+    category = _pick_codes(rng, list(cfg.category_buy_weights.values()), n)
+    sku_price = rng.integers(cfg.sku_price_min, cfg.sku_price_max, size=n, endpoint=True)
+
+    return SkuDimBatch(
+        {
+            "sku_id": np.arange(start_id, start_id + n, dtype=np.int64),
+            "category": category,
+            "sku_price": sku_price,
+        },
+        base_time=cfg.base_time,
+        code_fields=SkuDimBatch.code_tables(cfg),
+    )
+
+
+def iter_user_dim_batches(cfg):
+    for k, start, n in _dim_chunks(cfg, cfg.user_cnt):
+        yield gen_user_dim_chunk(cfg, k, start, n)
+
+
+def iter_shop_dim_batches(cfg):
+    for k, start, n in _dim_chunks(cfg, cfg.shop_cnt):
+        yield gen_shop_dim_chunk(cfg, k, start, n)
+
+
+def iter_sku_dim_batches(cfg):
+    for k, start, n in _dim_chunks(cfg, cfg.sku_cnt):
+        yield gen_sku_dim_chunk(cfg, k, start, n)
+
+
+def user_dim_stream(cfg):
+    """
+    用户维表只用于导出（用户抽样器只依赖 user_cnt），
+    返回 BatchStream：写出时逐块生成，内存只占一块
+    """
+    return BatchStream(lambda: iter_user_dim_batches(cfg), cfg.user_cnt)
+
+
+def gen_dims_np(cfg):
+    """
+    dim_engine="numpy" 的三张维表：
+    - users: BatchStream（流式，不落内存）
+    - shops / skus: 整表 ShopDimBatch / SkuDimBatch（抽样器要用）
+    """
+    return (
+        user_dim_stream(cfg),
+        ShopDimBatch.concat(iter_shop_dim_batches(cfg)),
+        SkuDimBatch.concat(iter_sku_dim_batches(cfg)),
+    )
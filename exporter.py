@@ -1,6 +1,16 @@
+import glob
+import json
 import os
-import shutil
-from datetime import datetime
+import zipfile
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from batch import ColumnBatch, BatchStream
+from timefmt import get_minute_formatter
 
 
 # ========= 参数 =========
@@ -8,6 +18,61 @@ DEFAULT_BUFFER_SIZE = 50000
 DEFAULT_FILE_BUFFERING = 16 * 1024 * 1024
 
 
+# ========= 压缩 =========
+# csv_compression -> 文件后缀
+CSV_COMPRESSIONS = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+# 边生成边压缩，优先速度：gzip 1 级比默认 6 级快得多，体积只大 1/4 左右
+CSV_COMPRESSION_LEVELS = {
+    "gzip": 1,
+    "zstd": 3,
+}
+
+# 打 zip 时这些文件本身已经压缩过，原样存入（ZIP_STORED），不再压一遍
+PRECOMPRESSED_EXTS = (".gz", ".zst", ".parquet", ".arrow")
+
+
+def csv_filename(table, compression=None):
+    return f"{table}.csv{CSV_COMPRESSIONS[compression]}"
+
+
+def new_compressor(compression, level=None):
+    """
+    流式压缩器：compress(bytes) -> bytes，flush() -> 收尾 bytes
+    - gzip: zlib 的 gzip 格式（wbits=31），每个文件是一个完整的 gzip member
+    - zstd: zstandard 流，每个文件是一个完整的 frame
+    gzip member / zstd frame 首尾直接拼接仍是合法文件，多进程的 part 可以按字节合并
+    """
+    if compression not in CSV_COMPRESSIONS:
+        raise ValueError(f"csv compression must be one of {list(CSV_COMPRESSIONS)}")
+    if compression is None:
+        return None
+
+    level = CSV_COMPRESSION_LEVELS[compression] if level is None else level
+
+    if compression == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    # zstandard 只有写 .zst 时才需要
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+def compress_bytes(data, compression, level=None):
+    """
+    一段字节单独压成一个 gzip member / zstd frame（合并 part 时的表头用）
+    """
+    compressor = new_compressor(compression, level)
+    if compressor is None:
+        return data
+    return compressor.compress(data) + compressor.flush()
+
+
 # ========= 工具函数 =========
 def _ensure_dir(path: str):
     if path:
@@ -29,11 +94,151 @@ def _row_to_csv_line(row, fieldnames):
     return ",".join(_fmt(row.get(k)) for k in fieldnames)
 
 
+# ========= 按 schema 编译的行编码器 =========
+# 时间文本缓存上限：约半年的分钟数，超过就整体清空重来
+TIME_TEXT_CACHE_SIZE = 1 << 18
+# 取值少的列（status / city / qty ...）缓存上限
+SMALL_TEXT_CACHE_SIZE = 1 << 12
+
+
+class _TextCache(dict):
+    """
+    值 -> CSV 文本 的有界缓存：命中是一次 C 层 dict 取值，
+    未命中才调 fmt（__missing__），满了整体清空
+    """
+
+    def __init__(self, fmt, maxsize):
+        super().__init__()
+        self.fmt = fmt
+        self.maxsize = maxsize
+
+    def __missing__(self, v):
+        text = self.fmt(v)
+        if len(self) >= self.maxsize:
+            self.clear()
+        self[v] = text
+        return text
+
+
+class _TimeTextCache(_TextCache):
+    """
+    时间列的文本缓存：未命中时不走整串 strftime，
+    日期部分按天缓存，时分 / 秒查表拼接（结果与 _fmt 相同）；
+    time_base 不为 None 时整数分钟用 MinuteFormatter
+    """
+
+    def __init__(self, time_base, maxsize):
+        super().__init__(_fmt, maxsize)
+        self.fmt_minute = get_minute_formatter(time_base) if time_base is not None else None
+        self.day_text = {}
+        self.hm_text = [f" {h:02d}:{m:02d}:" for h in range(24) for m in range(60)]
+        self.sec_text = [f"{sec:02d}" for sec in range(60)]
+
+    def __missing__(self, v):
+        if isinstance(v, datetime):
+            day = self.day_text.get(v.toordinal())
+            if day is None:
+                day = self.day_text[v.toordinal()] = v.strftime("%Y-%m-%d")
+            text = day + self.hm_text[v.hour * 60 + v.minute] + self.sec_text[v.second]
+        elif self.fmt_minute is not None and isinstance(v, int):
+            text = self.fmt_minute(v)
+        else:
+            text = _fmt(v)
+
+        if len(self) >= self.maxsize:
+            self.clear()
+        self[v] = text
+        return text
+
+
+@lru_cache(maxsize=32)
+def compile_row_encoder(fieldnames, time_base=None):
+    """
+    按 schema 生成专用的 encode(row) -> str：
+    - 一条 f-string 直接取 row[k] 拼整行，不再逐列 row.get + _fmt
+    - 时间列 / 取值少的列走有界文本缓存（_TimeTextCache / _TextCache）
+    - 其他列（id / 金额）是 int，f-string 的结果与 str() 相同
+    缺列时退回 _row_to_csv_line，结果与它逐字节一致。
+
+    fieldnames 需是 tuple（编码器连同缓存按 schema 复用）
+    """
+    time_text = _TimeTextCache(time_base, TIME_TEXT_CACHE_SIZE)
+    caches = {}
+    parts = []
+
+    for i, k in enumerate(fieldnames):
+        if k in TIME_FIELDS:
+            name = "T"
+        elif k in CODE_FIELDS or k in SMALL_INT_FIELDS:
+            name = f"C{i}"
+            caches[name] = _TextCache(_fmt, SMALL_TEXT_CACHE_SIZE)
+        else:
+            parts.append(f"{{row[{k!r}]}}")
+            continue
+        parts.append(f"{{{name}[row[{k!r}]]}}")
+
+    src = (
+        "def encode(row):\n"
+        "    try:\n"
+        f"        return f\"{','.join(parts)}\"\n"
+        "    except KeyError:\n"
+        "        return fallback(row, fieldnames)\n"
+    )
+
+    namespace = dict(caches, T=time_text, fallback=_row_to_csv_line, fieldnames=fieldnames)
+    exec(src, namespace)
+    return namespace["encode"]
+
+
+def _iter_text_chunks(rows, fieldnames, buffer_size, time_base=None):
+    """
+    把 rows 格式化成若干段文本（每段至多 buffer_size 行，以换行结尾）：
+    list[dict] 逐行格式化；ColumnBatch 整列文本化；
+    BatchStream 逐块生成逐块产出（整表不落内存）
+    """
+    if isinstance(rows, BatchStream):
+        for batch in rows:
+            yield from _iter_text_chunks(batch, fieldnames, buffer_size, time_base)
+        return
+
+    if isinstance(rows, ColumnBatch):
+        lines = rows.csv_lines(fieldnames)
+        for i in range(0, len(lines), buffer_size):
+            yield "\n".join(lines[i:i + buffer_size]) + "\n"
+        return
+
+    encode = compile_row_encoder(tuple(fieldnames), time_base)
+
+    buf = []
+
+    for r in rows:
+        buf.append(encode(r))
+
+        if len(buf) >= buffer_size:
+            yield "\n".join(buf) + "\n"
+            buf.clear()
+
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+def _write_lines(f, rows, fieldnames, buffer_size, time_base=None):
+    for chunk in _iter_text_chunks(rows, fieldnames, buffer_size, time_base):
+        f.write(chunk)
+
+
 # ========= CSV 写入 =========
-def export_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE):
+def export_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE, time_base=None, compression=None):
     """
     一次性导出 CSV（维表）
+    time_base 不为 None 时，时间列按相对它的整数分钟格式化
+    compression 为 "gzip" / "zstd" 时边写边压缩（.csv.gz / .csv.zst）
     """
+    if compression is not None:
+        with CsvSink(filepath, fieldnames, time_base=time_base, buffer_size=buffer_size, compression=compression) as sink:
+            sink.write(rows)
+        return
+
     _ensure_dir(os.path.dirname(filepath))
 
     with open(
@@ -47,17 +252,7 @@ def export_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE):
         # header
         f.write(",".join(fieldnames) + "\n")
 
-        buf = []
-
-        for r in rows:
-            buf.append(_row_to_csv_line(r, fieldnames))
-
-            if len(buf) >= buffer_size:
-                f.write("\n".join(buf) + "\n")
-                buf.clear()
-
-        if buf:
-            f.write("\n".join(buf) + "\n")
+        _write_lines(f, rows, fieldnames, buffer_size, time_base)
 
 
 def init_csv(filepath, fieldnames):
@@ -76,9 +271,11 @@ def init_csv(filepath, fieldnames):
         f.write(",".join(fieldnames) + "\n")
 
 
-def append_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE):
+def append_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE, time_base=None):
     """
     高速追加 CSV
+    rows 可以是 list[dict]，也可以是 batch.OrderBatch / ItemBatch
+    time_base 不为 None 时，时间列按相对它的整数分钟格式化
     """
     if not rows:
         return
@@ -93,17 +290,635 @@ def append_csv(rows, filepath, fieldnames, buffer_size=DEFAULT_BUFFER_SIZE):
         newline=""
     ) as f:
 
-        buf = []
+        _write_lines(f, rows, fieldnames, buffer_size, time_base)
+
+
+# ========= 常驻 CSV 写出端 =========
+DEFAULT_FLUSH_BYTES = 8 * 1024 * 1024
+# os.open 在 Windows 上默认是文本模式（\n 会变成 \r\n），必须带上 O_BINARY
+O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def _write_fd(fd, data):
+    with memoryview(data) as view:
+        pos = 0
+        while pos < len(view):
+            pos += os.write(fd, view[pos:])
+
+
+class CsvSink:
+    """
+    整个 run 只打开一次的 CSV 写出端（替代逐批 append_csv）：
+    - 文件以无缓冲二进制打开，不经过 TextIOWrapper
+    - 每批文本整段编码成 UTF-8 追加到一个复用的 bytearray，
+      攒够 flush_bytes 再 os.write 一次
+    - bytes_written / rows_written 记录已写出的字节数（含表头）和数据行数
+    - compression 为 "gzip" / "zstd" 时每次 flush 先过流式压缩器再写，
+      bytes_written 是压缩后的字节数
+    - fd 不为 None 时写到已打开的描述符（stdout / 管道），close 时不关闭它；
+      filepath 只用来显示
+
+    with CsvSink(path, ODS_SCHEMA["ods_orders"]) as sink:
+        sink.write(batch_orders)
+    """
+
+    def __init__(
+        self,
+        filepath,
+        fieldnames,
+        time_base=None,
+        flush_bytes=DEFAULT_FLUSH_BYTES,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        header=True,
+        compression=None,
+        fd=None,
+    ):
+        self.filepath = filepath
+        self.fieldnames = fieldnames
+        self.time_base = time_base
+        self.flush_bytes = flush_bytes
+        self.buffer_size = buffer_size
+
+        self.bytes_written = 0
+        self.rows_written = 0
+
+        self._buf = bytearray()
+        self._compressor = new_compressor(compression)
+
+        # 路径可以是普通文件，也可以是已存在的命名管道（FIFO 上 O_TRUNC 无效果）
+        self._owns_fd = fd is None
+        if fd is None:
+            _ensure_dir(os.path.dirname(filepath))
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+        self._fd = fd
+
+        if header:
+            self._buf += (",".join(fieldnames) + "\n").encode("utf-8")
+
+    def write(self, rows):
+        if not rows:
+            return
+
+        for chunk in _iter_text_chunks(rows, self.fieldnames, self.buffer_size, self.time_base):
+            self._buf += chunk.encode("utf-8")
+            if len(self._buf) >= self.flush_bytes:
+                self.flush()
+
+        self.rows_written += len(rows)
+
+    def _write_out(self, data):
+        _write_fd(self._fd, data)
+        self.bytes_written += len(data)
+
+    def flush(self):
+        if not self._buf:
+            return
+
+        if self._compressor is None:
+            self._write_out(self._buf)
+        else:
+            self._write_out(self._compressor.compress(self._buf))
+        self._buf.clear()
+
+    def close(self):
+        if self._fd is None:
+            return
+        try:
+            self.flush()
+            if self._compressor is not None:
+                self._write_out(self._compressor.flush())
+        finally:
+            if self._owns_fd:
+                os.close(self._fd)
+            self._fd = None
+
+    def stats(self):
+        return {"rows": self.rows_written, "bytes": self.bytes_written}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ========= 按日期分区的 CSV 写出端 =========
+# partition_by 可选值：None 不分区；"dt" 按订单创建日写 {table}/dt=YYYY-MM-DD/part-XXX.csv
+PARTITION_BY = (None, "dt")
+
+# 分区的事实表（明细跟着所属订单的创建日走）
+PARTITIONED_TABLES = ("ods_orders", "ods_order_items")
+
+# 每个写出端最多同时打开的分区文件数（LRU 淘汰，淘汰后再写时以追加方式重新打开）
+DEFAULT_MAX_OPEN_FILES = 32
+# 单个分区攒够这么多字节就写出
+PARTITION_FLUSH_BYTES = 1024 * 1024
+# 所有分区缓冲合计的上限，超过时从最大的分区开始写出，直到降到一半
+PARTITION_BUFFER_BYTES = 64 * 1024 * 1024
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def created_days(orders, base_time):
+    """
+    订单创建日：相对 base_time 当天的天数偏移（int64 数组）
+    list[dict]（datetime / minute 两种模式）和 OrderBatch 通用
+    """
+    if isinstance(orders, ColumnBatch):
+        minutes = orders["created_time"]
+    else:
+        values = [o["created_time"] for o in orders]
+        if values and isinstance(values[0], datetime):
+            base_day = base_time.toordinal()
+            return np.fromiter((v.toordinal() - base_day for v in values), dtype=np.int64, count=len(values))
+        minutes = np.asarray(values, dtype=np.int64)
+
+    base_minute_of_day = base_time.hour * 60 + base_time.minute
+    return (minutes + base_minute_of_day) // MINUTES_PER_DAY
+
+
+def item_days(items, orders, order_days):
+    """
+    明细的分区日 = 所属订单的创建日（同一批的订单里按 order_id 查）
+    """
+    if isinstance(orders, ColumnBatch):
+        order_ids = orders["order_id"]
+    else:
+        order_ids = np.fromiter((o["order_id"] for o in orders), dtype=np.int64, count=len(orders))
+
+    if isinstance(items, ColumnBatch):
+        item_order_ids = items["order_id"]
+    else:
+        item_order_ids = np.fromiter((it["order_id"] for it in items), dtype=np.int64, count=len(items))
+
+    sorter = np.argsort(order_ids, kind="stable")
+    return order_days[sorter[np.searchsorted(order_ids, item_order_ids, sorter=sorter)]]
+
+
+def _csv_lines(rows, fieldnames, time_base=None):
+    """
+    整批转成 CSV 行（不含换行符）
+    """
+    if isinstance(rows, ColumnBatch):
+        return rows.csv_lines(fieldnames)
+    encode = compile_row_encoder(tuple(fieldnames), time_base)
+    return [encode(r) for r in rows]
+
+
+class _GroupedCsvSink:
+    """
+    一张表按组（分区日 / 分桶号）拆成多个文件写出，子类只决定每组的文件路径：
+
+    - write(rows, groups)：groups 是每行的组号（整数数组），
+      整批先转成文本行，再按组分组追加到各组的缓冲
+    - 组缓冲攒够 flush_bytes（或合计超过 buffer_bytes）才写出
+    - 打开的文件句柄是 LRU：最多 max_open_files 个，淘汰最久没写的那个，
+      之后再写这个组时以 O_APPEND 重新打开
+    - compression 为 "gzip" / "zstd" 时每次写出单独压成一个 gzip member / zstd frame
+      （首尾拼接仍是合法文件，不必给每个组常驻一个压缩器）
+    - 每个文件都带表头（header=True 时）
+    """
+
+    def __init__(
+        self,
+        root_dir,
+        fieldnames,
+        part=0,
+        time_base=None,
+        header=True,
+        compression=None,
+        max_open_files=DEFAULT_MAX_OPEN_FILES,
+        flush_bytes=PARTITION_FLUSH_BYTES,
+        buffer_bytes=PARTITION_BUFFER_BYTES,
+    ):
+        if compression not in CSV_COMPRESSIONS:
+            raise ValueError(f"csv compression must be one of {list(CSV_COMPRESSIONS)}")
+        if max_open_files <= 0:
+            raise ValueError("max_open_files must be > 0")
+
+        self.filepath = root_dir
+        self.fieldnames = fieldnames
+        self.time_base = time_base
+        self.compression = compression
+        self.max_open_files = max_open_files
+        self.flush_bytes = flush_bytes
+        self.buffer_bytes = buffer_bytes
+
+        self.filename = f"part-{part:03d}.csv{CSV_COMPRESSIONS[compression]}"
+        self.header = (",".join(fieldnames) + "\n").encode("utf-8") if header else b""
+
+        self.bytes_written = 0
+        self.rows_written = 0
+
+        # group -> {"file", "path", "buf", "rows", "bytes", "opened", "info"}
+        self._groups = {}
+        # group -> fd（LRU 顺序，最近写的在末尾）
+        self._fds = OrderedDict()
+        self._buffered = 0
+        self._closed = False
+
+    def _group_file(self, group):
+        """
+        返回 (相对 root_dir 的文件路径, 写进 manifest 的附加字段)
+        """
+        raise NotImplementedError
+
+    def _group(self, group):
+        g = self._groups.get(group)
+        if g is None:
+            file, info = self._group_file(group)
+            g = self._groups[group] = {
+                "file": file,
+                "path": os.path.join(self.filepath, file),
+                "buf": bytearray(self.header),
+                "rows": 0,
+                "bytes": 0,
+                "opened": False,
+                "info": info,
+            }
+            self._buffered += len(self.header)
+        return g
+
+    def _acquire_fd(self, group, g):
+        fd = self._fds.get(group)
+        if fd is not None:
+            self._fds.move_to_end(group)
+            return fd
+
+        if len(self._fds) >= self.max_open_files:
+            _, old_fd = self._fds.popitem(last=False)
+            os.close(old_fd)
+
+        if g["opened"]:
+            flags = os.O_WRONLY | os.O_APPEND | O_BINARY
+        else:
+            _ensure_dir(os.path.dirname(g["path"]))
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY
+            g["opened"] = True
+
+        fd = self._fds[group] = os.open(g["path"], flags, 0o644)
+        return fd
+
+    def _flush_group(self, group, g):
+        buf = g["buf"]
+        if not buf:
+            return
+
+        data = buf if self.compression is None else compress_bytes(bytes(buf), self.compression)
+        _write_fd(self._acquire_fd(group, g), data)
+
+        g["bytes"] += len(data)
+        self.bytes_written += len(data)
+        self._buffered -= len(buf)
+        buf.clear()
+
+    def _shrink_buffers(self):
+        for group, g in sorted(self._groups.items(), key=lambda kv: -len(kv[1]["buf"])):
+            if self._buffered <= self.buffer_bytes // 2:
+                break
+            self._flush_group(group, g)
+
+    def write(self, rows, groups):
+        if not rows:
+            return
+
+        lines = np.asarray(_csv_lines(rows, self.fieldnames, self.time_base), dtype=object)
+        groups = np.asarray(groups)
+
+        order = np.argsort(groups, kind="stable")
+        sorted_groups = groups[order]
+        bounds = np.flatnonzero(np.diff(sorted_groups)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(sorted_groups)]))
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            group = int(sorted_groups[start])
+            g = self._group(group)
+
+            data = ("\n".join(lines[order[start:end]].tolist()) + "\n").encode("utf-8")
+            g["buf"] += data
+            g["rows"] += end - start
+            self._buffered += len(data)
+
+            if len(g["buf"]) >= self.flush_bytes:
+                self._flush_group(group, g)
+
+        self.rows_written += len(lines)
+
+        if self._buffered > self.buffer_bytes:
+            self._shrink_buffers()
+
+    def flush(self):
+        # 先写已经打开的组，少开关文件
+        for group in list(self._fds):
+            self._flush_group(group, self._groups[group])
+        for group, g in self._groups.items():
+            self._flush_group(group, g)
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+            self._closed = True
 
-        for r in rows:
-            buf.append(_row_to_csv_line(r, fieldnames))
+    def partitions(self):
+        """
+        manifest 用：[{"file", ...附加字段, "rows", "bytes"}]，按组号排序
+        """
+        return [
+            {"file": g["file"], **g["info"], "rows": g["rows"], "bytes": g["bytes"]}
+            for _, g in sorted(self._groups.items())
+        ]
 
-            if len(buf) >= buffer_size:
-                f.write("\n".join(buf) + "\n")
-                buf.clear()
+    def stats(self):
+        return {"rows": self.rows_written, "bytes": self.bytes_written, "partitions": len(self._groups)}
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartitionedCsvSink(_GroupedCsvSink):
+    """
+    一张表按天分区写出：{table_dir}/dt=YYYY-MM-DD/part-{part:03d}.csv[.gz|.zst]
+    write(rows, days) 的 days 是每行的分区日（created_days / item_days 的结果）
+
+    with PartitionedCsvSink(table_dir, ODS_SCHEMA["ods_orders"], cfg.base_time) as sink:
+        sink.write(batch_orders, created_days(batch_orders, cfg.base_time))
+    """
+
+    def __init__(self, table_dir, fieldnames, base_time, **kwargs):
+        super().__init__(table_dir, fieldnames, **kwargs)
+        self.midnight = base_time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _group_file(self, day):
+        dt = (self.midnight + timedelta(days=day)).strftime("%Y-%m-%d")
+        return f"dt={dt}/{self.filename}", {"dt": dt}
+
+
+# ========= 分桶写出（Hive CLUSTERED BY ... SORTED BY ... INTO N BUCKETS）=========
+# bucket_by 可选值：None 不分桶；否则事实表按该列分桶（两张事实表都有这两列）
+BUCKET_BY = (None, "user_id", "shop_id")
+
+
+def hive_bucket_ids(values, buckets):
+    """
+    Hive 分桶号（bucketing_version=1）：INT 列的 hash 就是值本身，
+    桶号 = (hash & Integer.MAX_VALUE) % buckets
+    """
+    return (np.asarray(values, dtype=np.int64) & 0x7FFFFFFF) % buckets
+
+
+def bucket_ids(rows, column, buckets):
+    if isinstance(rows, ColumnBatch):
+        values = rows[column]
+    else:
+        values = np.fromiter((r[column] for r in rows), dtype=np.int64, count=len(rows))
+    return hive_bucket_ids(values, buckets)
+
+
+def bucket_filename(bucket, compression=None):
+    """
+    Hive 的桶文件命名（000000_0、000001_0 ...，按文件名顺序对应桶号），
+    带 .csv 后缀；压缩时的 .gz / .zst 后缀 Hive 靠它识别解压方式
+    """
+    return f"{bucket:06d}_0.csv{CSV_COMPRESSIONS[compression]}"
+
+
+class BucketSpillSink(_GroupedCsvSink):
+    """
+    分桶的第一步：每个 worker 把行按桶号追加到自己的 spill 文件
+    {spill_dir}/bucket-XXXXX/part-{part:03d}.csv（不带表头、不压缩），
+    全部写完后 sort_bucket 再把同一个桶的所有 spill 多路归并
+
+    每次写出一个组缓冲前先按 (sort_by, 第一列主键) 排好序，所以 spill 文件是若干段首尾相接的
+    有序 run，每段的字节数记在 partitions() 条目的 "runs" 里
+
+    with BucketSpillSink(spill_dir, ODS_SCHEMA["ods_orders"], "user_id", part=worker_id) as sink:
+        sink.write(batch_orders, bucket_ids(batch_orders, "user_id", 32))
+    """
+
+    def __init__(self, spill_dir, fieldnames, sort_by, part=0, time_base=None, **kwargs):
+        super().__init__(spill_dir, fieldnames, part=part, time_base=time_base, header=False, **kwargs)
+        self.key_idx = fieldnames.index(sort_by)
+
+    def _group_file(self, bucket):
+        return f"bucket-{bucket:05d}/{self.filename}", {"bucket": bucket, "runs": []}
+
+    def _flush_group(self, group, g):
+        buf = g["buf"]
         if buf:
-            f.write("\n".join(buf) + "\n")
+            buf[:] = _sort_lines(bytes(buf), len(self.fieldnames), self.key_idx)
+            g["info"]["runs"].append(len(buf))
+        super()._flush_group(group, g)
+
+    def partitions(self):
+        # spill 只给 sort_bucket 用，带上完整路径
+        return [
+            {**p, "path": os.path.join(self.filepath, p["file"])}
+            for p in super().partitions()
+        ]
+
+
+def _parse_uint_spans(buf, starts, ends):
+    """
+    按列解析一批非负整数文本：buf[starts[i]:ends[i]] 是第 i 个数字，
+    按位循环（最多十几位），每位一次向量运算
+    """
+    lengths = ends - starts
+    values = np.zeros(len(starts), dtype=np.int64)
+    for d in range(int(lengths.max()) if len(lengths) else 0):
+        has = d < lengths
+        digit = buf[np.where(has, starts + d, 0)].astype(np.int64) - ord("0")
+        values = np.where(has, values * 10 + digit, values)
+    return values
+
+
+def _sort_keys(data, n_lines, n_fields, key_idx):
+    """
+    spill 字节 -> (key, 主键) 两列：事实表的行没有引号 / 内嵌逗号，每行逗号数固定，
+    所以逗号位置可以直接 reshape 成 (行, 逗号) 的表，再按列解析整数
+    """
+    if n_lines == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    commas = np.flatnonzero(buf == ord(","))
+    if len(newlines) != n_lines or len(commas) != n_lines * (n_fields - 1):
+        raise ValueError("bucket spill is not a well-formed CSV fact table")
+
+    commas = commas.reshape(n_lines, n_fields - 1)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    field_ends = np.concatenate((commas, newlines[:, None]), axis=1)
+
+    key_starts = line_starts if key_idx == 0 else commas[:, key_idx - 1] + 1
+    keys = _parse_uint_spans(buf, key_starts, field_ends[:, key_idx])
+    pks = _parse_uint_spans(buf, line_starts, field_ends[:, 0])
+    return keys, pks
+
+
+def _sort_lines(data, n_fields, key_idx):
+    """
+    一段完整的行（以换行结尾）按 (key 列, 第一列主键) 排序
+    """
+    lines = data.split(b"\n")
+    lines.pop()
+    keys, pks = _sort_keys(data, len(lines), n_fields, key_idx)
+    order = np.lexsort((pks, keys))
+    return b"\n".join([lines[i] for i in order.tolist()]) + b"\n"
+
+
+# 归并一个桶时所有 run 的读缓冲合计上限（每个 run 至少 BUCKET_MERGE_MIN_BLOCK）
+BUCKET_MERGE_BUFFER_BYTES = 64 * 1024 * 1024
+BUCKET_MERGE_MIN_BLOCK = 64 * 1024
+
+
+class _SpillRun:
+    """
+    spill 文件里的一段有序 run：按块读出完整的行，连同每行的 (key, 主键)
+    """
+
+    def __init__(self, f, offset, length, block_size, n_fields, key_idx):
+        self.f = f
+        self.pos = offset
+        self.end = offset + length
+        self.block_size = block_size
+        self.n_fields = n_fields
+        self.key_idx = key_idx
+
+        self.tail = b""
+        self.lines = []
+        self.keys = self.pks = np.zeros(0, dtype=np.int64)
+        self.start = 0
+
+    @property
+    def pending(self):
+        return self.start < len(self.lines)
+
+    @property
+    def more(self):
+        return self.pos < self.end or bool(self.tail)
+
+    def load(self):
+        """
+        当前块用完后读下一块（至少一整行）
+        """
+        data = self.tail
+        while True:
+            self.f.seek(self.pos)
+            block = self.f.read(min(self.block_size, self.end - self.pos))
+            self.pos += len(block)
+            data += block
+
+            if self.pos >= self.end or not block:
+                cut = len(data)
+                break
+            cut = data.rfind(b"\n") + 1
+            if cut:
+                break
+
+        data, self.tail = data[:cut], data[cut:]
+        self.lines = data.split(b"\n")
+        self.lines.pop()
+        self.keys, self.pks = _sort_keys(data, len(self.lines), self.n_fields, self.key_idx)
+        self.start = 0
+
+    def take_upto(self, key, pk):
+        """
+        取出当前块里 (key, 主键) <= (key, pk) 的行（run 有序，所以是一段前缀）
+        """
+        lo = np.searchsorted(self.keys, key, "left")
+        hi = np.searchsorted(self.keys, key, "right")
+        cut = max(int(lo + np.searchsorted(self.pks[lo:hi], pk, "right")), self.start)
+        return self._take(cut)
+
+    def take_all(self):
+        return self._take(len(self.lines))
+
+    def _take(self, cut):
+        start, self.start = self.start, cut
+        return self.lines[start:cut], self.keys[start:cut], self.pks[start:cut]
+
+
+def sort_bucket(spill_runs, final_path, fieldnames, column, compression=None):
+    """
+    一个桶：spill_runs 是 [(spill 路径, run 起始偏移, run 字节数)]（BucketSpillSink 写的有序 run），
+    多路归并成按 (column, 第一列主键) 排序的最终桶文件（带表头），结果与整桶排序一致。
+    每个 run 只缓冲一块（合计约 BUCKET_MERGE_BUFFER_BYTES），内存与桶大小无关：
+    每轮取"还有没读的数据的 run 里，当前块末行最小"的那个 (key, 主键) 作界，
+    所有 run 里不超过它的行都可以写出（这一轮就按 numpy 排序），该 run 的块一定用完、下一轮续读。
+    没有 spill 的桶也写一个只有表头的文件（Hive 要求文件数等于桶数）
+    返回 {"rows", "bytes"}
+    """
+    n_fields = len(fieldnames)
+    key_idx = fieldnames.index(column)
+    block_size = max(BUCKET_MERGE_MIN_BLOCK, BUCKET_MERGE_BUFFER_BYTES // max(len(spill_runs), 1))
+
+    files = {}
+    rows = 0
+    written = 0
+    compressor = new_compressor(compression)
+
+    _ensure_dir(os.path.dirname(final_path))
+    fd = os.open(final_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+    try:
+        runs = []
+        for path, offset, length in spill_runs:
+            if path not in files:
+                files[path] = open(path, "rb")
+            runs.append(_SpillRun(files[path], offset, length, block_size, n_fields, key_idx))
+
+        def emit(data):
+            nonlocal written
+            if compressor is not None:
+                data = compressor.compress(data)
+            _write_fd(fd, data)
+            written += len(data)
+
+        emit((",".join(fieldnames) + "\n").encode("utf-8"))
+
+        while True:
+            for run in runs:
+                if not run.pending and run.more:
+                    run.load()
+
+            active = [run for run in runs if run.pending]
+            if not active:
+                break
+
+            bounded = [run for run in active if run.more]
+            if bounded:
+                key, pk = min((int(run.keys[-1]), int(run.pks[-1])) for run in bounded)
+                taken = [run.take_upto(key, pk) for run in active]
+            else:
+                taken = [run.take_all() for run in active]
+
+            lines = [line for t in taken for line in t[0]]
+            if not lines:
+                continue
+            order = np.lexsort((np.concatenate([t[2] for t in taken]), np.concatenate([t[1] for t in taken])))
+            emit(b"\n".join([lines[i] for i in order.tolist()]) + b"\n")
+            rows += len(lines)
+
+        if compressor is not None:
+            tail = compressor.flush()
+            _write_fd(fd, tail)
+            written += len(tail)
+    finally:
+        os.close(fd)
+        for f in files.values():
+            f.close()
+
+    return {"rows": rows, "bytes": written}
 
 
 # ========= ODS schema =========
@@ -124,40 +939,241 @@ ODS_SCHEMA = {
     ],
 }
 
+TIME_FIELDS = {
+    "register_time",
+    "created_time", "pay_time", "cancel_time", "ship_time", "complete_time", "refund_time",
+}
+
+# 取值少、适合缓存文本的列
+CODE_FIELDS = {"status", "refund_type", "city", "category", "shop_type"}
+SMALL_INT_FIELDS = {"total_qty", "item_qty", "shop_weight"}
+
+# ========= 输出格式 =========
+OUTPUT_FORMATS = ("csv", "parquet", "arrow", "sqlite", "duckdb")
+
+# 数据库格式 -> 数据库文件名（放在 ods_dir 下，打包时一起进 zip），写出见 exporter_db
+DB_FILES = {
+    "sqlite": "ods.sqlite",
+    "duckdb": "ods.duckdb",
+}
+
+PARQUET_COMPRESSIONS = ("none", "snappy", "gzip", "zstd", "lz4", "brotli")
+
+# Hive 建表的 STORED AS（arrow / 数据库格式没有）
+DDL_STORED_AS = {
+    "csv": "TEXTFILE",
+    "parquet": "PARQUET",
+}
+
+# Parquet 列的 Hive 类型（exporter_arrow 按它决定 Arrow 类型，建表语句也由它生成）
+# - 时间列是真正的 TIMESTAMP（CSV 里是文本）
+# - STRING 列都是取值少的编码列，写成字典编码
+ODS_PARQUET_TYPES = {
+    "ods_user_dim": {
+        "user_id": "INT",
+        "register_time": "TIMESTAMP",
+        "city": "STRING",
+    },
+    "ods_shop_dim": {
+        "shop_id": "INT",
+        "shop_type": "STRING",
+        "shop_weight": "INT",
+    },
+    "ods_sku_dim": {
+        "sku_id": "INT",
+        "category": "STRING",
+        "sku_price": "INT",
+    },
+    "ods_orders": {
+        "order_id": "INT",
+        "user_id": "INT",
+        "shop_id": "INT",
+        "created_time": "TIMESTAMP",
+        "status": "STRING",
+        "total_qty": "INT",
+        "total_amount": "INT",
+        "discount_amount": "INT",
+        "paid_amount": "INT",
+        "refund_amount": "INT",
+        "pay_time": "TIMESTAMP",
+        "cancel_time": "TIMESTAMP",
+        "ship_time": "TIMESTAMP",
+        "complete_time": "TIMESTAMP",
+        "refund_time": "TIMESTAMP",
+        "refund_type": "STRING",
+    },
+    "ods_order_items": {
+        "order_item_id": "BIGINT",
+        "order_id": "INT",
+        "user_id": "INT",
+        "shop_id": "INT",
+        "sku_id": "INT",
+        "item_qty": "INT",
+        "sku_price": "INT",
+        "item_amount": "INT",
+    },
+}
+
 
 # ========= ODS 导出 =========
-def export_ods(ds, out_dir="out/ods"):
+def export_ods(ds, out_dir="out/ods", time_base=None):
     _ensure_dir(out_dir)
 
-    export_csv(ds["users"], os.path.join(out_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"])
+    export_csv(ds["users"], os.path.join(out_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"], time_base=time_base)
     export_csv(ds["shops"], os.path.join(out_dir, "ods_shop_dim.csv"), ODS_SCHEMA["ods_shop_dim"])
     export_csv(ds["skus"], os.path.join(out_dir, "ods_sku_dim.csv"), ODS_SCHEMA["ods_sku_dim"])
-    export_csv(ds["orders"], os.path.join(out_dir, "ods_orders.csv"), ODS_SCHEMA["ods_orders"])
+    export_csv(ds["orders"], os.path.join(out_dir, "ods_orders.csv"), ODS_SCHEMA["ods_orders"], time_base=time_base)
     export_csv(ds["items"], os.path.join(out_dir, "ods_order_items.csv"), ODS_SCHEMA["ods_order_items"])
 
     return out_dir
 
 
+# ========= 目录布局（一张表一个目录）=========
+# parquet / arrow 以及多进程不合并的 CSV：{ods_dir}/{table}/part-XXX.<ext> + _manifest.json
+# （Hive / Spark 会跳过 _ 开头的文件）
+PART_EXT = {
+    "csv": "csv",
+    "parquet": "parquet",
+    "arrow": "arrow",
+}
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def table_part_path(ods_dir, table, output_format, part=0, csv_compression=None):
+    ext = PART_EXT[output_format]
+    if output_format == "csv":
+        ext += CSV_COMPRESSIONS[csv_compression]
+    return os.path.join(ods_dir, table, f"part-{part:03d}.{ext}")
+
+
+def _clear_table_dir(table_dir):
+    for path in glob.glob(os.path.join(table_dir, "part-*")):
+        os.remove(path)
+    # 桶文件（000000_0.csv ...）
+    for path in glob.glob(os.path.join(table_dir, "[0-9]*_0.csv*")):
+        os.remove(path)
+    # 分区子目录（dt=YYYY-MM-DD）
+    for partition_dir in glob.glob(os.path.join(table_dir, "*=*")):
+        for path in glob.glob(os.path.join(partition_dir, "part-*")):
+            os.remove(path)
+        if not os.listdir(partition_dir):
+            os.rmdir(partition_dir)
+    manifest = os.path.join(table_dir, MANIFEST_NAME)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+
+
+def reset_table_dir(ods_dir, table):
+    """
+    写之前清掉上一次的 part 文件（上次 worker 更多 / 格式不同时会残留多余的 part）
+    """
+    table_dir = os.path.join(ods_dir, table)
+    _ensure_dir(table_dir)
+    _clear_table_dir(table_dir)
+    return table_dir
+
+
+def remove_table_dir(ods_dir, table):
+    """
+    这次按单文件写出时，删掉上一次按目录写出留下的 part（目录空了就一起删）
+    """
+    table_dir = os.path.join(ods_dir, table)
+    if not os.path.isdir(table_dir):
+        return
+    _clear_table_dir(table_dir)
+    if not os.listdir(table_dir):
+        os.rmdir(table_dir)
+
+
+def write_table_manifest(ods_dir, table, parts, **meta):
+    """
+    {ods_dir}/{table}/_manifest.json：
+    {"table", "rows", "bytes", "parts": [{"file", "rows", "bytes", ...}], ...meta}
+    """
+    manifest = {
+        "table": table,
+        **meta,
+        "rows": sum(p["rows"] for p in parts),
+        "bytes": sum(p["bytes"] for p in parts),
+        "parts": parts,
+    }
+
+    path = os.path.join(ods_dir, table, MANIFEST_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    return path
+
+
 # ========= 打包 =========
 def pack_ods_zip(ods_dir: str, zip_path: str | None = None):
+    """
+    把 ods_dir 打成 zip：
+    - 普通 CSV 用 deflate 压缩
+    - 已经压缩过的文件（.csv.gz / .csv.zst / parquet / arrow）原样存入，只是拷贝字节
+    """
     ods_dir = os.path.abspath(ods_dir)
 
     if zip_path is None:
         zip_path = os.path.join(os.path.dirname(ods_dir), "ods.zip")
 
-    base_name = os.path.splitext(os.path.abspath(zip_path))[0]
+    zip_path = os.path.splitext(os.path.abspath(zip_path))[0] + ".zip"
 
-    _ensure_dir(os.path.dirname(base_name))
+    _ensure_dir(os.path.dirname(zip_path))
 
-    return shutil.make_archive(
-        base_name=base_name,
-        format="zip",
-        root_dir=ods_dir
-    )
+    with zipfile.ZipFile(zip_path, "w", allowZip64=True) as zf:
+        for root, dirs, files in os.walk(ods_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if name.endswith(PRECOMPRESSED_EXTS):
+                    compress_type = zipfile.ZIP_STORED
+                else:
+                    compress_type = zipfile.ZIP_DEFLATED
+                zf.write(path, os.path.relpath(path, ods_dir), compress_type=compress_type)
+
+    return zip_path
 
 
 # ========= Hive DDL =========
-def hive_ddl_ods(database="dw_ods"):
+# 分区表的分区列（不在数据文件里，由目录名 dt=YYYY-MM-DD 给出）
+HIVE_PARTITION_CLAUSE = "PARTITIONED BY (dt STRING)\n"
+
+
+def _hive_bucket_clauses(bucket_by, buckets):
+    """
+    返回 (CLUSTERED BY 子句, TBLPROPERTIES 子句)；
+    桶号按 bucketing_version=1 的算法算（见 hive_bucket_ids），建表时要写明
+    """
+    if bucket_by is None:
+        return "", ""
+    if bucket_by not in BUCKET_BY or not buckets or buckets <= 0:
+        raise ValueError(f"bucket_by must be one of {list(BUCKET_BY)} with buckets > 0")
+    return (
+        f"CLUSTERED BY ({bucket_by}) SORTED BY ({bucket_by} ASC) INTO {buckets} BUCKETS\n",
+        "\nTBLPROPERTIES ('bucketing_version'='1')",
+    )
+
+
+def hive_ddl_ods(database="dw_ods", stored_as="TEXTFILE", partitioned=False, bucket_by=None, buckets=None):
+    """
+    stored_as:
+    - "TEXTFILE": 对应 CSV 导出（默认）
+    - "PARQUET" : 对应 Parquet 导出，列类型取 ODS_PARQUET_TYPES
+    partitioned=True 时 ods_orders / ods_order_items 建成 PARTITIONED BY (dt STRING)，
+    数据放到表目录后用 hive_msck_repair_ods 的语句登记分区
+    bucket_by / buckets 不为 None 时这两张表建成
+    CLUSTERED BY (col) SORTED BY (col ASC) INTO N BUCKETS（与分桶导出一致）
+    """
+    if stored_as == "PARQUET":
+        return _hive_ddl_ods_parquet(database, partitioned, bucket_by, buckets)
+    if stored_as != "TEXTFILE":
+        raise ValueError(f"unknown stored_as: {stored_as}")
+
+    partition = HIVE_PARTITION_CLAUSE if partitioned else ""
+    bucket, props = _hive_bucket_clauses(bucket_by, buckets)
+
     return f"""
 CREATE DATABASE IF NOT EXISTS {database};
 
@@ -203,8 +1219,8 @@ CREATE TABLE IF NOT EXISTS {database}.ods_orders (
   refund_time STRING,
   refund_type STRING
 )
-ROW FORMAT DELIMITED FIELDS TERMINATED BY ','
-STORED AS TEXTFILE;
+{partition}{bucket}ROW FORMAT DELIMITED FIELDS TERMINATED BY ','
+STORED AS TEXTFILE{props};
 
 CREATE TABLE IF NOT EXISTS {database}.ods_order_items (
   order_item_id BIGINT,
@@ -216,12 +1232,52 @@ CREATE TABLE IF NOT EXISTS {database}.ods_order_items (
   sku_price INT,
   item_amount INT
 )
-ROW FORMAT DELIMITED FIELDS TERMINATED BY ','
-STORED AS TEXTFILE;
+{partition}{bucket}ROW FORMAT DELIMITED FIELDS TERMINATED BY ','
+STORED AS TEXTFILE{props};
 """
 
 
-def write_hive_ddl(filepath="out/hive_ods_ddl.sql", database="dw_ods"):
+def _hive_ddl_ods_parquet(database, partitioned=False, bucket_by=None, buckets=None):
+    parts = [f"\nCREATE DATABASE IF NOT EXISTS {database};\n"]
+    bucket, props = _hive_bucket_clauses(bucket_by, buckets)
+
+    for table, types in ODS_PARQUET_TYPES.items():
+        cols = ",\n".join(f"  {name} {typ}" for name, typ in types.items())
+        fact = table in PARTITIONED_TABLES
+        parts.append(
+            f"\nCREATE TABLE IF NOT EXISTS {database}.{table} (\n"
+            f"{cols}\n"
+            f")\n"
+            f"{HIVE_PARTITION_CLAUSE if partitioned and fact else ''}"
+            f"{bucket if fact else ''}"
+            f"STORED AS PARQUET{props if fact else ''};\n"
+        )
+
+    return "".join(parts)
+
+
+def hive_msck_repair_ods(database="dw_ods"):
+    """
+    分区表的数据目录（{table}/dt=YYYY-MM-DD/）放到表的 LOCATION 下之后，
+    用 MSCK REPAIR 一次性登记所有分区
+    """
+    lines = [
+        "",
+        "-- 先把 ods/<table>/ 下的 dt=YYYY-MM-DD 目录上传到表的 LOCATION，例如：",
+        f"--   hdfs dfs -put ods/ods_orders/dt=* <warehouse>/{database}.db/ods_orders/",
+    ]
+    lines.extend(f"MSCK REPAIR TABLE {database}.{table};" for table in PARTITIONED_TABLES)
+    return "\n".join(lines) + "\n"
+
+
+def write_hive_ddl(
+    filepath="out/hive_ods_ddl.sql",
+    database="dw_ods",
+    stored_as="TEXTFILE",
+    partitioned=False,
+    bucket_by=None,
+    buckets=None,
+):
     _ensure_dir(os.path.dirname(filepath))
 
     with open(
@@ -230,6 +1286,15 @@ def write_hive_ddl(filepath="out/hive_ods_ddl.sql", database="dw_ods"):
         encoding="utf-8",
         buffering=DEFAULT_FILE_BUFFERING
     ) as f:
-        f.write(hive_ddl_ods(database))
+        f.write(hive_ddl_ods(database, stored_as, partitioned, bucket_by, buckets))
+
+    return filepath
+
+
+def write_hive_msck(filepath="out/hive_ods_msck.sql", database="dw_ods"):
+    _ensure_dir(os.path.dirname(filepath))
+
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(hive_msck_repair_ods(database))
 
-    return filepath
\ No newline at end of file
+    return filepath
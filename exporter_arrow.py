@@ -0,0 +1,259 @@
+"""
+Arrow 系写出（依赖 pyarrow，只在 output_format="parquet" / "arrow" 或
+pipeline.iter_record_batches 时才导入）：
+省掉“先写 CSV 再转 Parquet / 再解析”的一步。
+
+- 每次 write(rows) = 一批生成结果 = 一个 row group（Parquet）/ 一个 record batch（Arrow IPC）
+- 两套 schema：
+  - arrow_schema(table)：Parquet 用，列类型取 exporter.ODS_PARQUET_TYPES（与 Hive 建表一致）：
+    INT -> int32，BIGINT -> int64，TIMESTAMP -> timestamp[ms]（无时区，与 CSV 里的本地时间文本一致），
+    STRING -> 字典编码（status / city / category ... 本来就是编码列）
+  - native_arrow_schema(cfg, table)：进程内消费 / Arrow IPC 用，整数列保持 int64、
+    编码列保持原下标类型，numpy 列直接包成 Arrow 数组不复制；只有时间列要从分钟换算成毫秒
+- 列式批（numpy 引擎 / 向量化维表）直接按列转换；list[dict] 先走 ColumnBatch.from_rows
+- 每张表一个目录：{ods_dir}/{table}/part-XXX.parquet|arrow，
+  多进程时每个 worker 写自己的 part 文件，不需要合并
+"""
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from batch import (
+    ODS_BATCHES,
+    code_dtype,
+    iter_column_batches,
+)
+from exporter import (
+    ODS_PARQUET_TYPES,
+    PARQUET_COMPRESSIONS,
+    _ensure_dir,
+    table_part_path,
+    reset_table_dir,
+)
+from facts_np import NULL_MINUTE
+
+
+DEFAULT_PARQUET_COMPRESSION = "snappy"
+
+HIVE_TO_ARROW = {
+    "INT": pa.int32(),
+    "BIGINT": pa.int64(),
+    "TIMESTAMP": pa.timestamp("ms"),
+    "STRING": pa.dictionary(pa.int32(), pa.string()),
+}
+
+MS_PER_MINUTE = 60_000
+
+
+# =========================
+# 1) schema
+# =========================
+def arrow_schema(table):
+    """
+    Parquet 用：与 Hive 建表类型一致
+    """
+    return pa.schema([
+        pa.field(name, HIVE_TO_ARROW[typ])
+        for name, typ in ODS_PARQUET_TYPES[table].items()
+    ])
+
+
+def native_arrow_schema(cfg, table):
+    """
+    进程内 / Arrow IPC 用：与列式批的 numpy dtype 一致，转换时不复制整数列和编码列
+    """
+    batch_cls = ODS_BATCHES[table]
+    code_tables = batch_cls.code_tables(cfg)
+
+    fields = []
+    for name in batch_cls.fields:
+        if name in code_tables:
+            index_type = pa.from_numpy_dtype(code_dtype(code_tables[name]))
+            typ = pa.dictionary(index_type, pa.string())
+        elif name in batch_cls.time_fields:
+            typ = pa.timestamp("ms")
+        else:
+            typ = pa.int64()
+        fields.append(pa.field(name, typ))
+
+    return pa.schema(fields)
+
+
+# =========================
+# 2) 列式批 -> RecordBatch
+# =========================
+def _timestamp_array(batch, minutes):
+    """
+    分钟偏移 -> timestamp[ms]，NULL_MINUTE -> null
+    """
+    null = minutes == NULL_MINUTE
+    base_ms = np.datetime64(batch.base_time, "ms").astype(np.int64)
+    ms = np.where(null, 0, minutes) * MS_PER_MINUTE + base_ms
+    return pa.array(ms, type=pa.timestamp("ms"), mask=null if null.any() else None)
+
+
+def _arrow_column(batch, name, typ):
+    col = batch.columns[name]
+
+    if pa.types.is_dictionary(typ):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(col, type=typ.index_type),
+            pa.array(batch.code_fields[name], type=pa.string()),
+        )
+    if pa.types.is_timestamp(typ):
+        return _timestamp_array(batch, col)
+
+    # dtype 相同时零拷贝；int64 -> int32 是安全转换，超出范围会报错而不是悄悄截断
+    return pa.array(col, type=typ)
+
+
+def to_record_batch(batch, schema):
+    return pa.RecordBatch.from_arrays(
+        [_arrow_column(batch, f.name, f.type) for f in schema],
+        schema=schema,
+    )
+
+
+# =========================
+# 3) 常驻写出端
+# =========================
+class _RecordBatchSink:
+    """
+    与 exporter.CsvSink 同样的用法（write / close / stats / with），
+    子类只负责打开 writer 和写一个 RecordBatch
+    """
+
+    def __init__(self, filepath, table, cfg, schema):
+        _ensure_dir(os.path.dirname(filepath))
+
+        self.filepath = filepath
+        self.table = table
+        self.cfg = cfg
+        self.schema = schema
+
+        self.bytes_written = 0
+        self.rows_written = 0
+
+        self._writer = self._open_writer()
+
+    def _open_writer(self):
+        raise NotImplementedError
+
+    def _write_record_batch(self, record_batch):
+        raise NotImplementedError
+
+    def write(self, rows):
+        if not rows:
+            return
+
+        for batch in iter_column_batches(self.cfg, self.table, rows):
+            if not len(batch):
+                continue
+            self._write_record_batch(to_record_batch(batch, self.schema))
+            self.rows_written += len(batch)
+
+    def _close_writer(self):
+        self._writer.close()
+
+    def close(self):
+        if self._writer is None:
+            return
+        try:
+            self._close_writer()
+        finally:
+            self._writer = None
+            self.bytes_written = os.path.getsize(self.filepath)
+
+    def stats(self):
+        return {"rows": self.rows_written, "bytes": self.bytes_written}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSink(_RecordBatchSink):
+    """
+    每次 write 写一个 row group：
+
+    with ParquetSink(path, "ods_orders", cfg) as sink:
+        sink.write(batch_orders)
+
+    bytes_written 在 close 之后才是最终文件大小（footer 最后写）
+    """
+
+    def __init__(self, filepath, table, cfg, compression=DEFAULT_PARQUET_COMPRESSION):
+        if compression not in PARQUET_COMPRESSIONS:
+            raise ValueError(f"compression must be one of {list(PARQUET_COMPRESSIONS)}")
+        self.compression = compression
+        super().__init__(filepath, table, cfg, arrow_schema(table))
+
+    def _open_writer(self):
+        return pq.ParquetWriter(self.filepath, self.schema, compression=self.compression)
+
+    def _write_record_batch(self, record_batch):
+        self._writer.write_batch(record_batch, row_group_size=record_batch.num_rows)
+
+
+class ArrowIpcSink(_RecordBatchSink):
+    """
+    Arrow IPC 文件（Feather v2）：不压缩，读端 pa.memory_map 之后零拷贝访问，
+    每次 write 写一个 record batch
+
+    with ArrowIpcSink(path, "ods_orders", cfg) as sink:
+        sink.write(batch_orders)
+    """
+
+    def __init__(self, filepath, table, cfg):
+        super().__init__(filepath, table, cfg, native_arrow_schema(cfg, table))
+
+    def _open_writer(self):
+        self._file = pa.OSFile(self.filepath, "wb")
+        return pa.ipc.new_file(self._file, self.schema)
+
+    def _write_record_batch(self, record_batch):
+        self._writer.write_batch(record_batch)
+
+    def _close_writer(self):
+        try:
+            self._writer.close()
+        finally:
+            self._file.close()
+
+
+def open_table_sink(output_format, filepath, table, cfg, compression=DEFAULT_PARQUET_COMPRESSION):
+    """
+    compression 只对 parquet 有效（Arrow IPC 不压缩，保证可以 mmap）
+    """
+    if output_format == "parquet":
+        return ParquetSink(filepath, table, cfg, compression=compression)
+    if output_format == "arrow":
+        return ArrowIpcSink(filepath, table, cfg)
+    raise ValueError(f"unknown output_format: {output_format}")
+
+
+def read_ipc_table(path):
+    """
+    memory-map 读 Arrow IPC 文件（零拷贝）
+    """
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+# =========================
+# 4) 整表写出（目录布局见 exporter.table_part_path）
+# =========================
+def export_table(rows, ods_dir, table, cfg, output_format, compression=DEFAULT_PARQUET_COMPRESSION):
+    """
+    整表写成 {ods_dir}/{table}/part-000.parquet|arrow（维表用）
+    """
+    reset_table_dir(ods_dir, table)
+    path = table_part_path(ods_dir, table, output_format)
+
+    with open_table_sink(output_format, path, table, cfg, compression=compression) as sink:
+        sink.write(rows)
+
+    return path
@@ -0,0 +1,260 @@
+"""
+数据库写出（output_format="sqlite" / "duckdb"，只在这两种格式时才导入）：
+生成的每批直接批量写进本地数据库文件，省掉“先导出 CSV 再手动导入”。
+
+- 一个 run 一个数据库文件 {ods_dir}/ods.sqlite | ods.duckdb（见 exporter.DB_FILES），
+  每次重新建库，五张表按 ODS_SCHEMA 的列顺序建表，列类型取 exporter.ODS_PARQUET_TYPES
+- OdsDatabase.table_sink(table) 返回与 CsvSink 同样用法的写出端（write / close / stats / with）
+- 索引在 OdsDatabase.close（全部写完）时才建，写入阶段不维护索引
+- SQLite：journal_mode=WAL、synchronous=OFF，executemany 批量插入，
+  攒够 SQLITE_COMMIT_ROWS 行才提交一次；时间列存 "YYYY-MM-DD HH:MM:SS" 文本（与 CSV 相同）
+- DuckDB：每批转成 Arrow RecordBatch 直接插入（需要 pyarrow），整个 run 一个事务，
+  时间列是 TIMESTAMP；关闭扩展的自动安装 / 加载，只读写本地文件
+"""
+import os
+
+from batch import iter_column_batches
+from exporter import ODS_SCHEMA, ODS_PARQUET_TYPES, DB_FILES, _ensure_dir
+
+
+SQLITE_TYPES = {
+    "INT": "INTEGER",
+    "BIGINT": "INTEGER",
+    "TIMESTAMP": "TEXT",
+    "STRING": "TEXT",
+}
+
+DUCKDB_TYPES = {
+    "INT": "INTEGER",
+    "BIGINT": "BIGINT",
+    "TIMESTAMP": "TIMESTAMP",
+    "STRING": "VARCHAR",
+}
+
+# 写完之后建的索引（常用的关联 / 过滤列）
+ODS_INDEXES = {
+    "ods_user_dim": ("user_id",),
+    "ods_shop_dim": ("shop_id",),
+    "ods_sku_dim": ("sku_id",),
+    "ods_orders": ("order_id", "user_id", "created_time"),
+    "ods_order_items": ("order_id", "sku_id"),
+}
+
+# SQLite 每攒够这么多行提交一次事务
+SQLITE_COMMIT_ROWS = 1_000_000
+
+
+# =========================
+# 1) 表写出端
+# =========================
+class DbTableSink:
+    """
+    一张表的写出端：list[dict] / ColumnBatch / BatchStream 统一转成列式批再交给数据库插入；
+    连接和事务归 OdsDatabase 管，close 只是结束这张表的写入
+    """
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filepath = db.path
+
+        self.bytes_written = 0
+        self.rows_written = 0
+
+    def write(self, rows):
+        if not rows:
+            return
+
+        for batch in iter_column_batches(self.db.cfg, self.table, rows):
+            if not len(batch):
+                continue
+            self.db.insert(self.table, batch)
+            self.rows_written += len(batch)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"rows": self.rows_written, "bytes": self.bytes_written}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =========================
+# 2) 数据库
+# =========================
+class OdsDatabase:
+    """
+    with open_ods_database("sqlite", path, cfg) as db:
+        with db.table_sink("ods_orders") as sink:
+            sink.write(batch_orders)
+
+    close() 提交并建索引；异常退出时只关闭连接，不建索引
+    """
+
+    sql_types = {}
+    # 建库前要一起删掉的附属文件后缀（WAL 等）
+    side_files = ()
+
+    def __init__(self, path, cfg):
+        _ensure_dir(os.path.dirname(path))
+        for p in (path,) + tuple(path + suffix for suffix in self.side_files):
+            if os.path.exists(p):
+                os.remove(p)
+
+        self.path = path
+        self.cfg = cfg
+        self.con = self._connect()
+
+        for table in ODS_SCHEMA:
+            self.con.execute(self._create_table_sql(table))
+
+        self._begin()
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _begin(self):
+        self.con.execute("BEGIN TRANSACTION")
+
+    def _commit(self):
+        self.con.execute("COMMIT")
+
+    def _create_table_sql(self, table):
+        types = ODS_PARQUET_TYPES[table]
+        cols = ", ".join(f"{name} {self.sql_types[types[name]]}" for name in ODS_SCHEMA[table])
+        return f"CREATE TABLE {table} ({cols})"
+
+    def insert(self, table, batch):
+        raise NotImplementedError
+
+    def table_sink(self, table):
+        return DbTableSink(self, table)
+
+    def _create_indexes(self):
+        for table, cols in ODS_INDEXES.items():
+            for col in cols:
+                self.con.execute(f"CREATE INDEX idx_{table}_{col} ON {table} ({col})")
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        if self.con is None:
+            return
+        try:
+            self._commit()
+            self._create_indexes()
+            self._finish()
+        finally:
+            self.con.close()
+            self.con = None
+
+    def abort(self):
+        if self.con is None:
+            return
+        self.con.close()
+        self.con = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class SqliteDatabase(OdsDatabase):
+    sql_types = SQLITE_TYPES
+    side_files = ("-wal", "-shm", "-journal")
+
+    def __init__(self, path, cfg, commit_rows=SQLITE_COMMIT_ROWS):
+        self.commit_rows = commit_rows
+        self._pending_rows = 0
+        self._insert_sql = {
+            table: f"INSERT INTO {table} VALUES ({', '.join('?' * len(cols))})"
+            for table, cols in ODS_SCHEMA.items()
+        }
+        super().__init__(path, cfg)
+
+    def _connect(self):
+        import sqlite3
+
+        # isolation_level=None：事务完全由这里的 BEGIN / COMMIT 控制
+        con = sqlite3.connect(self.path, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=OFF")
+        return con
+
+    def insert(self, table, batch):
+        cols = []
+        for name in batch.fields:
+            if name in batch.time_fields:
+                # 空时间存 NULL，不存空串
+                cols.append([text or None for text in batch.text_column(name)])
+            elif name in batch.code_fields:
+                cols.append(batch.text_column(name))
+            else:
+                cols.append(batch.columns[name].tolist())
+
+        self.con.executemany(self._insert_sql[table], zip(*cols))
+
+        self._pending_rows += len(batch)
+        if self._pending_rows >= self.commit_rows:
+            self._commit()
+            self._begin()
+            self._pending_rows = 0
+
+    def _finish(self):
+        self.con.execute("PRAGMA optimize")
+        self.con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class DuckdbDatabase(OdsDatabase):
+    sql_types = DUCKDB_TYPES
+    side_files = (".wal",)
+
+    def __init__(self, path, cfg):
+        # pyarrow 只在这里需要（按 Hive 列类型转 RecordBatch）
+        from exporter_arrow import arrow_schema, to_record_batch
+
+        self._to_record_batch = to_record_batch
+        self._schemas = {table: arrow_schema(table) for table in ODS_SCHEMA}
+        super().__init__(path, cfg)
+
+    def _connect(self):
+        import duckdb
+
+        return duckdb.connect(self.path, config={
+            "autoinstall_known_extensions": False,
+            "autoload_known_extensions": False,
+        })
+
+    def insert(self, table, batch):
+        record_batch = self._to_record_batch(batch, self._schemas[table])
+        self.con.from_arrow(record_batch).insert_into(table)
+
+    def _finish(self):
+        self.con.execute("CHECKPOINT")
+
+
+DATABASES = {
+    "sqlite": SqliteDatabase,
+    "duckdb": DuckdbDatabase,
+}
+
+
+def open_ods_database(output_format, path, cfg):
+    if output_format not in DATABASES:
+        raise ValueError(f"output_format must be one of {list(DATABASES)}")
+    return DATABASES[output_format](path, cfg)
+
+
+def ods_database_path(ods_dir, output_format):
+    return os.path.join(ods_dir, DB_FILES[output_format])
@@ -1,7 +1,10 @@
+import math
 from bisect import bisect_left
 from datetime import timedelta
 from itertools import accumulate
 
+from timefmt import time_origin, time_unit
+
 
 def _int_money(x):
     return int(round(x))
@@ -24,39 +27,188 @@ def _build_cum_sampler(ids, weights):
     cum_weights = list(accumulate(weights))
     total_weight = cum_weights[-1]
     return {
+        "kind": "cum",
         "ids": ids,
         "cum_weights": cum_weights,
         "total_weight": total_weight,
     }
 
 
+def _build_alias_sampler(ids, weights):
+    """
+    Walker / Vose 别名表：构建 O(n)，单次抽样 O(1)
+    - prob[i]  : 落在第 i 格时保留 i 的概率
+    - alias[i] : 否则改取 alias[i]
+    """
+    n = len(weights)
+    total_weight = sum(weights)
+    scaled = [w * n / total_weight for w in weights]
+
+    prob = [1.0] * n
+    alias = list(range(n))
+
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    small_pop = small.pop
+    small_push = small.append
+    large_pop = large.pop
+    large_push = large.append
+
+    while small and large:
+        s = small_pop()
+        l = large_pop()
+        p = scaled[s]
+        prob[s] = p
+        alias[s] = l
+        p = (scaled[l] + p) - 1.0
+        scaled[l] = p
+        if p < 1.0:
+            small_push(l)
+        else:
+            large_push(l)
+
+    # 剩下的都是浮点误差，直接视为满格
+    return {
+        "kind": "alias",
+        "ids": ids,
+        "prob": prob,
+        "alias": alias,
+        "total_weight": total_weight,
+    }
+
+
+# =========================
+# 0.1) 无表 Zipf：rejection-inversion（Hörmann & Derflinger）
+# =========================
+def _zipf_helper1(x):
+    # log1p(x) / x，x -> 0 时用泰勒展开
+    if abs(x) > 1e-8:
+        return math.log1p(x) / x
+    return 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+
+
+def _zipf_helper2(x):
+    # expm1(x) / x，x -> 0 时用泰勒展开
+    if abs(x) > 1e-8:
+        return math.expm1(x) / x
+    return 1.0 + x * 0.5 * (1.0 + x * (1.0 / 3.0) * (1.0 + 0.25 * x))
+
+
+def _zipf_h(x, alpha):
+    return math.exp(-alpha * math.log(x))
+
+
+def _zipf_h_integral(x, alpha):
+    log_x = math.log(x)
+    return _zipf_helper2((1.0 - alpha) * log_x) * log_x
+
+
+def _zipf_h_integral_inverse(x, alpha):
+    t = x * (1.0 - alpha)
+    if t < -1.0:
+        t = -1.0
+    return math.exp(_zipf_helper1(t) * x)
+
+
+def _build_zipf_sampler(n, alpha, ids=None):
+    """
+    按 1/(rank^alpha) 抽 rank ∈ [1, n]，不建任何按元素的表：
+    - 常数内存，单次抽样期望 O(1)
+    - ids=None 时 rank 就是 id（用户），否则返回 ids[rank-1]（类目内 SKU）
+    """
+    h_x1 = _zipf_h_integral(1.5, alpha) - 1.0
+    h_n = _zipf_h_integral(n + 0.5, alpha)
+    s_val = 2.0 - _zipf_h_integral_inverse(_zipf_h_integral(2.5, alpha) - _zipf_h(2.0, alpha), alpha)
+    return {
+        "kind": "zipf",
+        "ids": ids,
+        "n": n,
+        "alpha": alpha,
+        "h_x1": h_x1,
+        "h_n": h_n,
+        "s_val": s_val,
+    }
+
+
+def _sample_zipf_rank(rnd, sampler):
+    n = sampler["n"]
+    alpha = sampler["alpha"]
+    h_x1 = sampler["h_x1"]
+    h_n = sampler["h_n"]
+    s_val = sampler["s_val"]
+
+    while True:
+        u = h_n + rnd.random() * (h_x1 - h_n)
+        x = _zipf_h_integral_inverse(u, alpha)
+        k = int(x + 0.5)
+        if k < 1:
+            k = 1
+        elif k > n:
+            k = n
+        if k - x <= s_val or u >= _zipf_h_integral(k + 0.5, alpha) - _zipf_h(k, alpha):
+            return k
+
+
+def _build_sampler(ids, weights, kind="cum"):
+    if kind == "cum":
+        return _build_cum_sampler(ids, weights)
+    if kind == "alias":
+        return _build_alias_sampler(ids, weights)
+    raise ValueError(f"unknown sampler kind: {kind}")
+
+
 def _sample_one(rnd, sampler):
-    x = rnd.random() * sampler["total_weight"]
-    idx = bisect_left(sampler["cum_weights"], x)
-    return sampler["ids"][idx]
+    kind = sampler["kind"]
+
+    if kind == "cum":
+        x = rnd.random() * sampler["total_weight"]
+        idx = bisect_left(sampler["cum_weights"], x)
+        return sampler["ids"][idx]
+
+    if kind == "alias":
+        u = rnd.random() * len(sampler["prob"])
+        i = int(u)
+        if u - i < sampler["prob"][i]:
+            return sampler["ids"][i]
+        return sampler["ids"][sampler["alias"][i]]
+
+    k = _sample_zipf_rank(rnd, sampler)
+    ids = sampler["ids"]
+    return k if ids is None else ids[k - 1]
 
 
 # =========================
 # 1) 店铺：帕累托（头部店更强）
 # =========================
-def _build_shop_sampler(shops, power=1.15):
+def _dim_columns(rows, *names):
+    """
+    维表按列取值：list[dict] 逐行取；列式批（dim_engine="numpy"）直接解码整列
+    """
+    if hasattr(rows, "decoded_column"):
+        return [rows.decoded_column(k) for k in names]
+    return [[r[k] for r in rows] for k in names]
+
+
+def _build_shop_sampler(shops, power=1.15, kind="cum"):
     """
     在 shop_weight 基础上做幂次放大：weight^power
     power=1.0 表示不放大；越大头部越集中。
     """
-    shop_ids = [s["shop_id"] for s in shops]
-    shop_weights = [(s["shop_weight"] ** power) for s in shops]
-    return _build_cum_sampler(shop_ids, shop_weights)
+    shop_ids, shop_weights = _dim_columns(shops, "shop_id", "shop_weight")
+    shop_weights = [(w ** power) for w in shop_weights]
+    return _build_sampler(shop_ids, shop_weights, kind)
 
 
 # =========================
 # 2) SKU：爆品/长尾热度（按类目内rank权重）
 # =========================
 def _build_sku_map(skus):
+    if hasattr(skus, "iter_rows"):
+        skus = skus.iter_rows()
     return {s["sku_id"]: s for s in skus}
 
 
-def _build_category_sku_rank_sampler(cfg, rnd, skus):
+def _build_category_sku_rank_sampler(cfg, rnd, skus, kind="cum"):
     """
     为每个类目构造一个“爆品长尾”的抽样器：
     category -> sampler
@@ -64,14 +216,20 @@ def _build_category_sku_rank_sampler(cfg, rnd, skus):
     """
     beta = 1.10
     cat_pool = {}
-    for s in skus:
-        cat_pool.setdefault(s["category"], []).append(s["sku_id"])
+    sku_ids, categories = _dim_columns(skus, "sku_id", "category")
+    for sku_id, category in zip(sku_ids, categories):
+        cat_pool.setdefault(category, []).append(sku_id)
+
+    table_free = cfg.sku_cnt > cfg.table_free_threshold
 
     cat_sampler = {}
     for cat, sku_ids in cat_pool.items():
         sku_ids_sorted = sorted(sku_ids)
+        if table_free:
+            cat_sampler[cat] = _build_zipf_sampler(len(sku_ids_sorted), beta, ids=sku_ids_sorted)
+            continue
         weights = [1.0 / ((i + 1) ** beta) for i in range(len(sku_ids_sorted))]
-        cat_sampler[cat] = _build_cum_sampler(sku_ids_sorted, weights)
+        cat_sampler[cat] = _build_sampler(sku_ids_sorted, weights, kind)
 
     return cat_sampler
 
@@ -79,55 +237,106 @@ def _build_category_sku_rank_sampler(cfg, rnd, skus):
 # =========================
 # 3) 用户：帕累托 + 复购时间
 # =========================
-def _build_user_sampler(cfg):
+def _build_user_sampler(cfg, kind="cum"):
     """
     Zipf风格用户权重：1/(rank^alpha)
+    user_cnt 超过 cfg.table_free_threshold 时改用无表 Zipf 采样器
     """
     alpha = 1.05
+    if cfg.user_cnt > cfg.table_free_threshold:
+        return _build_zipf_sampler(cfg.user_cnt, alpha)
+
     user_ids = list(range(1, cfg.user_cnt + 1))
     weights = [1.0 / ((i + 1) ** alpha) for i in range(cfg.user_cnt)]
-    return _build_cum_sampler(user_ids, weights)
+    return _build_sampler(user_ids, weights, kind)
+
+
+# (人群, 累计概率上界, 基础复购间隔天数)
+USER_SEGMENTS = (
+    ("heavy", 0.12, 9),
+    ("normal", 0.70, 22),
+    ("light", 1.0, 55),
+)
+
+
+def _pick_user_segment(r, r_jitter):
+    for seg, upper, gap_mu in USER_SEGMENTS:
+        if r < upper:
+            break
+    return seg, max(2, int(gap_mu * (0.7 + r_jitter * 0.6)))
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(x):
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _user_hash_key(seed, uid):
+    return ((seed << 32) ^ uid) & _MASK64
+
+
+class HashedUserProfiles:
+    """
+    无表用户画像：profile 由 (seed, user_id) 哈希现算，常数内存。
+    和 dict 版一样支持 profiles[uid]["gap_mu_days"]。
+    """
+
+    def __init__(self, seed, user_cnt):
+        self.seed = seed
+        self.user_cnt = user_cnt
+
+    def __len__(self):
+        return self.user_cnt
+
+    def __getitem__(self, uid):
+        h1 = _splitmix64(_user_hash_key(self.seed, uid))
+        h2 = _splitmix64(h1)
+        seg, gap_mu = _pick_user_segment((h1 >> 11) * 2.0 ** -53, (h2 >> 11) * 2.0 ** -53)
+        return {"seg": seg, "gap_mu_days": gap_mu}
 
 
 def _build_user_time_profile(cfg, rnd):
     """
     heavy/normal/light 三段人群：决定下单更密集还是更稀疏
+    user_cnt 超过 cfg.table_free_threshold 时改用哈希现算，不建表
     """
+    if cfg.user_cnt > cfg.table_free_threshold:
+        return HashedUserProfiles(cfg.seed, cfg.user_cnt)
+
     profiles = {}
     rnd_random = rnd.random
 
     for uid in range(1, cfg.user_cnt + 1):
         r = rnd_random()
-        if r < 0.12:
-            seg = "heavy"
-            gap_mu = 9
-        elif r < 0.70:
-            seg = "normal"
-            gap_mu = 22
-        else:
-            seg = "light"
-            gap_mu = 55
-
-        gap_mu = max(2, int(gap_mu * (0.7 + rnd_random() * 0.6)))
+        seg, gap_mu = _pick_user_segment(r, rnd_random())
         profiles[uid] = {"seg": seg, "gap_mu_days": gap_mu}
     return profiles
 
 
-def _sample_created_time_for_user(cfg, rnd, user_profiles, uid):
-    now = cfg.base_time
+def _sample_created_minutes_ago(cfg, rnd, user_profiles, uid):
     mu = user_profiles[uid]["gap_mu_days"]
 
     days_ago = rnd.randint(0, min(cfg.days_back, mu * 4))
     minute_offset = rnd.randint(0, 24 * 60 - 1)
-    return now - timedelta(days=days_ago, minutes=minute_offset)
+    return days_ago * 24 * 60 + minute_offset
+
+
+def _sample_created_time_for_user(cfg, rnd, user_profiles, uid):
+    now = cfg.base_time
+    return now - timedelta(minutes=_sample_created_minutes_ago(cfg, rnd, user_profiles, uid))
 
 
 # =========================
 # 4) 为批处理预先准备上下文
 # =========================
 def prepare_order_context(cfg, rnd, shops):
-    shop_sampler = _build_shop_sampler(shops, power=1.15)
-    user_sampler = _build_user_sampler(cfg)
+    shop_sampler = _build_shop_sampler(shops, power=1.15, kind=cfg.sampler_kind)
+    user_sampler = _build_user_sampler(cfg, kind=cfg.sampler_kind)
     user_profiles = _build_user_time_profile(cfg, rnd)
 
     return {
@@ -139,7 +348,7 @@ def prepare_order_context(cfg, rnd, shops):
 
 def prepare_item_context(cfg, rnd, skus):
     sku_map = _build_sku_map(skus)
-    cat_sku_sampler = _build_category_sku_rank_sampler(cfg, rnd, skus)
+    cat_sku_sampler = _build_category_sku_rank_sampler(cfg, rnd, skus, kind=cfg.sampler_kind)
 
     cats = list(cfg.category_buy_weights.keys())
     cat_weights = [cfg.category_buy_weights[c] for c in cats]
@@ -165,13 +374,17 @@ def gen_orders_batch(cfg, rnd, ctx, start_oid, batch_size):
     end_oid = min(start_oid + batch_size, cfg.order_cnt + 1)
 
     sample_one = _sample_one
-    sample_created = _sample_created_time_for_user
+    sample_minutes_ago = _sample_created_minutes_ago
     pick_status = _pick_base_status
 
+    # datetime 模式：base_time - n * timedelta；minute 模式：0 - n * 1
+    origin = time_origin(cfg)
+    unit = time_unit(cfg)
+
     for oid in range(start_oid, end_oid):
         user_id = sample_one(rnd, user_sampler)
         shop_id = sample_one(rnd, shop_sampler)
-        created_time = sample_created(cfg, rnd, user_profiles, user_id)
+        created_time = origin - sample_minutes_ago(cfg, rnd, user_profiles, user_id) * unit
         base_status = pick_status(cfg, rnd)
 
         orders.append({
@@ -300,6 +513,9 @@ def gen_order_items_batch(cfg, rnd, orders, item_ctx, start_order_item_id):
     p_refund_stage_after_pay = cfg.p_refund_stage_after_pay
     p_refund_stage_after_ship = cfg.p_refund_stage_after_ship
 
+    # 时间 + n * unit：datetime 模式 unit 是 timedelta，minute 模式是 1
+    unit = time_unit(cfg)
+
     for o in orders:
         created = o["created_time"]
         total = o["total_amount"]
@@ -325,11 +541,11 @@ def gen_order_items_batch(cfg, rnd, orders, item_ctx, start_order_item_id):
 
         elif status == "CANCELLED":
             delay_min = rnd_randint(cancel_delay_min_min, cancel_delay_max_min)
-            cancel_time = created + timedelta(minutes=delay_min)
+            cancel_time = created + delay_min * unit
 
         elif status == "PAID":
             pay_delay = rnd_randint(pay_delay_min_min, pay_delay_max_min)
-            pay_time = created + timedelta(minutes=pay_delay)
+            pay_time = created + pay_delay * unit
 
             paid = total - discount
             if paid < 0:
@@ -338,13 +554,13 @@ def gen_order_items_batch(cfg, rnd, orders, item_ctx, start_order_item_id):
             shipped = (rnd_random() < p_ship_given_paid)
             if shipped:
                 ship_delay = rnd_randint(ship_delay_min_min, ship_delay_max_min)
-                ship_time = pay_time + timedelta(minutes=ship_delay)
+                ship_time = pay_time + ship_delay * unit
                 o["status"] = "SHIPPED"
 
                 completed = (rnd_random() < p_complete_given_shipped)
                 if completed:
                     comp_delay = rnd_randint(complete_delay_min_min, complete_delay_max_min)
-                    complete_time = ship_time + timedelta(minutes=comp_delay)
+                    complete_time = ship_time + comp_delay * unit
                     o["status"] = "COMPLETED"
 
             if rnd_random() < p_refund_given_paid and paid > 0:
@@ -367,7 +583,7 @@ def gen_order_items_batch(cfg, rnd, orders, item_ctx, start_order_item_id):
                     base_time = complete_time
 
                 rdelay = rnd_randint(refund_delay_min_min, refund_delay_max_min)
-                refund_time = base_time + timedelta(minutes=rdelay)
+                refund_time = base_time + rdelay * unit
 
         else:
             raise ValueError(f"unknown status: {status}")
@@ -0,0 +1,509 @@
+"""
+NumPy 列式引擎：
+整批生成订单 / 明细列（np.ndarray），替代 facts.py 里逐行构造 dict 的循环。
+
+抽样分布与 facts.py 完全一致（同一套累计权重 + searchsorted），
+只是随机数流不同，所以同一个 seed 下两种引擎的数据不会逐行相同。
+"""
+import numpy as np
+
+from facts import HashedUserProfiles, USER_SEGMENTS
+
+
+# =========================
+# 0) 状态编码
+# =========================
+STATUS_NAMES = ("UNPAID", "PAID", "CANCELLED", "SHIPPED", "COMPLETED")
+
+STATUS_UNPAID = 0
+STATUS_PAID = 1
+STATUS_CANCELLED = 2
+STATUS_SHIPPED = 3
+STATUS_COMPLETED = 4
+
+REFUND_TYPE_NAMES = ("NONE", "FULL", "PARTIAL")
+
+REFUND_NONE = 0
+REFUND_FULL = 1
+REFUND_PARTIAL = 2
+
+# 时间列缺失值（对应行模式里的 None）
+NULL_MINUTE = np.iinfo(np.int64).min
+
+
+# =========================
+# 1) facts 采样器 -> 数组
+# =========================
+def sampler_arrays(sampler, prefix):
+    """
+    把 facts._build_sampler 的结果转成扁平数组：
+    - cum  : {prefix}_ids / {prefix}_cum
+    - alias: {prefix}_ids / {prefix}_prob / {prefix}_alias
+    - zipf : {prefix}_zipf = [alpha, h_x1, s_val, n, h_n]（+ {prefix}_ids，rank 不是 id 时）
+    """
+    if sampler["kind"] == "zipf":
+        out = {f"{prefix}_zipf": _zipf_params(sampler)}
+        if sampler["ids"] is not None:
+            out[f"{prefix}_ids"] = np.asarray(sampler["ids"], dtype=np.int64)
+        return out
+
+    out = {f"{prefix}_ids": np.asarray(sampler["ids"], dtype=np.int64)}
+    if sampler["kind"] == "alias":
+        out[f"{prefix}_prob"] = np.asarray(sampler["prob"], dtype=np.float64)
+        out[f"{prefix}_alias"] = np.asarray(sampler["alias"], dtype=np.int64)
+    else:
+        out[f"{prefix}_cum"] = np.asarray(sampler["cum_weights"], dtype=np.float64)
+    return out
+
+
+def _alias_pick(rng, prob, alias, lo, size, n):
+    """
+    别名表批量抽样：格子 i = lo + floor(u * size)，
+    小数部分 < prob[i] 取 i，否则取 alias[i]
+    """
+    u = rng.random(n) * size
+    i = u.astype(np.int64)
+    # 浮点误差兜底：u 恰好等于 size 时不越界
+    np.minimum(i, size - 1, out=i)
+    frac = u - i
+    i += lo
+    np.minimum(i, len(prob) - 1, out=i)
+    return np.where(frac < prob[i], i, alias[i])
+
+
+def _zipf_params(sampler):
+    return np.array([
+        sampler["alpha"],
+        sampler["h_x1"],
+        sampler["s_val"],
+        sampler["n"],
+        sampler["h_n"],
+    ], dtype=np.float64)
+
+
+def _zipf_helper1(x):
+    # log1p(x) / x，x -> 0 时用泰勒展开
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exact = np.log1p(x) / x
+    return np.where(np.abs(x) > 1e-8, exact, 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x)))
+
+
+def _zipf_helper2(x):
+    # expm1(x) / x，x -> 0 时用泰勒展开
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exact = np.expm1(x) / x
+    return np.where(np.abs(x) > 1e-8, exact, 1.0 + x * 0.5 * (1.0 + x * (1.0 / 3.0) * (1.0 + 0.25 * x)))
+
+
+def _zipf_h_integral(x, alpha):
+    log_x = np.log(x)
+    return _zipf_helper2((1.0 - alpha) * log_x) * log_x
+
+
+def _zipf_h_integral_inverse(x, alpha):
+    t = np.maximum(x * (1.0 - alpha), -1.0)
+    return np.exp(_zipf_helper1(t) * x)
+
+
+def zipf_h_n(n, alpha):
+    """每个 n 对应的 H(n + 0.5)，类目内 SKU 的 n 各不相同"""
+    return _zipf_h_integral(np.asarray(n, dtype=np.float64) + 0.5, alpha)
+
+
+def _zipf_ranks(rng, alpha, h_x1, s_val, n, h_n, size):
+    """
+    批量 rejection-inversion：每轮只重抽被拒绝的位置，期望轮数接近 1。
+    n / h_n 可以是标量，也可以是长度为 size 的数组（逐元素不同的 n）。
+    """
+    n = np.broadcast_to(np.asarray(n, dtype=np.float64), (size,))
+    h_n = np.broadcast_to(np.asarray(h_n, dtype=np.float64), (size,))
+
+    out = np.empty(size, dtype=np.int64)
+    todo = np.arange(size)
+
+    while len(todo):
+        hn = h_n[todo]
+        u = hn + rng.random(len(todo)) * (h_x1 - hn)
+        x = _zipf_h_integral_inverse(u, alpha)
+        k = np.clip(np.floor(x + 0.5), 1.0, n[todo])
+        accept = (k - x <= s_val) | (u >= _zipf_h_integral(k + 0.5, alpha) - np.exp(-alpha * np.log(k)))
+        out[todo[accept]] = k[accept].astype(np.int64)
+        todo = todo[~accept]
+
+    return out
+
+
+def sample_arrays(rng, actx, prefix, n):
+    """
+    向量化版 _sample_one：
+    - cum  : bisect_left  <=>  searchsorted(side="left")
+    - alias: 一次均匀数定位格子 + 一次比较
+    - zipf : 批量 rejection-inversion
+    """
+    zipf = actx.get(f"{prefix}_zipf")
+    if zipf is not None:
+        alpha, h_x1, s_val, size, h_n = zipf.tolist()
+        k = _zipf_ranks(rng, alpha, h_x1, s_val, size, h_n, n)
+        ids = actx.get(f"{prefix}_ids")
+        return k if ids is None else ids[k - 1]
+
+    ids = actx[f"{prefix}_ids"]
+    prob = actx.get(f"{prefix}_prob")
+
+    if prob is not None:
+        idx = _alias_pick(rng, prob, actx[f"{prefix}_alias"], 0, len(ids), n)
+        return ids[idx]
+
+    cum_weights = actx[f"{prefix}_cum"]
+    x = rng.random(n) * cum_weights[-1]
+    idx = np.searchsorted(cum_weights, x, side="left")
+    # 浮点误差兜底：x 恰好等于 total 时不越界
+    np.minimum(idx, len(ids) - 1, out=idx)
+    return ids[idx]
+
+
+def sample_many(rng, sampler, n):
+    """
+    直接对 facts 采样器 dict 批量抽 n 个 id（数组缓存在 sampler 上）
+    """
+    arrays = sampler.get("np_arrays")
+    if arrays is None:
+        arrays = sampler_arrays(sampler, "s")
+        sampler["np_arrays"] = arrays
+    return sample_arrays(rng, arrays, "s", n)
+
+
+# =========================
+# 2) 为批处理预先准备数组上下文
+# =========================
+def prepare_order_arrays(cfg, order_ctx):
+    """
+    把 facts.prepare_order_context 的结果转成扁平的数组上下文：
+    - 用户 / 店铺采样器数组（cum 或 alias）
+    - 每个用户的复购间隔 gap_mu_days（下标即 user_id）
+    """
+    actx = {}
+    actx.update(sampler_arrays(order_ctx["user_sampler"], "user"))
+    actx.update(sampler_arrays(order_ctx["shop_sampler"], "shop"))
+
+    user_profiles = order_ctx["user_profiles"]
+    if isinstance(user_profiles, HashedUserProfiles):
+        actx["user_gap_seed"] = np.array([user_profiles.seed], dtype=np.int64)
+        return actx
+
+    user_gap_days = np.zeros(cfg.user_cnt + 1, dtype=np.int32)
+    for uid, p in user_profiles.items():
+        user_gap_days[uid] = p["gap_mu_days"]
+
+    actx["user_gap_days"] = user_gap_days
+    return actx
+
+
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hashed_gap_days(seed, user_id):
+    """
+    facts.HashedUserProfiles 的向量化版本，逐位一致
+    """
+    key = (np.uint64((seed << 32) & ((1 << 64) - 1))) ^ user_id.astype(np.uint64)
+    h1 = _splitmix64(key)
+    h2 = _splitmix64(h1)
+    r = (h1 >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+    r_jitter = (h2 >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+    gap_mu = np.full(len(user_id), USER_SEGMENTS[-1][2], dtype=np.int64)
+    for _, upper, mu in reversed(USER_SEGMENTS[:-1]):
+        gap_mu[r < upper] = mu
+    return np.maximum(2, (gap_mu * (0.7 + r_jitter * 0.6)).astype(np.int64))
+
+
+def prepare_item_arrays(cfg, item_ctx):
+    """
+    把 facts.prepare_item_context 的结果转成扁平的数组上下文。
+
+    各类目的 SKU 累计权重首尾相接拼成一条全局累计数组 cat_sku_cum：
+    类目 c 占 [cat_sku_off[c], cat_sku_off[c+1])，
+    权重区间是 (cat_sku_base[c], cat_sku_base[c] + cat_sku_total[c]]，
+    这样所有明细只需要一次 searchsorted。
+
+    alias 采样器则把各类目的 prob / alias 表首尾相接，
+    alias 下标换算成全局下标（加上 cat_sku_off[c]）。
+
+    无表 Zipf 采样器只保留各类目的 H(n + 0.5)（cat_sku_zipf_hn）和公共参数。
+    """
+    cats = item_ctx["cat_sampler"]["ids"]
+    cat_cum = np.asarray(item_ctx["cat_sampler"]["cum_weights"], dtype=np.float64)
+    cat_sku_sampler = item_ctx["cat_sku_sampler"]
+
+    sku_ids_parts = []
+    sku_cum_parts = []
+    sku_prob_parts = []
+    sku_alias_parts = []
+    zipf = None
+    cat_sku_off = np.zeros(len(cats) + 1, dtype=np.int64)
+    cat_sku_base = np.zeros(len(cats), dtype=np.float64)
+    cat_sku_total = np.zeros(len(cats), dtype=np.float64)
+
+    base = 0.0
+    for i, cat in enumerate(cats):
+        sampler = cat_sku_sampler.get(cat)
+        n = 0
+        if sampler is not None:
+            sku_ids_parts.append(np.asarray(sampler["ids"], dtype=np.int64))
+            if sampler["kind"] == "zipf":
+                zipf = sampler
+            elif sampler["kind"] == "alias":
+                sku_prob_parts.append(np.asarray(sampler["prob"], dtype=np.float64))
+                sku_alias_parts.append(np.asarray(sampler["alias"], dtype=np.int64) + cat_sku_off[i])
+            else:
+                sku_cum_parts.append(np.asarray(sampler["cum_weights"], dtype=np.float64) + base)
+            n = len(sampler["ids"])
+            if zipf is None:
+                cat_sku_base[i] = base
+                cat_sku_total[i] = sampler["total_weight"]
+                base += sampler["total_weight"]
+        cat_sku_off[i + 1] = cat_sku_off[i] + n
+
+    sku_price = np.zeros(cfg.sku_cnt + 1, dtype=np.int64)
+    for sku_id, s in item_ctx["sku_map"].items():
+        sku_price[sku_id] = s["sku_price"]
+
+    actx = {
+        "cat_cum": cat_cum,
+        "cat_sku_ids": np.concatenate(sku_ids_parts) if sku_ids_parts else np.zeros(0, dtype=np.int64),
+        "cat_sku_off": cat_sku_off,
+        "cat_sku_base": cat_sku_base,
+        "cat_sku_total": cat_sku_total,
+        "sku_price": sku_price,
+    }
+    if zipf is not None:
+        alpha = zipf["alpha"]
+        actx["cat_sku_zipf"] = _zipf_params(zipf)[:3]
+        actx["cat_sku_zipf_hn"] = zipf_h_n(np.maximum(np.diff(cat_sku_off), 1), alpha)
+    elif sku_prob_parts:
+        actx["cat_sku_prob"] = np.concatenate(sku_prob_parts)
+        actx["cat_sku_alias"] = np.concatenate(sku_alias_parts)
+    else:
+        actx["cat_sku_cum"] = np.concatenate(sku_cum_parts) if sku_cum_parts else np.zeros(0, dtype=np.float64)
+    return actx
+
+
+def _sample_sku_in_cat(rng, actx, cat, sku_cnt):
+    """
+    按类目抽 SKU（类目内 rank 长尾权重）。
+    类目下没有 SKU 时退化为全局均匀抽样。
+    """
+    m = len(cat)
+    off = actx["cat_sku_off"]
+    lo = off[cat]
+    hi = off[cat + 1] - 1
+
+    if "cat_sku_zipf" in actx:
+        alpha, h_x1, s_val = actx["cat_sku_zipf"].tolist()
+        size = np.maximum(hi - lo + 1, 1)
+        idx = lo + _zipf_ranks(rng, alpha, h_x1, s_val, size, actx["cat_sku_zipf_hn"][cat], m) - 1
+    elif "cat_sku_prob" in actx:
+        size = np.maximum(hi - lo + 1, 1)
+        idx = _alias_pick(rng, actx["cat_sku_prob"], actx["cat_sku_alias"], lo, size, m)
+    else:
+        x = actx["cat_sku_base"][cat] + rng.random(m) * actx["cat_sku_total"][cat]
+        idx = np.searchsorted(actx["cat_sku_cum"], x, side="left")
+    np.clip(idx, lo, np.maximum(hi, lo), out=idx)
+
+    empty = hi < lo
+    if empty.any():
+        idx[empty] = 0
+        sku_id = actx["cat_sku_ids"][idx] if len(actx["cat_sku_ids"]) else np.zeros(m, dtype=np.int64)
+        sku_id[empty] = rng.integers(1, sku_cnt + 1, size=int(empty.sum()), dtype=np.int64)
+        return sku_id
+
+    return actx["cat_sku_ids"][idx]
+
+
+def _dup_in_order_mask(order_idx, sku_id, sku_cnt):
+    """
+    同一订单内重复的 SKU：保留第一次出现，其余标记为 True
+    """
+    key = order_idx * (sku_cnt + 1) + sku_id
+    _, first = np.unique(key, return_index=True)
+    dup = np.ones(len(key), dtype=bool)
+    dup[first] = False
+    return dup
+
+
+# =========================
+# 3) 单批生成 orders（列式）
+# =========================
+def gen_orders_columns(cfg, rng, actx, start_oid, batch_size):
+    """
+    返回列字典：
+    - order_id
+    - user_id
+    - shop_id
+    - created_minute : 相对 cfg.base_time 的分钟偏移（<= 0）
+    - status         : STATUS_NAMES 下标
+    """
+    end_oid = min(start_oid + batch_size, cfg.order_cnt + 1)
+    n = max(end_oid - start_oid, 0)
+
+    order_id = np.arange(start_oid, start_oid + n, dtype=np.int64)
+    user_id = sample_arrays(rng, actx, "user", n)
+    shop_id = sample_arrays(rng, actx, "shop", n)
+
+    # days_ago ~ U[0, min(days_back, gap_mu * 4)]，与 _sample_created_time_for_user 一致
+    if "user_gap_days" in actx:
+        gap = actx["user_gap_days"][user_id].astype(np.int64)
+    else:
+        gap = hashed_gap_days(int(actx["user_gap_seed"][0]), user_id)
+    days_hi = np.minimum(cfg.days_back, gap * 4)
+    days_ago = (rng.random(n) * (days_hi + 1)).astype(np.int64)
+    minute_offset = rng.integers(0, 24 * 60, size=n, dtype=np.int64)
+    created_minute = -(days_ago * (24 * 60) + minute_offset)
+
+    r = rng.random(n)
+    status = np.full(n, STATUS_CANCELLED, dtype=np.uint8)
+    status[r < cfg.p_unpaid + cfg.p_paid] = STATUS_PAID
+    status[r < cfg.p_unpaid] = STATUS_UNPAID
+
+    return {
+        "order_id": order_id,
+        "user_id": user_id,
+        "shop_id": shop_id,
+        "created_minute": created_minute,
+        "status": status,
+    }
+
+
+# =========================
+# 4) 单批生成 items + 回填订单金额/履约（列式）
+# =========================
+def gen_items_columns(cfg, rng, actx, orders, start_order_item_id):
+    """
+    A: 明细
+    - run_len 整批抽取，repeat / cumsum 展开成明细行
+    - 订单内重复 SKU 用数组去重后重抽（最多 30 轮，之后全局均匀兜底）
+    - 价格直接查 sku_price 数组
+
+    B: 生命周期
+    - 支付 / 取消 / 发货 / 完成 / 退款全部用布尔掩码 + 整数分钟偏移计算
+
+    orders 列字典会被原地补全：
+    total_qty / total_amount / discount_amount / paid_amount / refund_amount /
+    pay_minute / cancel_minute / ship_minute / complete_minute / refund_minute /
+    refund_type，以及 status（PAID -> SHIPPED / COMPLETED）
+
+    返回 (items 列字典, next_order_item_id)
+    """
+    n = len(orders["order_id"])
+    sku_cnt = cfg.sku_cnt
+
+    # ===== A: 明细 & 回填 total =====
+    run_len = rng.integers(cfg.runlen_min, cfg.runlen_max + 1, size=n, dtype=np.int64)
+    m = int(run_len.sum())
+    item_start = np.cumsum(run_len) - run_len
+    order_idx = np.repeat(np.arange(n, dtype=np.int64), run_len)
+
+    cat = np.searchsorted(actx["cat_cum"], rng.random(m) * actx["cat_cum"][-1], side="left")
+    np.minimum(cat, len(actx["cat_cum"]) - 1, out=cat)
+    sku_id = _sample_sku_in_cat(rng, actx, cat, sku_cnt)
+
+    dup = _dup_in_order_mask(order_idx, sku_id, sku_cnt)
+    guard = 0
+    while dup.any():
+        pos = np.flatnonzero(dup)
+        if guard >= 30:
+            sku_id[pos] = rng.integers(1, sku_cnt + 1, size=len(pos), dtype=np.int64)
+            break
+        sku_id[pos] = _sample_sku_in_cat(rng, actx, cat[pos], sku_cnt)
+        dup = _dup_in_order_mask(order_idx, sku_id, sku_cnt)
+        guard += 1
+
+    item_qty = rng.integers(cfg.qty_min, cfg.qty_max + 1, size=m, dtype=np.int64)
+    sku_price = actx["sku_price"][sku_id]
+    item_amount = sku_price * item_qty
+
+    if n:
+        total_qty = np.add.reduceat(item_qty, item_start)
+        total = np.add.reduceat(item_amount, item_start)
+    else:
+        total_qty = np.zeros(0, dtype=np.int64)
+        total = np.zeros(0, dtype=np.int64)
+
+    items = {
+        "order_item_id": np.arange(start_order_item_id, start_order_item_id + m, dtype=np.int64),
+        "order_id": orders["order_id"][order_idx],
+        "user_id": orders["user_id"][order_idx],
+        "shop_id": orders["shop_id"][order_idx],
+        "sku_id": sku_id,
+        "item_qty": item_qty,
+        "sku_price": sku_price,
+        "item_amount": item_amount,
+    }
+
+    # ===== B: 回填金额/时间/履约/退款 =====
+    created = orders["created_minute"]
+    status = orders["status"]
+
+    discount_rate = rng.uniform(cfg.discount_rate_min, cfg.discount_rate_max, size=n)
+    discount = np.minimum(np.rint(total * discount_rate).astype(np.int64), total)
+
+    is_cancelled = status == STATUS_CANCELLED
+    is_paid = status == STATUS_PAID
+
+    cancel_delay = rng.integers(cfg.cancel_delay_min_min, cfg.cancel_delay_max_min + 1, size=n, dtype=np.int64)
+    cancel_minute = np.where(is_cancelled, created + cancel_delay, NULL_MINUTE)
+
+    pay_delay = rng.integers(cfg.pay_delay_min_min, cfg.pay_delay_max_min + 1, size=n, dtype=np.int64)
+    pay_minute = np.where(is_paid, created + pay_delay, NULL_MINUTE)
+    paid = np.where(is_paid, np.maximum(total - discount, 0), 0)
+
+    shipped = is_paid & (rng.random(n) < cfg.p_ship_given_paid)
+    ship_delay = rng.integers(cfg.ship_delay_min_min, cfg.ship_delay_max_min + 1, size=n, dtype=np.int64)
+    ship_minute = np.where(shipped, pay_minute + ship_delay, NULL_MINUTE)
+
+    completed = shipped & (rng.random(n) < cfg.p_complete_given_shipped)
+    comp_delay = rng.integers(cfg.complete_delay_min_min, cfg.complete_delay_max_min + 1, size=n, dtype=np.int64)
+    complete_minute = np.where(completed, ship_minute + comp_delay, NULL_MINUTE)
+
+    status = status.copy()
+    status[shipped] = STATUS_SHIPPED
+    status[completed] = STATUS_COMPLETED
+
+    refunded = is_paid & (rng.random(n) < cfg.p_refund_given_paid) & (paid > 0)
+    full = rng.random(n) < cfg.p_refund_full
+    refund_rate = rng.uniform(cfg.refund_rate_min, cfg.refund_rate_max, size=n)
+    partial_amount = np.minimum(np.rint(paid * refund_rate).astype(np.int64), paid)
+
+    refund = np.where(refunded, np.where(full, paid, partial_amount), 0)
+    refund_type = np.full(n, REFUND_NONE, dtype=np.uint8)
+    refund_type[refunded & full] = REFUND_FULL
+    refund_type[refunded & ~full] = REFUND_PARTIAL
+
+    stage_r = rng.random(n)
+    after_pay = (stage_r < cfg.p_refund_stage_after_pay) | ~shipped
+    after_ship = ~after_pay & (
+        (stage_r < cfg.p_refund_stage_after_pay + cfg.p_refund_stage_after_ship) | ~completed
+    )
+    refund_base = np.where(after_pay, pay_minute, np.where(after_ship, ship_minute, complete_minute))
+    refund_delay = rng.integers(cfg.refund_delay_min_min, cfg.refund_delay_max_min + 1, size=n, dtype=np.int64)
+    refund_minute = np.where(refunded, refund_base + refund_delay, NULL_MINUTE)
+
+    orders["status"] = status
+    orders["total_qty"] = total_qty
+    orders["total_amount"] = total
+    orders["discount_amount"] = discount
+    orders["paid_amount"] = paid
+    orders["refund_amount"] = refund
+    orders["pay_minute"] = pay_minute
+    orders["cancel_minute"] = cancel_minute
+    orders["ship_minute"] = ship_minute
+    orders["complete_minute"] = complete_minute
+    orders["refund_minute"] = refund_minute
+    orders["refund_type"] = refund_type
+
+    return items, start_order_item_id + m
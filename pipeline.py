@@ -1,4 +1,8 @@
-from dims import gen_user_dim, gen_shop_dim, gen_sku_dim
+import random
+
+import numpy as np
+
+from dims import gen_user_dim, gen_shop_dim, gen_sku_dim, gen_dims_np
 from facts import (
     gen_orders,
     gen_order_items,
@@ -9,14 +13,31 @@ from facts import (
 )
 
 
-def build_dataset(cfg, rnd):
+ENGINES = ("python", "numpy")
+
+
+def gen_dims(cfg, rnd):
     """
-    全量内存模式：
-    适合 dev / 小数据量调试
+    三张维表：
+    - dim_engine="python": list[dict]，消耗 rnd（默认，输出不变）
+    - dim_engine="numpy" : 分块向量化生成，不消耗 rnd；
+                           users 是流式的 BatchStream，shops / skus 是列式批
     """
+    if cfg.dim_engine == "numpy":
+        return gen_dims_np(cfg)
+
     users = gen_user_dim(cfg, rnd)
     shops = gen_shop_dim(cfg, rnd)
     skus = gen_sku_dim(cfg, rnd)
+    return users, shops, skus
+
+
+def build_dataset(cfg, rnd):
+    """
+    全量内存模式：
+    适合 dev / 小数据量调试
+    """
+    users, shops, skus = gen_dims(cfg, rnd)
 
     orders = gen_orders(cfg, rnd, shops=shops)
     items = gen_order_items(cfg, rnd, orders=orders, skus=skus)
@@ -33,12 +54,10 @@ def build_dataset(cfg, rnd):
 def prepare_stream_context(cfg, rnd):
     """
     流式/批处理模式的上下文初始化：
-    - 维表一次性生成
+    - 维表一次性生成（dim_engine="numpy" 时用户维表是流式的，写出时才生成）
     - 抽样器一次性准备
     """
-    users = gen_user_dim(cfg, rnd)
-    shops = gen_shop_dim(cfg, rnd)
-    skus = gen_sku_dim(cfg, rnd)
+    users, shops, skus = gen_dims(cfg, rnd)
 
     order_ctx = prepare_order_context(cfg, rnd, shops)
     item_ctx = prepare_item_context(cfg, rnd, skus)
@@ -52,42 +71,203 @@ def prepare_stream_context(cfg, rnd):
     }
 
 
-def iter_dataset_batches(cfg, rnd, batch_size):
+def prepare_stream_arrays(cfg, ctx):
+    """
+    numpy 引擎的扁平数组上下文（采样器数组 / sku_price / user_gap_days），
+    多进程时由主进程算一次，经 shm.SharedArrayContext 共享给 worker
+    """
+    from facts_np import prepare_order_arrays, prepare_item_arrays
+
+    actx = prepare_order_arrays(cfg, ctx["order_ctx"])
+    actx.update(prepare_item_arrays(cfg, ctx["item_ctx"]))
+    return actx
+
+
+def _make_batch_fn(cfg, rnd, order_ctx, item_ctx, engine, actx=None):
+    """
+    按引擎返回单批生成函数：
+    fn(start_oid, batch_size, start_order_item_id, rng=None) -> (orders, items, next_order_item_id)
+    rng 为 None 时沿用整条流共享的随机数（legacy），否则用传入的分块随机数
+    - python: facts.gen_orders_batch + gen_order_items_batch 逐行生成
+    - numpy : facts_np 整批列式生成 orders / items / 生命周期，
+              产出 batch.OrderBatch / ItemBatch（不构造 dict）
+              传入 actx（已准备好的数组上下文）时不再需要 order_ctx / item_ctx
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine: {engine}")
+
+    if engine == "python":
+        def gen(start_oid, batch_size, start_order_item_id, rng=None):
+            batch_rnd = rnd if rng is None else rng
+            batch_orders = gen_orders_batch(
+                cfg=cfg,
+                rnd=batch_rnd,
+                ctx=order_ctx,
+                start_oid=start_oid,
+                batch_size=batch_size,
+            )
+            batch_items, next_order_item_id = gen_order_items_batch(
+                cfg=cfg,
+                rnd=batch_rnd,
+                orders=batch_orders,
+                item_ctx=item_ctx,
+                start_order_item_id=start_order_item_id,
+            )
+            return batch_orders, batch_items, next_order_item_id
+        return gen
+
+    from facts_np import gen_orders_columns, gen_items_columns
+    from batch import OrderBatch, ItemBatch
+
+    if actx is None:
+        actx = prepare_stream_arrays(cfg, {"order_ctx": order_ctx, "item_ctx": item_ctx})
+    stream_rng = np.random.default_rng(rnd.getrandbits(64))
+
+    def gen(start_oid, batch_size, start_order_item_id, rng=None):
+        batch_rng = stream_rng if rng is None else rng
+        order_cols = gen_orders_columns(cfg, batch_rng, actx, start_oid, batch_size)
+        item_cols, next_order_item_id = gen_items_columns(
+            cfg, batch_rng, actx, order_cols, start_order_item_id
+        )
+        return (
+            OrderBatch.from_columns(cfg, order_cols),
+            ItemBatch.from_columns(cfg, item_cols),
+            next_order_item_id,
+        )
+    return gen
+
+
+# =========================
+# 分块随机数（rng_mode="chunk"）
+# =========================
+def chunk_seed_sequence(cfg, chunk_index):
+    """
+    第 chunk_index 块订单的随机数种子：只取决于 (seed, chunk_index)，
+    与 worker 数、调度顺序、batch_size 都无关
+    """
+    return np.random.SeedSequence(cfg.seed, spawn_key=(chunk_index,))
+
+
+def chunk_rng(cfg, chunk_index, engine):
+    ss = chunk_seed_sequence(cfg, chunk_index)
+    if engine == "numpy":
+        return np.random.Generator(np.random.PCG64(ss))
+    return random.Random(int.from_bytes(ss.generate_state(4).tobytes(), "little"))
+
+
+def chunk_bounds(cfg, chunk_index):
+    """
+    第 chunk_index 块的订单区间 [start_oid, end_oid]
+    """
+    start_oid = chunk_index * cfg.chunk_size + 1
+    end_oid = min(start_oid + cfg.chunk_size - 1, cfg.order_cnt)
+    return start_oid, end_oid
+
+
+def chunk_first_order_item_id(cfg, start_oid):
+    """
+    每块的 order_item_id 从 (start_oid - 1) * runlen_max + 1 开始：
+    块与块之间不重叠、可独立计算（块间会留空号）
+    """
+    return (start_oid - 1) * cfg.runlen_max + 1
+
+
+def _take_order_range(orders, items, chunk_start, lo, hi):
+    """
+    从整块结果里截取订单区间 [lo, hi]（只在区间没有对齐块边界时用到）
+    """
+    orders = orders[lo - chunk_start:hi - chunk_start + 1]
+
+    if isinstance(items, list):
+        items = [it for it in items if lo <= it["order_id"] <= hi]
+    else:
+        item_oids = items["order_id"]
+        items = items.take((item_oids >= lo) & (item_oids <= hi))
+
+    return orders, items
+
+
+def _iter_chunk_batches(cfg, gen_batch, engine, start_oid, end_oid):
+    """
+    rng_mode="chunk"：按固定大小的订单块生成，每块一条独立随机数流。
+    区间没对齐块边界时，整块生成后再截取，保证结果逐位一致。
+    batch 边界即块边界（batch_size 不起作用，内存由 cfg.chunk_size 决定）。
+    """
+    first_chunk = (start_oid - 1) // cfg.chunk_size
+    last_chunk = (end_oid - 1) // cfg.chunk_size
+
+    for chunk_index in range(first_chunk, last_chunk + 1):
+        chunk_start, chunk_end = chunk_bounds(cfg, chunk_index)
+        first_item_id = chunk_first_order_item_id(cfg, chunk_start)
+
+        batch_orders, batch_items, next_order_item_id = gen_batch(
+            chunk_start,
+            chunk_end - chunk_start + 1,
+            first_item_id,
+            rng=chunk_rng(cfg, chunk_index, engine),
+        )
+
+        lo = max(start_oid, chunk_start)
+        hi = min(end_oid, chunk_end)
+        if lo != chunk_start or hi != chunk_end:
+            batch_orders, batch_items = _take_order_range(
+                batch_orders, batch_items, chunk_start, lo, hi
+            )
+
+        yield {
+            "orders": batch_orders,
+            "items": batch_items,
+            "start_oid": lo,
+            "end_oid": hi,
+            "chunk_index": chunk_index,
+            "next_order_item_id": next_order_item_id,
+        }
+
+
+def _chunk_mode_context(cfg):
+    """
+    rng_mode="chunk"：维表 / 抽样器只由 seed 决定，任何进程重算都一致
+    """
+    return prepare_stream_context(cfg, random.Random(cfg.seed))
+
+
+def iter_dataset_batches(cfg, rnd, batch_size, engine="python", ctx=None):
     """
     批处理模式：
     按 batch 逐批产出 orders / items
 
+    engine:
+    - "python": 逐行生成（默认）
+    - "numpy" : orders / items / 生命周期整批向量化生成
+
     返回的每个 batch 结构：
     {
-        "orders": [...],
-        "items": [...],
+        "orders": [...] 或 OrderBatch（numpy 引擎）,
+        "items": [...] 或 ItemBatch（numpy 引擎）,
         "start_oid": ...,
         "end_oid": ...,
     }
+
+    ctx: 已经准备好的 prepare_stream_context 结果（可选，避免重复生成维表）；
+         带 "actx" 时（ctxcache.prepare_cached_context）numpy 引擎直接用数组上下文
     """
-    ctx = prepare_stream_context(cfg, rnd)
+    if ctx is None:
+        ctx = _chunk_mode_context(cfg) if cfg.rng_mode == "chunk" else prepare_stream_context(cfg, rnd)
+    gen_batch = _make_batch_fn(cfg, rnd, ctx["order_ctx"], ctx["item_ctx"], engine, actx=ctx.get("actx"))
+
+    if cfg.rng_mode == "chunk":
+        yield from _iter_chunk_batches(cfg, gen_batch, engine, 1, cfg.order_cnt)
+        return
 
     order_item_id = 1
     total_orders = cfg.order_cnt
 
     for start_oid in range(1, total_orders + 1, batch_size):
-        batch_orders = gen_orders_batch(
-            cfg=cfg,
-            rnd=rnd,
-            ctx=ctx["order_ctx"],
-            start_oid=start_oid,
-            batch_size=batch_size,
+        batch_orders, batch_items, order_item_id = gen_batch(
+            start_oid, batch_size, order_item_id
         )
 
-        batch_items, order_item_id = gen_order_items_batch(
-            cfg=cfg,
-            rnd=rnd,
-            orders=batch_orders,
-            item_ctx=ctx["item_ctx"],
-            start_order_item_id=order_item_id,
-        )
-
-        end_oid = batch_orders[-1]["order_id"] if batch_orders else start_oid - 1
+        end_oid = start_oid + len(batch_orders) - 1
 
         yield {
             "orders": batch_orders,
@@ -106,38 +286,43 @@ def iter_dataset_batches_range(
     order_ctx=None,
     item_ctx=None,
     start_order_item_id=1,
+    engine="python",
+    actx=None,
 ):
     """
     只生成指定订单区间 [start_oid, end_oid]
     给多进程 worker 使用
+
+    actx: numpy 引擎的数组上下文（如共享内存挂载的视图），
+    传入时跳过 prepare_stream_context
+
+    rng_mode="chunk" 时按块生成，结果与区间怎么切分无关，
+    start_order_item_id 不起作用（明细 id 由块号决定）
     """
-    if order_ctx is None or item_ctx is None:
-        ctx = prepare_stream_context(cfg, rnd)
+    if actx is not None:
+        if engine != "numpy":
+            raise ValueError("actx requires engine='numpy'")
+    elif order_ctx is None or item_ctx is None:
+        ctx = _chunk_mode_context(cfg) if cfg.rng_mode == "chunk" else prepare_stream_context(cfg, rnd)
         order_ctx = ctx["order_ctx"]
         item_ctx = ctx["item_ctx"]
 
+    gen_batch = _make_batch_fn(cfg, rnd, order_ctx, item_ctx, engine, actx=actx)
+
+    if cfg.rng_mode == "chunk":
+        yield from _iter_chunk_batches(cfg, gen_batch, engine, start_oid, end_oid)
+        return
+
     next_order_item_id = start_order_item_id
 
     for current_start in range(start_oid, end_oid + 1, batch_size):
         current_batch_size = min(batch_size, end_oid - current_start + 1)
 
-        batch_orders = gen_orders_batch(
-            cfg=cfg,
-            rnd=rnd,
-            ctx=order_ctx,
-            start_oid=current_start,
-            batch_size=current_batch_size,
-        )
-
-        batch_items, next_order_item_id = gen_order_items_batch(
-            cfg=cfg,
-            rnd=rnd,
-            orders=batch_orders,
-            item_ctx=item_ctx,
-            start_order_item_id=next_order_item_id,
+        batch_orders, batch_items, next_order_item_id = gen_batch(
+            current_start, current_batch_size, next_order_item_id
         )
 
-        current_end = batch_orders[-1]["order_id"] if batch_orders else current_start - 1
+        current_end = current_start + len(batch_orders) - 1
 
         yield {
             "orders": batch_orders,
@@ -148,6 +333,90 @@ def iter_dataset_batches_range(
         }
 
 
+# =========================
+# Arrow RecordBatch 接口（进程内消费：DuckDB / Polars / Spark）
+# =========================
+DIM_TABLE_KEYS = {
+    "ods_user_dim": "users",
+    "ods_shop_dim": "shops",
+    "ods_sku_dim": "skus",
+}
+
+FACT_TABLE_KEYS = {
+    "ods_orders": "orders",
+    "ods_order_items": "items",
+}
+
+
+def _iter_table_rows(cfg, table, rnd, batch_size, engine, ctx):
+    if table in DIM_TABLE_KEYS:
+        if ctx is None:
+            # 只要维表时不准备抽样器；维表与 prepare_stream_context 里生成的完全一致
+            users, shops, skus = gen_dims(cfg, rnd)
+            ctx = {"users": users, "shops": shops, "skus": skus}
+        yield ctx[DIM_TABLE_KEYS[table]]
+        return
+
+    key = FACT_TABLE_KEYS[table]
+    for batch in iter_dataset_batches(cfg, rnd, batch_size, engine=engine, ctx=ctx):
+        yield batch[key]
+
+
+def iter_table_batches(cfg, table="ods_orders", rnd=None, batch_size=None, engine="numpy", ctx=None):
+    """
+    只生成某一张 ODS 表，按批产出（list[dict] / ColumnBatch；维表可能整表一个 BatchStream）
+
+    rnd 为 None 时按 run_once_stream 的随机数消耗顺序来（legacy 模式先准备一次维表上下文），
+    数据与同样参数的 run_once_stream 写出的文件一致；batch_size 默认 cfg.batch_size
+    """
+    if table not in DIM_TABLE_KEYS and table not in FACT_TABLE_KEYS:
+        raise ValueError(f"unknown table: {table}")
+
+    if rnd is None:
+        rnd = random.Random(cfg.seed)
+        if table in FACT_TABLE_KEYS and ctx is None and cfg.rng_mode == "legacy":
+            prepare_stream_context(cfg, rnd)
+
+    batch_size = cfg.batch_size if batch_size is None else batch_size
+
+    yield from _iter_table_rows(cfg, table, rnd, batch_size, engine, ctx)
+
+
+def iter_record_batches(cfg, table="ods_orders", rnd=None, batch_size=None, engine="numpy", ctx=None):
+    """
+    按批产出某张 ODS 表的 pyarrow.RecordBatch（需要 pyarrow）：
+    - 事实表每个生成批一个 RecordBatch，维表按块（dim_engine="numpy"）或整表一个
+    - numpy 引擎 / 向量化维表：整数列和编码列直接包装 numpy 数组（零拷贝），
+      编码列是字典类型，时间列是 timestamp[ms]（NULL_MINUTE -> null）
+    - schema 见 exporter_arrow.native_arrow_schema，与写出的 Arrow IPC 文件相同
+    - rnd / batch_size 的含义同 iter_table_batches
+    """
+    from exporter_arrow import native_arrow_schema, iter_column_batches, to_record_batch
+
+    if table not in DIM_TABLE_KEYS and table not in FACT_TABLE_KEYS:
+        raise ValueError(f"unknown table: {table}")
+
+    schema = native_arrow_schema(cfg, table)
+
+    for rows in iter_table_batches(cfg, table, rnd, batch_size, engine, ctx):
+        for batch in iter_column_batches(cfg, table, rows):
+            yield to_record_batch(batch, schema)
+
+
+def record_batch_reader(cfg, table="ods_orders", **kwargs):
+    """
+    iter_record_batches 包成 pyarrow.RecordBatchReader，
+    可以直接交给 duckdb.from_arrow / polars.from_arrow 之类按流读取
+    """
+    import pyarrow as pa
+    from exporter_arrow import native_arrow_schema
+
+    return pa.RecordBatchReader.from_batches(
+        native_arrow_schema(cfg, table),
+        iter_record_batches(cfg, table, **kwargs),
+    )
+
+
 def build_dataset_stream_meta(cfg, rnd):
     """
     给流式模式提供元信息：
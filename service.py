@@ -1,24 +1,67 @@
+import glob
+import json
 import os
 import random
+import sys
 from collections import Counter
 from multiprocessing import Pool
 
+import numpy as np
+
+from batch import ColumnBatch, iter_rows
+from facts_np import STATUS_NAMES
 from config import Config
+from timefmt import minute_time_base
 from pipeline import (
     build_dataset,
     prepare_stream_context,
     iter_dataset_batches,
     iter_dataset_batches_range,   # 需要你按我下面给的版本补到 pipeline.py
+    iter_table_batches,
+    prepare_stream_arrays,
 )
 from exporter import (
     export_csv,
-    init_csv,
-    append_csv,
+    CsvSink,
+    PartitionedCsvSink,
+    BucketSpillSink,
+    created_days,
+    item_days,
+    bucket_ids,
+    bucket_filename,
+    sort_bucket,
     ODS_SCHEMA,
+    OUTPUT_FORMATS,
+    PARQUET_COMPRESSIONS,
+    CSV_COMPRESSIONS,
+    PARTITION_BY,
+    BUCKET_BY,
+    DB_FILES,
+    DDL_STORED_AS,
+    O_BINARY,
+    csv_filename,
+    compress_bytes,
+    table_part_path,
+    reset_table_dir,
+    remove_table_dir,
+    write_table_manifest,
     write_hive_ddl,
+    write_hive_msck,
     pack_ods_zip,
 )
 from check import check_head_item_consistency
+from shm import SharedArrayContext, attach_arrays
+from ctxcache import ContextCache, prepare_cached_context
+from topk import merge_id_counters, new_id_counter
+from checkpoint import (
+    ChunkCheckpoint,
+    STATS_COUNTERS,
+    chunk_stats_path,
+    file_checksum,
+    load_chunk_counters,
+    run_fingerprint,
+    save_chunk_counters,
+)
 
 
 # =========================
@@ -57,7 +100,7 @@ def run_once(mode="dev", overrides=None, do_export=True, sample_n=200):
 
     export_info = None
     if do_export:
-        ods_dir = export_ods_full(ds, out_dir="out/ods")
+        ods_dir = export_ods_full(ds, out_dir="out/ods", time_base=minute_time_base(cfg))
         ddl_path = write_hive_ddl("out/hive_ods_ddl.sql", database="dw_ods")
         zip_path = pack_ods_zip(ods_dir)
         export_info = {"ods_dir": ods_dir, "ddl_path": ddl_path, "zip_path": zip_path}
@@ -81,21 +124,542 @@ def run_once(mode="dev", overrides=None, do_export=True, sample_n=200):
     }
 
 
-def export_ods_full(ds, out_dir="out/ods"):
+def export_ods_full(ds, out_dir="out/ods", time_base=None):
     """
     给 run_once 用的全量导出
     """
     os.makedirs(out_dir, exist_ok=True)
 
-    export_csv(ds["users"], os.path.join(out_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"])
+    export_csv(ds["users"], os.path.join(out_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"], time_base=time_base)
     export_csv(ds["shops"], os.path.join(out_dir, "ods_shop_dim.csv"), ODS_SCHEMA["ods_shop_dim"])
     export_csv(ds["skus"], os.path.join(out_dir, "ods_sku_dim.csv"), ODS_SCHEMA["ods_sku_dim"])
-    export_csv(ds["orders"], os.path.join(out_dir, "ods_orders.csv"), ODS_SCHEMA["ods_orders"])
+    export_csv(ds["orders"], os.path.join(out_dir, "ods_orders.csv"), ODS_SCHEMA["ods_orders"], time_base=time_base)
     export_csv(ds["items"], os.path.join(out_dir, "ods_order_items.csv"), ODS_SCHEMA["ods_order_items"])
 
     return out_dir
 
 
+# =========================
+# 流式统计（list[dict] 和列式批通用）
+# =========================
+PAID_STATUSES = ("PAID", "SHIPPED", "COMPLETED")
+
+
+def _new_stats(cfg):
+    # Top 统计用定长、可合并的计数器（topk.py），不随出现过的 ID 数增长
+    return {
+        "status_dist": Counter(),
+        "refund_paid": 0,
+        "paid_cnt": 0,
+        "top_users": new_id_counter(cfg.user_cnt),
+        "top_shops": new_id_counter(cfg.shop_cnt),
+        "top_skus": new_id_counter(cfg.sku_cnt),
+    }
+
+
+def top10_error(stats):
+    """
+    top10_* 里次数的误差上界：0 为精确；heavy hitter 摘要时真实次数在 [count, count + error] 内
+    """
+    return {
+        "users": stats["top_users"].error,
+        "shops": stats["top_shops"].error,
+        "skus": stats["top_skus"].error,
+    }
+
+
+def _update_stats(stats, orders, items):
+    if isinstance(orders, ColumnBatch):
+        status_cnt = np.bincount(orders["status"], minlength=len(STATUS_NAMES)).tolist()
+        stats["status_dist"].update({
+            name: c for name, c in zip(STATUS_NAMES, status_cnt) if c
+        })
+
+        stats["refund_paid"] += int(np.count_nonzero(
+            (orders["paid_amount"] > 0) & (orders["refund_amount"] > 0)
+        ))
+        stats["paid_cnt"] += sum(
+            c for name, c in zip(STATUS_NAMES, status_cnt) if name in PAID_STATUSES
+        )
+
+        stats["top_users"].update(orders["user_id"])
+        stats["top_shops"].update(orders["shop_id"])
+        stats["top_skus"].update(items["sku_id"])
+        return
+
+    stats["status_dist"].update(o["status"] for o in orders)
+
+    stats["refund_paid"] += sum(
+        1
+        for o in orders
+        if o.get("paid_amount", 0) > 0 and o.get("refund_amount", 0) > 0
+    )
+
+    stats["paid_cnt"] += sum(
+        1 for o in orders if o["status"] in PAID_STATUSES
+    )
+
+    stats["top_users"].update(o["user_id"] for o in orders)
+    stats["top_shops"].update(o["shop_id"] for o in orders)
+    stats["top_skus"].update(it["sku_id"] for it in items)
+
+
+def _collect_sample(sample_orders, sample_items, orders, items, sample_n):
+    """
+    抽样前 sample_n 个订单及其明细（行模式），给一致性校验用
+    """
+    if len(sample_orders) < sample_n:
+        need = sample_n - len(sample_orders)
+        sample_orders.extend(iter_rows(orders[:need]))
+
+    if len(sample_items) >= sample_n * 5:
+        return
+
+    sampled_ids = {o["order_id"] for o in sample_orders}
+
+    if isinstance(items, ColumnBatch):
+        items = items.take(np.isin(items["order_id"], list(sampled_ids)))
+
+    for it in iter_rows(items):
+        if it["order_id"] in sampled_ids:
+            sample_items.append(it)
+            if len(sample_items) >= sample_n * 5:
+                break
+
+
+def merge_chunk_stats(results):
+    """
+    多个 chunk 的局部统计 -> (订单数, 明细数, 与 _new_stats 同结构的合计)
+    """
+    stats = {"status_dist": Counter(), "refund_paid": 0, "paid_cnt": 0}
+    total_orders = 0
+    total_items = 0
+
+    for r in results:
+        total_orders += r["rows"]["orders"]
+        total_items += r["rows"]["items"]
+
+        stats["status_dist"].update(r["status_dist"])
+        stats["refund_paid"] += r["refund_paid"]
+        stats["paid_cnt"] += r["paid_cnt"]
+
+    for name in STATS_COUNTERS:
+        stats[name] = merge_id_counters(r[name] for r in results)
+
+    return total_orders, total_items, stats
+
+
+# =========================
+# 上下文准备（可选磁盘缓存）
+# =========================
+def _open_context_cache(cache_dir, engine):
+    if cache_dir is None:
+        return None
+    if engine != "numpy":
+        raise ValueError("cache_dir requires engine='numpy'")
+    return ContextCache(cache_dir)
+
+
+def prepare_context(cfg, rnd, cache):
+    """
+    cache 为 None 时就是 prepare_stream_context；
+    否则走 ctxcache（维表是列式批，带 numpy 数组上下文 "actx"）
+    """
+    if cache is None:
+        return prepare_stream_context(cfg, rnd)
+    return prepare_cached_context(cfg, rnd, cache)
+
+
+# =========================
+# 输出格式（csv / parquet / arrow）
+# =========================
+FACT_TABLES = ("ods_orders", "ods_order_items")
+
+# 分桶导出的 spill 目录：{BUCKET_SPILL_DIR}/{table}/bucket-XXXXX/part-XXX.csv
+BUCKET_SPILL_DIR = "out/ods_spill"
+
+
+DIM_TABLES = (
+    ("ods_user_dim", "users"),
+    ("ods_shop_dim", "shops"),
+    ("ods_sku_dim", "skus"),
+)
+
+
+def validate_output_options(
+    output_format,
+    parquet_compression,
+    csv_compression,
+    merge_parts=True,
+    partition_by=None,
+    bucket_by=None,
+    buckets=None,
+):
+    """
+    校验并打包输出参数（主进程和 worker 共用）：
+    {
+        "format": "csv" / "parquet" / "arrow",
+        "parquet_compression": ...,
+        "csv_compression": None / "gzip" / "zstd",
+        "merge_parts": 多进程 CSV 是否合并成单文件,
+        "partition_by": None / "dt"（事实表按订单创建日分区，仅 CSV）,
+        "bucket_by": None / "user_id" / "shop_id"（事实表分桶，仅 CSV）,
+        "buckets": 桶数,
+    }
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {list(OUTPUT_FORMATS)}")
+    if parquet_compression not in PARQUET_COMPRESSIONS:
+        raise ValueError(f"parquet_compression must be one of {list(PARQUET_COMPRESSIONS)}")
+    if csv_compression not in CSV_COMPRESSIONS:
+        raise ValueError(f"csv_compression must be one of {list(CSV_COMPRESSIONS)}")
+    if csv_compression is not None and output_format != "csv":
+        raise ValueError("csv_compression requires output_format='csv'")
+    if partition_by not in PARTITION_BY:
+        raise ValueError(f"partition_by must be one of {list(PARTITION_BY)}")
+    if partition_by is not None and output_format != "csv":
+        raise ValueError("partition_by requires output_format='csv'")
+    if bucket_by not in BUCKET_BY:
+        raise ValueError(f"bucket_by must be one of {list(BUCKET_BY)}")
+    if bucket_by is None and buckets is not None:
+        raise ValueError("buckets requires bucket_by")
+    if bucket_by is not None:
+        if output_format != "csv":
+            raise ValueError("bucket_by requires output_format='csv'")
+        if partition_by is not None:
+            raise ValueError("bucket_by cannot be combined with partition_by")
+        if not isinstance(buckets, int) or buckets <= 0:
+            raise ValueError("buckets must be a positive int")
+
+    return {
+        "format": output_format,
+        "parquet_compression": parquet_compression,
+        "csv_compression": csv_compression,
+        "merge_parts": merge_parts,
+        "partition_by": partition_by,
+        "bucket_by": bucket_by,
+        "buckets": buckets,
+    }
+
+
+def _table_dirs(out):
+    """
+    True : 一张表一个目录（{ods_dir}/{table}/part-XXX.* + _manifest.json），Hive / Spark 直接读目录
+    False: 一张表一个 CSV 文件（{ods_dir}/{table}.csv[.gz|.zst]），或数据库格式（不写表文件）
+    按天分区时事实表是 {ods_dir}/{table}/dt=YYYY-MM-DD/part-XXX.csv，
+    分桶时是 {ods_dir}/{table}/000000_0.csv ...，维表同样一表一目录
+    """
+    if out["format"] in DB_FILES:
+        return False
+    return (
+        out["format"] != "csv"
+        or not out["merge_parts"]
+        or out["partition_by"] is not None
+        or out["bucket_by"] is not None
+    )
+
+
+def csv_path(ods_dir, table, out):
+    return os.path.join(ods_dir, csv_filename(table, out["csv_compression"]))
+
+
+def prepare_output_layout(ods_dir, out, keep_tables=()):
+    """
+    写之前清掉与这次格式 / 布局不符的旧输出（上一次的 .csv / .csv.gz / .csv.zst / 表目录 / 数据库文件），
+    避免被一起打包或被 Hive 读到；表目录布局时顺便清空并建好目录（worker 启动前只做一次）
+    keep_tables 里的表目录不清空（续跑时保留已完成 chunk 写好的文件）
+    """
+    table_dirs = _table_dirs(out)
+    csv_files = out["format"] == "csv" and not table_dirs
+
+    for table in ODS_SCHEMA:
+        for compression in CSV_COMPRESSIONS:
+            if csv_files and compression == out["csv_compression"]:
+                continue
+            path = os.path.join(ods_dir, csv_filename(table, compression))
+            if os.path.exists(path):
+                os.remove(path)
+
+        if table_dirs:
+            if table in keep_tables:
+                os.makedirs(os.path.join(ods_dir, table), exist_ok=True)
+            else:
+                reset_table_dir(ods_dir, table)
+        else:
+            remove_table_dir(ods_dir, table)
+
+    # 这次要写的数据库文件由 exporter_db 重新建库
+    for output_format, filename in DB_FILES.items():
+        path = os.path.join(ods_dir, filename)
+        if output_format != out["format"] and os.path.exists(path):
+            os.remove(path)
+
+
+def _open_database(cfg, out, ods_dir):
+    """
+    数据库格式（sqlite / duckdb）返回 exporter_db.OdsDatabase，其他格式返回 None
+    """
+    if out["format"] not in DB_FILES:
+        return None
+
+    # sqlite3 / duckdb 只有写数据库时才需要
+    from exporter_db import open_ods_database, ods_database_path
+
+    return open_ods_database(out["format"], ods_database_path(ods_dir, out["format"]), cfg)
+
+
+def _open_sink(cfg, out, table, path, time_base, header=True):
+    """
+    - csv    : CsvSink（csv_compression 不为 None 时边写边压缩）
+    - parquet: ParquetSink，每批一个 row group
+    - arrow  : ArrowIpcSink，每批一个 record batch
+    """
+    if out["format"] == "csv":
+        return CsvSink(path, ODS_SCHEMA[table], time_base=time_base, header=header, compression=out["csv_compression"])
+
+    # pyarrow 只有写 Parquet / Arrow 时才需要
+    from exporter_arrow import open_table_sink
+
+    return open_table_sink(out["format"], path, table, cfg, compression=out["parquet_compression"])
+
+
+def _part_path(ods_dir, table, out, part=0):
+    return table_part_path(ods_dir, table, out["format"], part, out["csv_compression"])
+
+
+def _manifest_part(sink, **extra):
+    return {"file": os.path.basename(sink.filepath), **sink.stats(), **extra}
+
+
+def _sink_parts(sink, **extra):
+    """
+    一个写出端在 manifest 里的条目：分区 / 分桶写出端每个文件一条，其他一条
+    """
+    if isinstance(sink, (PartitionedCsvSink, BucketSpillSink)):
+        return [{**p, **extra} for p in sink.partitions()]
+    return [_manifest_part(sink, **extra)]
+
+
+def _sink_files(sink):
+    """
+    一个写出端写出的全部文件路径（分区 / 分桶写出端每组一个文件）
+    """
+    if isinstance(sink, (PartitionedCsvSink, BucketSpillSink)):
+        return [os.path.join(sink.filepath, p["file"]) for p in sink.partitions()]
+    return [sink.filepath]
+
+
+def _write_manifest(ods_dir, table, out, parts):
+    # Arrow IPC 写出时不压缩（见 open_table_sink），只有 csv / parquet 记压缩方式
+    compression = {
+        "csv": out["csv_compression"],
+        "parquet": out["parquet_compression"],
+    }.get(out["format"])
+    partitioned = out["partition_by"] is not None and table in FACT_TABLES
+    return write_table_manifest(
+        ods_dir,
+        table,
+        parts,
+        format=out["format"],
+        compression=compression,
+        header=out["format"] == "csv",
+        columns=ODS_SCHEMA[table],
+        partition_by=out["partition_by"] if partitioned else None,
+        **_bucket_meta(out, table),
+    )
+
+
+def _bucket_meta(out, table):
+    if out["bucket_by"] is None or table not in FACT_TABLES:
+        return {}
+    return {"bucket_by": out["bucket_by"], "buckets": out["buckets"], "sorted_by": out["bucket_by"]}
+
+
+def export_dim_tables(cfg, ctx, ods_dir, time_base, out, db=None):
+    for table, key in DIM_TABLES:
+        if db is not None:
+            with db.table_sink(table) as sink:
+                sink.write(ctx[key])
+            continue
+
+        if _table_dirs(out):
+            path = _part_path(ods_dir, table, out)
+        else:
+            path = csv_path(ods_dir, table, out)
+
+        with _open_sink(cfg, out, table, path, time_base) as sink:
+            sink.write(ctx[key])
+
+        if _table_dirs(out):
+            _write_manifest(ods_dir, table, out, [_manifest_part(sink)])
+
+
+def _open_fact_sinks(cfg, out, time_base, ods_dir, parts_dir=None, part=0, db=None):
+    """
+    返回 (orders_sink, items_sink)，路径按布局决定：
+    - 数据库格式：db.table_sink（直接插入 db 里的表）
+    - 按天分区：PartitionedCsvSink，写 {ods_dir}/{table}/dt=YYYY-MM-DD/part-{part:03d}.csv[.gz|.zst]
+    - 分桶：BucketSpillSink，写 spill 文件 {BUCKET_SPILL_DIR}/{table}/bucket-XXXXX/part-{part:03d}.csv，
+      每段写出都是有序 run，之后由 _sort_bucket_tables 多路归并成最终的桶文件
+    - 表目录布局：{ods_dir}/{table}/part-{part:03d}.*（worker 直接写最终位置，不合并）
+    - 单文件布局，单进程：{ods_dir}/{table}.csv[.gz|.zst]
+    - 单文件布局，多进程：{parts_dir}/{table}_part_{part:03d}.csv[.gz|.zst]，主进程再合并；
+      压缩的 part 不带表头（合并时按字节拼接，表头单独压缩写在最前面）
+    """
+    if db is not None:
+        return tuple(db.table_sink(table) for table in FACT_TABLES)
+
+    if out["partition_by"] is not None:
+        return tuple(
+            PartitionedCsvSink(
+                os.path.join(ods_dir, table),
+                ODS_SCHEMA[table],
+                cfg.base_time,
+                part=part,
+                time_base=time_base,
+                compression=out["csv_compression"],
+            )
+            for table in FACT_TABLES
+        )
+
+    if out["bucket_by"] is not None:
+        return tuple(
+            BucketSpillSink(
+                os.path.join(BUCKET_SPILL_DIR, table),
+                ODS_SCHEMA[table],
+                out["bucket_by"],
+                part=part,
+                time_base=time_base,
+            )
+            for table in FACT_TABLES
+        )
+
+    header = True
+    paths = []
+
+    for table in FACT_TABLES:
+        if _table_dirs(out):
+            paths.append(_part_path(ods_dir, table, out, part))
+        elif parts_dir is None:
+            paths.append(csv_path(ods_dir, table, out))
+        else:
+            ext = CSV_COMPRESSIONS[out["csv_compression"]]
+            paths.append(os.path.join(parts_dir, f"{table}_part_{part:03d}.csv{ext}"))
+            header = out["csv_compression"] is None
+
+    return tuple(
+        _open_sink(cfg, out, table, path, time_base, header=header)
+        for table, path in zip(FACT_TABLES, paths)
+    )
+
+
+def _write_fact_batch(cfg, out, orders_sink, items_sink, orders, items):
+    """
+    按天分区时先算每行的分区日（明细跟着所属订单走），再交给分区写出端；
+    分桶时算每行的桶号
+    """
+    if out["bucket_by"] is not None:
+        orders_sink.write(orders, bucket_ids(orders, out["bucket_by"], out["buckets"]))
+        items_sink.write(items, bucket_ids(items, out["bucket_by"], out["buckets"]))
+        return
+
+    if out["partition_by"] is None:
+        orders_sink.write(orders)
+        items_sink.write(items)
+        return
+
+    order_days = created_days(orders, cfg.base_time)
+    orders_sink.write(orders, order_days)
+    items_sink.write(items, item_days(items, orders, order_days))
+
+
+def write_ods_ddl(out):
+    """
+    Arrow IPC 没有对应的 Hive 存储格式，不生成建表语句
+    """
+    if out["format"] not in DDL_STORED_AS:
+        return None
+    return write_hive_ddl(
+        "out/hive_ods_ddl.sql",
+        database="dw_ods",
+        stored_as=DDL_STORED_AS[out["format"]],
+        partitioned=out["partition_by"] is not None,
+        bucket_by=out["bucket_by"],
+        buckets=out["buckets"],
+    )
+
+
+# =========================
+# 分桶：spill -> 每桶拼接排序
+# =========================
+def _sort_bucket_task(args):
+    spill_runs, final_path, table, bucket_by, compression = args
+    return sort_bucket(spill_runs, final_path, ODS_SCHEMA[table], bucket_by, compression)
+
+
+def _spill_runs(spill):
+    """
+    一个 spill 条目 -> [(路径, 偏移, 字节数)]，每段是一个有序 run
+    """
+    runs = []
+    offset = 0
+    for length in spill["runs"]:
+        runs.append((spill["path"], offset, length))
+        offset += length
+    return runs
+
+
+def _sort_bucket_tables(ods_dir, out, spills, map_fn=map):
+    """
+    spills: {table: [BucketSpillSink.partitions() 的条目（可来自多个 worker）]}
+    每个桶一个任务（map_fn 可以是 Pool.map，多个桶并行排序），
+    返回 {table: [manifest 条目]}，桶号从 0 到 buckets-1 全都有
+    """
+    keys = []
+    tasks = []
+
+    for table in FACT_TABLES:
+        by_bucket = {}
+        for p in spills[table]:
+            by_bucket.setdefault(p["bucket"], []).extend(_spill_runs(p))
+
+        for bucket in range(out["buckets"]):
+            filename = bucket_filename(bucket, out["csv_compression"])
+            keys.append((table, bucket, filename))
+            tasks.append((
+                sorted(by_bucket.get(bucket, [])),
+                os.path.join(ods_dir, table, filename),
+                table,
+                out["bucket_by"],
+                out["csv_compression"],
+            ))
+
+    parts = {table: [] for table in FACT_TABLES}
+    for (table, bucket, filename), r in zip(keys, map_fn(_sort_bucket_task, tasks)):
+        parts[table].append({"file": filename, "bucket": bucket, **r})
+
+    return parts
+
+
+def _remove_spills(spills):
+    paths = [p["path"] for table_spills in spills.values() for p in table_spills]
+    cleanup_files(paths)
+    for path in sorted({os.path.dirname(p) for p in paths}):
+        cleanup_dir_if_empty(path)
+    for table in FACT_TABLES:
+        cleanup_dir_if_empty(os.path.join(BUCKET_SPILL_DIR, table))
+    cleanup_dir_if_empty(BUCKET_SPILL_DIR)
+
+
+def _write_ods_msck(out):
+    """
+    按天分区时额外生成 MSCK REPAIR 脚本（登记 dt 分区）
+    """
+    if out["partition_by"] is None:
+        return None
+    return write_hive_msck("out/hive_ods_msck.sql", database="dw_ods")
+
+
 # =========================
 # 原有：单进程流式模式
 # =========================
@@ -106,20 +670,55 @@ def run_once_stream(
     do_export=True,
     sample_n=200,
     progress_callback=None,
+    engine="python",
+    cache_dir=None,
+    output_format="csv",
+    parquet_compression="snappy",
+    csv_compression=None,
+    pack_zip=True,
+    partition_by=None,
+    bucket_by=None,
+    buckets=None,
 ):
     """
     批处理模式：
     - 分批生成 orders / items
     - 边生成边写 CSV
     - 支持进度回调（给 API / 网页用）
+    - engine="numpy" 时订单和明细整批向量化生成
+    - cache_dir 不为 None 时（仅 numpy 引擎）维表 / 抽样器走磁盘缓存，输出不变
+    - output_format="parquet" 时改写 {ods_dir}/{table}/part-000.parquet（每批一个 row group），
+      parquet_compression 为压缩算法，建表语句是 STORED AS PARQUET
+    - output_format="arrow" 时改写 {ods_dir}/{table}/part-000.arrow（Arrow IPC，可 mmap），不生成建表语句
+    - csv_compression="gzip" / "zstd" 时 CSV 边写边压缩（.csv.gz / .csv.zst）
+    - pack_zip=False 时不打 ods.zip（压缩过的文件打包时原样存入，不再压一遍）
+    - partition_by="dt" 时（仅 CSV）订单 / 明细按订单创建日写
+      {ods_dir}/{table}/dt=YYYY-MM-DD/part-000.csv，建表语句带 PARTITIONED BY (dt STRING)，
+      另生成 MSCK REPAIR 脚本
+    - bucket_by="user_id" / "shop_id" + buckets=N 时（仅 CSV）订单 / 明细先按桶号写 spill，
+      生成完后每个桶拼接、按 (bucket_by, 主键) 排序，写成 {ods_dir}/{table}/000000_0.csv ... 共 N 个文件，
+      建表语句带 CLUSTERED BY ... SORTED BY ... INTO N BUCKETS
+    - output_format="sqlite" / "duckdb" 时不写表文件，五张表直接批量插入本地数据库
+      {ods_dir}/ods.sqlite | ods.duckdb（每次重新建库），全部写完后才建索引，不生成建表语句
     """
+    out = validate_output_options(
+        output_format,
+        parquet_compression,
+        csv_compression,
+        partition_by=partition_by,
+        bucket_by=bucket_by,
+        buckets=buckets,
+    )
+
     cfg = Config(mode=mode, **(overrides or {}))
     rnd = random.Random(cfg.seed)
+    time_base = minute_time_base(cfg)
+    cache = _open_context_cache(cache_dir, engine)
 
     # ============================
     # 1 初始化 pipeline 上下文
     # ============================
-    ctx = prepare_stream_context(cfg, rnd)
+    ctx = prepare_context(cfg, rnd, cache)
 
     users = ctx["users"]
     shops = ctx["shops"]
@@ -131,87 +730,95 @@ def run_once_stream(
     # ============================
     # 2 导出维表
     # ============================
-    export_csv(users, os.path.join(ods_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"])
-    export_csv(shops, os.path.join(ods_dir, "ods_shop_dim.csv"), ODS_SCHEMA["ods_shop_dim"])
-    export_csv(skus, os.path.join(ods_dir, "ods_sku_dim.csv"), ODS_SCHEMA["ods_sku_dim"])
-
-    # ============================
-    # 3 初始化事实表 CSV
-    # ============================
-    orders_path = os.path.join(ods_dir, "ods_orders.csv")
-    items_path = os.path.join(ods_dir, "ods_order_items.csv")
-
-    init_csv(orders_path, ODS_SCHEMA["ods_orders"])
-    init_csv(items_path, ODS_SCHEMA["ods_order_items"])
-
-    # ============================
-    # 4 统计器
-    # ============================
-    cnt = Counter()
-    refund_paid = 0
-    paid_cnt = 0
-
-    top_users = Counter()
-    top_shops = Counter()
-    top_skus = Counter()
-
-    sample_orders = []
-    sample_items = []
-
-    total_orders = cfg.order_cnt
-    total_items = 0
-
-    # ============================
-    # 5 分批生成
-    # ============================
-    for batch in iter_dataset_batches(cfg, rnd, batch_size):
-        orders = batch["orders"]
-        items = batch["items"]
-
-        # 写入 CSV
-        append_csv(orders, orders_path, ODS_SCHEMA["ods_orders"])
-        append_csv(items, items_path, ODS_SCHEMA["ods_order_items"])
-
-        total_items += len(items)
-
-        # ======== 实时统计 ========
-        cnt.update(o["status"] for o in orders)
-
-        refund_paid += sum(
-            1
-            for o in orders
-            if o.get("paid_amount", 0) > 0 and o.get("refund_amount", 0) > 0
-        )
-
-        paid_cnt += sum(
-            1 for o in orders if o["status"] in ("PAID", "SHIPPED", "COMPLETED")
-        )
-
-        top_users.update(o["user_id"] for o in orders)
-        top_shops.update(o["shop_id"] for o in orders)
-        top_skus.update(it["sku_id"] for it in items)
-
-        # ======== 抽样校验 ========
-        if len(sample_orders) < sample_n:
-            need = sample_n - len(sample_orders)
-            sample_orders.extend(orders[:need])
-
-        sampled_ids = {o["order_id"] for o in sample_orders}
-
-        if len(sample_items) < sample_n * 5:
-            for it in items:
-                if it["order_id"] in sampled_ids:
-                    sample_items.append(it)
-                    if len(sample_items) >= sample_n * 5:
-                        break
-
-        # ======== 进度 ========
-        done = batch["end_oid"]
-        msg = f"{done}/{total_orders}, items={total_items}"
-        print(f"[progress] {msg}")
+    prepare_output_layout(ods_dir, out)
+    db = _open_database(cfg, out, ods_dir)
+    try:
+        export_dim_tables(cfg, ctx, ods_dir, time_base, out, db=db)
+
+        # ============================
+        # 3 初始化事实表写出端
+        # ============================
+        # 整个 run 只打开一次，不再逐批 open / close
+        orders_sink, items_sink = _open_fact_sinks(cfg, out, time_base, ods_dir, db=db)
+
+        # ============================
+        # 4 统计器
+        # ============================
+        stats = _new_stats(cfg)
+
+        sample_orders = []
+        sample_items = []
+
+        total_orders = cfg.order_cnt
+        total_items = 0
+
+        # ============================
+        # 5 分批生成
+        # ============================
+        # chunk 模式复用上面导出维表用的上下文；legacy 模式保持原有的随机数消耗顺序
+        # （legacy + 缓存：第二次准备的 rnd 状态不同，单独占一条缓存）
+        if cfg.rng_mode == "chunk":
+            stream_ctx = ctx
+        elif cache is not None:
+            stream_ctx = prepare_context(cfg, rnd, cache)
+        else:
+            stream_ctx = None
+
+        with orders_sink, items_sink:
+            for batch in iter_dataset_batches(cfg, rnd, batch_size, engine=engine, ctx=stream_ctx):
+                orders = batch["orders"]
+                items = batch["items"]
+
+                # 写入 CSV / Parquet / Arrow
+                _write_fact_batch(cfg, out, orders_sink, items_sink, orders, items)
+
+                total_items += len(items)
+
+                # ======== 实时统计 ========
+                _update_stats(stats, orders, items)
+
+                # ======== 抽样校验 ========
+                _collect_sample(sample_orders, sample_items, orders, items, sample_n)
+
+                # ======== 进度 ========
+                done = batch["end_oid"]
+                msg = f"{done}/{total_orders}, items={total_items}"
+                print(f"[progress] {msg}")
+
+                if progress_callback:
+                    progress_callback(done, total_orders, total_items)
+    except BaseException:
+        # 失败时不提交，尽快释放连接（DuckDB 文件锁）
+        if db is not None:
+            db.abort()
+        raise
+
+    out_bytes = {
+        "orders": orders_sink.bytes_written,
+        "items": items_sink.bytes_written,
+    }
 
-        if progress_callback:
-            progress_callback(done, total_orders, total_items)
+    if db is not None:
+        # 全部写完：提交并建索引
+        db.close()
+        out_bytes = {"database": os.path.getsize(db.path)}
+    elif out["bucket_by"] is not None:
+        spills = {
+            "ods_orders": _sink_parts(orders_sink),
+            "ods_order_items": _sink_parts(items_sink),
+        }
+        bucket_parts = _sort_bucket_tables(ods_dir, out, spills)
+        _remove_spills(spills)
+
+        _write_manifest(ods_dir, "ods_orders", out, bucket_parts["ods_orders"])
+        _write_manifest(ods_dir, "ods_order_items", out, bucket_parts["ods_order_items"])
+        out_bytes = {
+            "orders": sum(p["bytes"] for p in bucket_parts["ods_orders"]),
+            "items": sum(p["bytes"] for p in bucket_parts["ods_order_items"]),
+        }
+    elif _table_dirs(out):
+        _write_manifest(ods_dir, "ods_orders", out, _sink_parts(orders_sink))
+        _write_manifest(ods_dir, "ods_order_items", out, _sink_parts(items_sink))
 
     # ============================
     # 6 校验
@@ -229,12 +836,15 @@ def run_once_stream(
     export_info = None
 
     if do_export:
-        ddl_path = write_hive_ddl("out/hive_ods_ddl.sql", database="dw_ods")
-        zip_path = pack_ods_zip(ods_dir)
+        ddl_path = write_ods_ddl(out)
+        msck_path = _write_ods_msck(out)
+        zip_path = pack_ods_zip(ods_dir) if pack_zip else None
 
         export_info = {
             "ods_dir": ods_dir,
             "ddl_path": ddl_path,
+            "msck_path": msck_path,
+            "db_path": db.path if db is not None else None,
             "zip_path": zip_path,
         }
 
@@ -250,20 +860,113 @@ def run_once_stream(
             "orders": total_orders,
             "items": total_items,
         },
-        "status_dist": dict(cnt),
-        "paid_ratio": round(paid_cnt / max(total_orders, 1), 6),
-        "refund_ratio_in_paid": round(refund_paid / max(paid_cnt, 1), 6),
-        "top10_users": top_users.most_common(10),
-        "top10_shops": top_shops.most_common(10),
-        "top10_skus": top_skus.most_common(10),
+        "bytes": out_bytes,
+        "status_dist": dict(stats["status_dist"]),
+        "paid_ratio": round(stats["paid_cnt"] / max(total_orders, 1), 6),
+        "refund_ratio_in_paid": round(stats["refund_paid"] / max(stats["paid_cnt"], 1), 6),
+        "top10_users": stats["top_users"].most_common(10),
+        "top10_shops": stats["top_shops"].most_common(10),
+        "top10_skus": stats["top_skus"].most_common(10),
+        "top10_error": top10_error(stats),
         "export": export_info,
     }
 
 
+# =========================
+# 单表流式输出（stdout / 命名管道）
+# =========================
+# 输出到管道时攒够这么多字节就写出，下游尽早开始读
+STREAM_FLUSH_BYTES = 1024 * 1024
+
+
+def stream_table(
+    table,
+    out_path="-",
+    mode="prod",
+    overrides=None,
+    batch_size=50000,
+    engine="python",
+    header=True,
+    csv_compression=None,
+    progress_callback=None,
+):
+    """
+    只生成一张表，边生成边把 CSV 写到 stdout（out_path="-"）或命名管道 / 文件，
+    不落任何中间文件，给 psql \\copy / clickhouse-local / LOAD DATA 直接读：
+    - 数据与同样参数的 run_once_stream 写出的 {table}.csv 逐字节一致
+    - 订单和明细不能共用一条管道，一次只输出一张表
+    - 每批生成完立即写出，不等整表
+    - csv_compression="gzip" / "zstd" 时输出压缩流
+    - progress_callback(rows_written) 每批调用一次
+    """
+    if table not in ODS_SCHEMA:
+        raise ValueError(f"table must be one of {list(ODS_SCHEMA)}")
+    if csv_compression not in CSV_COMPRESSIONS:
+        raise ValueError(f"csv_compression must be one of {list(CSV_COMPRESSIONS)}")
+
+    cfg = Config(mode=mode, **(overrides or {}))
+    time_base = minute_time_base(cfg)
+
+    if out_path == "-":
+        # 之前 print 过的内容先刷出去，之后直接写描述符，不经过 sys.stdout 的缓冲
+        sys.stdout.flush()
+        fd = sys.stdout.fileno()
+        display_path = "<stdout>"
+    else:
+        fd = None
+        display_path = out_path
+
+    sink = CsvSink(
+        display_path,
+        ODS_SCHEMA[table],
+        time_base=time_base,
+        flush_bytes=STREAM_FLUSH_BYTES,
+        header=header,
+        compression=csv_compression,
+        fd=fd,
+    )
+
+    with sink:
+        for rows in iter_table_batches(cfg, table, batch_size=batch_size, engine=engine):
+            sink.write(rows)
+            sink.flush()
+
+            if progress_callback:
+                progress_callback(sink.rows_written)
+
+    return {
+        "table": table,
+        "path": display_path,
+        "rows": sink.rows_written,
+        "bytes": sink.bytes_written,
+    }
+
+
 # =========================
 # 多进程工具函数
 # =========================
-def _split_order_ranges(total_orders, workers):
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+HEADER_PROBE_SIZE = 64 * 1024
+
+
+def _split_order_ranges(total_orders, workers, align=1):
+    """
+    align > 1 时区间边界对齐到 align 的整数倍（rng_mode="chunk" 按块对齐，
+    避免同一块被两个 worker 重复生成）
+    """
+    if align > 1:
+        # 按块数均分，余数分给前几个 worker
+        n_blocks = -(-total_orders // align)
+        ranges = []
+        block = 0
+        for i in range(workers):
+            cnt = n_blocks // workers + (1 if i < n_blocks % workers else 0)
+            start = block * align + 1
+            end = min((block + cnt) * align, total_orders)
+            ranges.append((start, end))
+            block += cnt
+        return ranges
+
     ranges = []
     chunk = total_orders // workers
     start = 1
@@ -278,21 +981,157 @@ def _split_order_ranges(total_orders, workers):
     return ranges
 
 
-def _merge_csv_files(part_files, final_file):
-    os.makedirs(os.path.dirname(final_file), exist_ok=True)
+def chunk_ranges(cfg, chunks):
+    """
+    订单切成最多 chunks 个区间（去掉空区间）；rng_mode="chunk" 时边界对齐到 cfg.chunk_size
+    """
+    align = cfg.chunk_size if cfg.rng_mode == "chunk" else 1
+    return [
+        (start_oid, end_oid)
+        for start_oid, end_oid in _split_order_ranges(cfg.order_cnt, min(chunks, cfg.order_cnt), align=align)
+        if start_oid <= end_oid
+    ]
+
+
+def _pread(fd, size, offset):
+    """
+    os.pread 只有 Unix 有；其他平台退回 lseek + read（fd 都是这里自己打开的，改读位置无妨）
+    """
+    pread = getattr(os, "pread", None)
+    if pread is not None:
+        return pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def _copy_file_range(fd_in, fd_out, offset, count):
+    """
+    fd_in 的 [offset, offset + count) 追加到 fd_out 的当前位置，返回实际拷贝的字节数：
+    1) os.copy_file_range：内核内拷贝（部分文件系统直接 reflink）
+    2) os.sendfile：内核内拷贝，不经过用户态
+    3) 大块读 / 写（_pread）
+    前一种不可用（平台不支持 / 跨文件系统 / 文件系统不支持）时从已拷贝的位置接着用下一种
+    """
+    end = offset + count
+    start = offset
+
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            while offset < end:
+                n = copy_file_range(fd_in, fd_out, end - offset, offset_src=offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError:
+            pass
+
+    sendfile = getattr(os, "sendfile", None)
+    if sendfile is not None and offset < end:
+        try:
+            while offset < end:
+                n = sendfile(fd_out, fd_in, offset, min(end - offset, COPY_BUFFER_SIZE))
+                if n == 0:
+                    break
+                offset += n
+        except OSError:
+            pass
+
+    while offset < end:
+        chunk = _pread(fd_in, min(end - offset, COPY_BUFFER_SIZE), offset)
+        if not chunk:
+            break
+        with memoryview(chunk) as view:
+            pos = 0
+            while pos < len(view):
+                pos += os.write(fd_out, view[pos:])
+        offset += len(chunk)
+
+    return offset - start
+
+
+def _header_length(fd):
+    """
+    第一行（含换行符）的字节数；没有换行符时整个文件都算表头
+    """
+    pos = 0
+    while True:
+        head = _pread(fd, HEADER_PROBE_SIZE, pos)
+        if not head:
+            return pos
+        idx = head.find(b"\n")
+        if idx >= 0:
+            return pos + idx + 1
+        pos += len(head)
+
+
+def _append_file(fd_out, path, skip_header=False):
+    fd_in = os.open(path, os.O_RDONLY | O_BINARY)
+    try:
+        size = os.fstat(fd_in).st_size
+        start = _header_length(fd_in) if skip_header else 0
+        _copy_file_range(fd_in, fd_out, start, size - start)
+    finally:
+        os.close(fd_in)
+
+
+def _copy_file(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+    try:
+        _append_file(fd_out, src)
+    finally:
+        os.close(fd_out)
+
+
+class PartAssembler:
+    """
+    chunk 的 part 文件乱序完成，按 chunk_id 顺序字节级拼接成最终文件：
+    - 先写表头（压缩时单独压缩成一个 gzip member / zstd frame）
+    - 不压缩的 part 带表头，按字节偏移跳过后拷贝；压缩的 part 不带表头，原样拼上
+    - add() 收到 part 后，只要前面的 chunk 都已到齐就立即拼接，
+      拼接与其余 chunk 的生成重叠，不等全部结束
+    - part 文件不删（断点续跑时要用它们重新拼接），由调用方在整个 run 成功后清理
+    """
+
+    def __init__(self, final_file, fieldnames, compression=None):
+        os.makedirs(os.path.dirname(final_file), exist_ok=True)
+
+        self.final_file = final_file
+        self._skip_header = compression is None
+        self._pending = {}
+        self._next = 0
+
+        header = (",".join(fieldnames) + "\n").encode("utf-8")
+        if compression is not None:
+            header = compress_bytes(header, compression)
 
-    first_file = True
-    with open(final_file, "w", encoding="utf-8", newline="") as fout:
-        for path in sorted(part_files):
-            with open(path, "r", encoding="utf-8") as fin:
-                for idx, line in enumerate(fin):
-                    if not first_file and idx == 0:
-                        continue
-                    fout.write(line)
-            first_file = False
+        self._fd = os.open(final_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+        os.write(self._fd, header)
 
+    def add(self, chunk_id, path):
+        self._pending[chunk_id] = path
 
-def _cleanup_files(paths):
+        while self._next in self._pending:
+            part = self._pending.pop(self._next)
+            _append_file(self._fd, part, skip_header=self._skip_header)
+            self._next += 1
+
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cleanup_files(paths):
     for path in paths:
         try:
             if os.path.exists(path):
@@ -301,7 +1140,7 @@ def _cleanup_files(paths):
             pass
 
 
-def _cleanup_dir_if_empty(path):
+def cleanup_dir_if_empty(path):
     try:
         if os.path.isdir(path) and not os.listdir(path):
             os.rmdir(path)
@@ -310,104 +1149,146 @@ def _cleanup_dir_if_empty(path):
 
 
 # =========================
-# 多进程 worker
+# 多进程 worker（每个进程初始化一次，之后循环领 chunk）
 # =========================
-def _stream_worker(args):
+# 不指定 chunks 时每个 worker 平均分到这么多个 chunk
+CHUNKS_PER_WORKER = 8
+
+# 进程内常驻：配置 + 维表 / 抽样器上下文，由 init_chunk_worker 填充
+_CHUNK_WORKER = {}
+
+
+def init_chunk_worker(mode, overrides, engine, shared_meta, cache_dir):
     """
-    每个 worker 负责一个订单区间：
-    - 独立初始化随机数
-    - 独立生成 part CSV
+    Pool 的 initializer：每个进程只准备一次上下文，之后的 chunk 都复用：
+    - shared_meta 不为 None 时挂载主进程发布的共享数组上下文
+    - 否则用 Random(cfg.seed) 准备（与主进程导出的维表一致）；
+      numpy 引擎顺便把数组上下文也算好，不在每个 chunk 里重算
+    """
+    cfg = Config(mode=mode, **(overrides or {}))
+
+    state = {
+        "cfg": cfg,
+        "time_base": minute_time_base(cfg),
+        "engine": engine,
+        "order_ctx": None,
+        "item_ctx": None,
+        "actx": None,
+        "shm": None,
+    }
+
+    if shared_meta is not None:
+        state["shm"], state["actx"] = attach_arrays(shared_meta)
+    else:
+        ctx = prepare_context(cfg, random.Random(cfg.seed), _open_context_cache(cache_dir, engine))
+        state["order_ctx"] = ctx["order_ctx"]
+        state["item_ctx"] = ctx["item_ctx"]
+        state["actx"] = ctx.get("actx")
+        if engine == "numpy" and state["actx"] is None:
+            state["actx"] = prepare_stream_arrays(cfg, ctx)
+
+    _CHUNK_WORKER.clear()
+    _CHUNK_WORKER.update(state)
+
+
+def generate_chunk(args):
+    """
+    一个 chunk 负责一个订单区间：
+    - 写自己的 part 文件（part 号 = chunk_id）
     - 返回局部统计
+    - rng_mode="chunk" 时随机数按块派生，输出与 chunk 怎么切、由哪个进程跑都无关；
+      legacy 模式下每个 chunk 用 Random(seed + chunk_id)，输出只取决于 chunk 切分
     """
     (
-        worker_id,
-        mode,
-        overrides,
+        chunk_id,
         batch_size,
         start_oid,
         end_oid,
         parts_dir,
+        out,
+        ods_dir,
     ) = args
 
-    cfg = Config(mode=mode, **(overrides or {}))
-    rnd = random.Random(cfg.seed + worker_id)
-
-    ctx = prepare_stream_context(cfg, rnd)
+    w = _CHUNK_WORKER
+    cfg = w["cfg"]
+    rnd = random.Random(cfg.seed + chunk_id)
 
-    orders_path = os.path.join(parts_dir, f"ods_orders_part_{worker_id:03d}.csv")
-    items_path = os.path.join(parts_dir, f"ods_order_items_part_{worker_id:03d}.csv")
+    # 表目录布局：直接写最终目录下自己的 part 文件，不需要合并
+    # 压缩 CSV：在本进程里边写边压缩，主进程只做字节拼接
+    orders_sink, items_sink = _open_fact_sinks(cfg, out, w["time_base"], ods_dir, parts_dir=parts_dir, part=chunk_id)
 
-    init_csv(orders_path, ODS_SCHEMA["ods_orders"])
-    init_csv(items_path, ODS_SCHEMA["ods_order_items"])
-
-    cnt = Counter()
-    refund_paid = 0
-    paid_cnt = 0
-
-    top_users = Counter()
-    top_shops = Counter()
-    top_skus = Counter()
+    stats = _new_stats(cfg)
 
     total_orders_done = 0
     total_items = 0
 
-    # 给每个 worker 一个独立的大号 item id 段，避免重复
-    start_order_item_id_base = worker_id * 10_000_000_000 + 1
+    # 给每个 chunk 一个独立的大号 item id 段，避免重复
+    start_order_item_id_base = chunk_id * 10_000_000_000 + 1
     next_order_item_id = start_order_item_id_base
 
-    for batch in iter_dataset_batches_range(
+    batches = iter_dataset_batches_range(
         cfg=cfg,
         rnd=rnd,
         batch_size=batch_size,
         start_oid=start_oid,
         end_oid=end_oid,
-        order_ctx=ctx["order_ctx"],
-        item_ctx=ctx["item_ctx"],
+        order_ctx=w["order_ctx"],
+        item_ctx=w["item_ctx"],
         start_order_item_id=next_order_item_id,
-    ):
-        orders = batch["orders"]
-        items = batch["items"]
+        engine=w["engine"],
+        actx=w["actx"],
+    )
 
-        append_csv(orders, orders_path, ODS_SCHEMA["ods_orders"])
-        append_csv(items, items_path, ODS_SCHEMA["ods_order_items"])
+    with orders_sink, items_sink:
+        for batch in batches:
+            orders = batch["orders"]
+            items = batch["items"]
 
-        total_orders_done += len(orders)
-        total_items += len(items)
+            _write_fact_batch(cfg, out, orders_sink, items_sink, orders, items)
 
-        next_order_item_id = batch["next_order_item_id"]
+            total_orders_done += len(orders)
+            total_items += len(items)
 
-        cnt.update(o["status"] for o in orders)
+            next_order_item_id = batch["next_order_item_id"]
 
-        refund_paid += sum(
-            1
-            for o in orders
-            if o.get("paid_amount", 0) > 0 and o.get("refund_amount", 0) > 0
-        )
+            _update_stats(stats, orders, items)
 
-        paid_cnt += sum(
-            1 for o in orders if o["status"] in ("PAID", "SHIPPED", "COMPLETED")
-        )
-
-        top_users.update(o["user_id"] for o in orders)
-        top_shops.update(o["shop_id"] for o in orders)
-        top_skus.update(it["sku_id"] for it in items)
+    # 断点续跑用：记下这个 chunk 写出的每个文件的大小 / crc32，计数器另存
+    files = {
+        path: file_checksum(path)
+        for path in _sink_files(orders_sink) + _sink_files(items_sink)
+    }
+    stats_path = chunk_stats_path(parts_dir, chunk_id)
+    save_chunk_counters(stats_path, stats)
 
-        print(f"[worker-{worker_id}] {batch['end_oid']}/{end_oid}, items={total_items}")
+    print(f"[chunk-{chunk_id}] pid={os.getpid()} {start_oid}-{end_oid}, items={total_items}", file=sys.stderr)
 
     return {
-        "worker_id": worker_id,
-        "orders_path": orders_path,
-        "items_path": items_path,
+        "chunk_id": chunk_id,
+        "start_oid": start_oid,
+        "end_oid": end_oid,
+        "orders_path": orders_sink.filepath,
+        "items_path": items_sink.filepath,
         "rows": {
             "orders": total_orders_done,
             "items": total_items,
         },
-        "status_dist": dict(cnt),
-        "refund_paid": refund_paid,
-        "paid_cnt": paid_cnt,
-        "top_users": dict(top_users),
-        "top_shops": dict(top_shops),
-        "top_skus": dict(top_skus),
+        "bytes": {
+            "orders": orders_sink.bytes_written,
+            "items": items_sink.bytes_written,
+        },
+        "parts": {
+            "orders": _sink_parts(orders_sink, start_oid=start_oid, end_oid=end_oid),
+            "items": _sink_parts(items_sink, start_oid=start_oid, end_oid=end_oid),
+        },
+        "status_dist": dict(stats["status_dist"]),
+        "refund_paid": stats["refund_paid"],
+        "paid_cnt": stats["paid_cnt"],
+        "top_users": stats["top_users"],
+        "top_shops": stats["top_shops"],
+        "top_skus": stats["top_skus"],
+        "files": files,
+        "stats_path": stats_path,
     }
 
 
@@ -421,21 +1302,81 @@ def run_once_stream_parallel(
     do_export=True,
     workers=6,
     keep_parts=False,
+    engine="python",
+    share_ctx=False,
+    cache_dir=None,
+    output_format="csv",
+    parquet_compression="snappy",
+    csv_compression=None,
+    pack_zip=True,
+    merge_parts=True,
+    partition_by=None,
+    bucket_by=None,
+    buckets=None,
+    chunks=None,
+    resume=False,
 ):
     """
     多进程流式模式：
     - 维表主进程一次性导出
-    - 订单按区间切分给多个 worker
-    - 每个 worker 生成自己的 part 文件
-    - 主进程最终合并 CSV
+    - 订单切成 chunks 个小区间（默认 workers * CHUNKS_PER_WORKER），
+      进程池按 imap_unordered 动态派发：先做完的进程继续领下一个 chunk，
+      个别进程被抢占 / 慢核只拖慢它手上的那一个 chunk
+    - 每个进程只初始化一次上下文（init_chunk_worker），每个 chunk 写自己的 part 文件
+    - 主进程按 chunk_id 顺序（即订单 id 顺序）拼接 CSV，前面的 chunk 到齐就拼，不等全部结束
+    - engine 透传给每个 worker（"python" / "numpy"）
+    - rng_mode="chunk" 时输出与 workers / chunks 都无关（按块派生随机数，chunk 边界对齐到 cfg.chunk_size）；
+      legacy 模式下输出取决于 chunks，与 workers 无关
+    - share_ctx=True（仅 numpy 引擎）：主进程准备一次数组上下文放进共享内存，
+      worker 零拷贝挂载，不再各自重建维表 / 抽样器。
+      chunk 模式下输出与 share_ctx=False 逐字节一致；
+      legacy 模式下 worker 的订单随机数不再经过维表生成，输出会变（但与导出的维表一致）
+    - cache_dir 不为 None 时（仅 numpy 引擎）主进程和各 worker 的上下文都走磁盘缓存
+    - output_format="parquet" / "arrow" 时每个 chunk 写 {ods_dir}/{table}/part-{chunk_id:03d}.parquet|arrow，
+      不再合并（目录即表）
+    - csv_compression="gzip" / "zstd" 时每个 chunk 在自己的进程里压缩 part，
+      主进程只做字节拼接（gzip member / zstd frame 可以直接首尾相接）
+    - pack_zip=False 时不打 ods.zip
+    - merge_parts=False 时 CSV 也不合并：每个 chunk 写 {ods_dir}/{table}/part-{chunk_id:03d}.csv[.gz|.zst]
+      （每个 part 都带表头），维表同样一表一目录；每个表目录写 _manifest.json 记录各 part 的行数 / 字节数
+    - 合并只在字节层面做：跳过 part 表头的字节偏移后用 copy_file_range / sendfile 拷贝
+    - partition_by="dt" 时（仅 CSV）每个 chunk 写 {ods_dir}/{table}/dt=YYYY-MM-DD/part-{chunk_id:03d}.csv，
+      不合并；manifest 每个分区文件一条。文件数 = chunks * 天数，所以此时 chunks 默认等于 workers
+    - bucket_by / buckets 时（仅 CSV）每个 chunk 按桶号写自己的 spill 文件，
+      全部 chunk 结束后同一个进程池按桶并行：按 chunk 顺序拼接该桶的 spill、排序、写最终桶文件
+    - 每完成一个 chunk 记一条到 {parts_dir}/_checkpoint.json（区间 / 行数 / 字节数 / 各文件 crc32），
+      part 文件保留到整个 run 成功结束；resume=True 时校验清单里已完成的 chunk，
+      通过的直接复用，只重新生成缺失 / 损坏的，最终输出与一次跑完逐字节一致
+      （清单的配置指纹与本次不同时从头开始）
     """
+    if share_ctx and engine != "numpy":
+        raise ValueError("share_ctx requires engine='numpy'")
+    if output_format in DB_FILES:
+        # 数据库文件只能有一个写入者
+        raise ValueError(f"output_format={output_format!r} is only supported by run_once_stream")
+    if workers <= 0:
+        raise ValueError("workers must be > 0")
+    if chunks is not None and chunks <= 0:
+        raise ValueError("chunks must be > 0")
+    out = validate_output_options(
+        output_format,
+        parquet_compression,
+        csv_compression,
+        merge_parts=merge_parts,
+        partition_by=partition_by,
+        bucket_by=bucket_by,
+        buckets=buckets,
+    )
+
     cfg = Config(mode=mode, **(overrides or {}))
     rnd = random.Random(cfg.seed)
+    time_base = minute_time_base(cfg)
+    cache = _open_context_cache(cache_dir, engine)
 
     # ============================
     # 1 主进程生成维表并导出
     # ============================
-    ctx = prepare_stream_context(cfg, rnd)
+    ctx = prepare_context(cfg, rnd, cache)
 
     users = ctx["users"]
     shops = ctx["shops"]
@@ -447,82 +1388,140 @@ def run_once_stream_parallel(
     os.makedirs(ods_dir, exist_ok=True)
     os.makedirs(parts_dir, exist_ok=True)
 
-    export_csv(users, os.path.join(ods_dir, "ods_user_dim.csv"), ODS_SCHEMA["ods_user_dim"])
-    export_csv(shops, os.path.join(ods_dir, "ods_shop_dim.csv"), ODS_SCHEMA["ods_shop_dim"])
-    export_csv(skus, os.path.join(ods_dir, "ods_sku_dim.csv"), ODS_SCHEMA["ods_sku_dim"])
-
     # ============================
-    # 2 切分订单区间
+    # 2 切分订单 chunk，续跑时读清单（可选：共享数组上下文）
     # ============================
-    ranges = _split_order_ranges(cfg.order_cnt, workers)
-    tasks = []
+    if chunks is None:
+        # 按天分区时每个 chunk 每天写一个文件，默认不多切，避免小文件成倍增加
+        chunks = workers if out["partition_by"] is not None else workers * CHUNKS_PER_WORKER
+    ranges = chunk_ranges(cfg, chunks)
 
-    for worker_id, (start_oid, end_oid) in enumerate(ranges):
-        tasks.append(
-            (
-                worker_id,
-                mode,
-                overrides,
-                batch_size,
-                start_oid,
-                end_oid,
-                parts_dir,
+    checkpoint = ChunkCheckpoint(
+        parts_dir,
+        run_fingerprint(cfg, engine=engine, batch_size=batch_size, out=out, ranges=ranges, ods_dir=ods_dir),
+    )
+    done = checkpoint.load_completed() if resume else {}
+    if resume:
+        print(f"[resume] {len(done)}/{len(ranges)} chunks reused", file=sys.stderr)
+    checkpoint.save()
+
+    tasks = [
+        (chunk_id, batch_size, start_oid, end_oid, parts_dir, out, ods_dir)
+        for chunk_id, (start_oid, end_oid) in enumerate(ranges)
+        if chunk_id not in done
+    ]
+
+    prepare_output_layout(ods_dir, out, keep_tables=FACT_TABLES if done else ())
+    export_dim_tables(cfg, ctx, ods_dir, time_base, out)
+
+    if share_ctx:
+        actx = ctx.get("actx")
+        shared = SharedArrayContext(actx if actx is not None else prepare_stream_arrays(cfg, ctx))
+    else:
+        shared = None
+    shared_meta = shared.meta if shared is not None else None
+
+    # 单文件布局：边收 chunk 边按顺序拼接
+    assemblers = None
+    if not _table_dirs(out):
+        assemblers = {
+            table: PartAssembler(
+                csv_path(ods_dir, table, out),
+                ODS_SCHEMA[table],
+                out["csv_compression"],
             )
-        )
+            for table in FACT_TABLES
+        }
 
     # ============================
-    # 3 并行执行
+    # 3 并行执行（动态派发，结果乱序到达；已完成的 chunk 直接用清单里的结果）
     # ============================
-    with Pool(processes=workers) as pool:
-        results = pool.map(_stream_worker, tasks)
+    bucket_parts = None
+    results = list(done.values())
+
+    try:
+        if assemblers is not None:
+            for r in sorted(results, key=lambda r: r["chunk_id"]):
+                assemblers["ods_orders"].add(r["chunk_id"], r["orders_path"])
+                assemblers["ods_order_items"].add(r["chunk_id"], r["items_path"])
+
+        # 续跑时 chunk 可能全部已完成：不起进程池，也就不用重建上下文
+        if tasks:
+            with Pool(
+                processes=min(workers, len(tasks)),
+                initializer=init_chunk_worker,
+                initargs=(mode, overrides, engine, shared_meta, cache_dir),
+            ) as pool:
+                for r in pool.imap_unordered(generate_chunk, tasks):
+                    checkpoint.record(r)
+                    results.append(r)
+                    if assemblers is not None:
+                        assemblers["ods_orders"].add(r["chunk_id"], r["orders_path"])
+                        assemblers["ods_order_items"].add(r["chunk_id"], r["items_path"])
+
+        results.sort(key=lambda r: r["chunk_id"])
+
+        # 分桶：所有 chunk 的 spill 都写完后，按桶并行归并（排序不需要生成上下文，单独的进程池）
+        if out["bucket_by"] is not None:
+            spills = {
+                "ods_orders": [p for r in results for p in r["parts"]["orders"]],
+                "ods_order_items": [p for r in results for p in r["parts"]["items"]],
+            }
+            with Pool(processes=workers) as pool:
+                bucket_parts = _sort_bucket_tables(ods_dir, out, spills, map_fn=pool.map)
+    finally:
+        if shared is not None:
+            shared.close()
+        if assemblers is not None:
+            for assembler in assemblers.values():
+                assembler.close()
 
     # ============================
-    # 4 合并 part 文件
+    # 4 表目录布局不合并，只写 manifest
     # ============================
-    orders_parts = [r["orders_path"] for r in results]
-    items_parts = [r["items_path"] for r in results]
-
-    final_orders_path = os.path.join(ods_dir, "ods_orders.csv")
-    final_items_path = os.path.join(ods_dir, "ods_order_items.csv")
-
-    _merge_csv_files(orders_parts, final_orders_path)
-    _merge_csv_files(items_parts, final_items_path)
+    if _table_dirs(out):
+        for table, key in (("ods_orders", "orders"), ("ods_order_items", "items")):
+            if bucket_parts is not None:
+                parts = bucket_parts[table]
+            else:
+                parts = [p for r in results for p in r["parts"][key]]
+                # 分区文件按 dt 排（同一天内按 chunk 顺序）
+                parts.sort(key=lambda p: p.get("dt", ""))
+            _write_manifest(ods_dir, table, out, parts)
+
+        if bucket_parts is not None:
+            out_bytes = {
+                "orders": sum(p["bytes"] for p in bucket_parts["ods_orders"]),
+                "items": sum(p["bytes"] for p in bucket_parts["ods_order_items"]),
+            }
+        else:
+            out_bytes = {
+                "orders": sum(r["bytes"]["orders"] for r in results),
+                "items": sum(r["bytes"]["items"] for r in results),
+            }
+    else:
+        out_bytes = {
+            "orders": os.path.getsize(assemblers["ods_orders"].final_file),
+            "items": os.path.getsize(assemblers["ods_order_items"].final_file),
+        }
 
     # ============================
     # 5 汇总统计
     # ============================
-    cnt = Counter()
-    refund_paid = 0
-    paid_cnt = 0
-    top_users = Counter()
-    top_shops = Counter()
-    top_skus = Counter()
-
-    total_orders = 0
-    total_items = 0
-
-    for r in results:
-        total_orders += r["rows"]["orders"]
-        total_items += r["rows"]["items"]
-
-        cnt.update(r["status_dist"])
-        refund_paid += r["refund_paid"]
-        paid_cnt += r["paid_cnt"]
-
-        top_users.update(r["top_users"])
-        top_shops.update(r["top_shops"])
-        top_skus.update(r["top_skus"])
+    total_orders, total_items, stats = merge_chunk_stats(results)
 
     # ============================
     # 6 导出
     # ============================
     export_info = None
     if do_export:
-        ddl_path = write_hive_ddl("out/hive_ods_ddl.sql", database="dw_ods")
-        zip_path = pack_ods_zip(ods_dir)
+        ddl_path = write_ods_ddl(out)
+        msck_path = _write_ods_msck(out)
+        zip_path = pack_ods_zip(ods_dir) if pack_zip else None
         export_info = {
             "ods_dir": ods_dir,
             "ddl_path": ddl_path,
+            "msck_path": msck_path,
             "zip_path": zip_path,
         }
 
@@ -530,8 +1529,12 @@ def run_once_stream_parallel(
     # 7 清理 part 文件
     # ============================
     if not keep_parts:
-        _cleanup_files(orders_parts + items_parts)
-        _cleanup_dir_if_empty(parts_dir)
+        if not _table_dirs(out):
+            cleanup_files([r["orders_path"] for r in results] + [r["items_path"] for r in results])
+        if bucket_parts is not None:
+            _remove_spills(spills)
+        checkpoint.remove()
+        cleanup_dir_if_empty(parts_dir)
 
     # ============================
     # 8 返回统计
@@ -545,11 +1548,338 @@ def run_once_stream_parallel(
             "orders": total_orders,
             "items": total_items,
         },
-        "status_dist": dict(cnt),
-        "paid_ratio": round(paid_cnt / max(total_orders, 1), 6),
-        "refund_ratio_in_paid": round(refund_paid / max(paid_cnt, 1), 6),
-        "top10_users": top_users.most_common(10),
-        "top10_shops": top_shops.most_common(10),
-        "top10_skus": top_skus.most_common(10),
+        "bytes": out_bytes,
+        "status_dist": dict(stats["status_dist"]),
+        "paid_ratio": round(stats["paid_cnt"] / max(total_orders, 1), 6),
+        "refund_ratio_in_paid": round(stats["refund_paid"] / max(stats["paid_cnt"], 1), 6),
+        "top10_users": stats["top_users"].most_common(10),
+        "top10_shops": stats["top_shops"].most_common(10),
+        "top10_skus": stats["top_skus"].most_common(10),
+        "top10_error": top10_error(stats),
         "export": export_info,
-    }
\ No newline at end of file
+        "chunks": {
+            "total": len(ranges),
+            "resumed": len(done),
+        },
+    }
+
+
+# =========================
+# 多机分片：shard 各自生成，assemble 校验后合成
+# =========================
+SHARDS_DIR = "out/shards"
+SHARD_MANIFEST = "_shard.json"
+
+# 不指定 chunks 时每个分片平均分到这么多个 chunk（各分片必须用同一个 chunks）
+CHUNKS_PER_SHARD = 64
+
+SHARD_LAYOUTS = ("stitch", "index")
+
+
+def shard_dir_name(shard_index, shard_count):
+    return os.path.join(SHARDS_DIR, f"shard-{shard_index:03d}-of-{shard_count:03d}")
+
+
+def _shard_relative(entry, shard_dir):
+    """
+    清单条目里的路径改成相对 shard_dir（分片目录可以整体拷到别的机器再 assemble）
+    """
+    return {
+        **entry,
+        "orders_path": os.path.relpath(entry["orders_path"], shard_dir),
+        "items_path": os.path.relpath(entry["items_path"], shard_dir),
+        "stats_path": os.path.relpath(entry["stats_path"], shard_dir),
+        "files": {os.path.relpath(path, shard_dir): c for path, c in entry["files"].items()},
+    }
+
+
+def run_shard(
+    shard_index,
+    shard_count,
+    shard_dir=None,
+    mode="prod",
+    overrides=None,
+    batch_size=100000,
+    workers=1,
+    engine="python",
+    chunks=None,
+    csv_compression=None,
+    cache_dir=None,
+    resume=False,
+):
+    """
+    多机分片：第 shard_index 个分片（共 shard_count 个）只生成属于自己的订单 chunk
+    - chunk 切分与 run_once_stream_parallel 相同，chunk_id % shard_count == shard_index 的归本分片；
+      所有分片必须用同样的 mode / overrides / engine / batch_size / chunks / csv_compression
+      （这些都进了指纹，assemble 时核对）
+    - 维表只由 cfg.seed 决定，各分片互不通信也一致；只有 0 号分片把维表写出来
+    - 输出在 shard_dir（默认 out/shards/shard-{i:03d}-of-{n:03d}）：每个 chunk 一对 part
+      （与多进程单文件布局的 part 相同）+ 统计 .npz + 断点清单，
+      全部完成后写 _shard.json（路径都相对 shard_dir）
+    - 本机内部仍按 workers 个进程动态派发；resume=True 时跳过清单里已完成且校验通过的 chunk
+    """
+    if shard_count <= 0:
+        raise ValueError("shard_count must be > 0")
+    if not 0 <= shard_index < shard_count:
+        raise ValueError("shard_index must be in [0, shard_count)")
+    if workers <= 0:
+        raise ValueError("workers must be > 0")
+    if chunks is not None and chunks <= 0:
+        raise ValueError("chunks must be > 0")
+    out = validate_output_options("csv", "snappy", csv_compression)
+
+    cfg = Config(mode=mode, **(overrides or {}))
+    time_base = minute_time_base(cfg)
+
+    if shard_dir is None:
+        shard_dir = shard_dir_name(shard_index, shard_count)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    if chunks is None:
+        chunks = shard_count * CHUNKS_PER_SHARD
+    ranges = chunk_ranges(cfg, chunks)
+
+    fingerprint = run_fingerprint(
+        cfg, engine=engine, batch_size=batch_size, out=out, ranges=ranges, shard_count=shard_count,
+    )
+
+    # 先删掉上次的完成标记：这次跑到一半被杀时，assemble 不会把它当成完整分片
+    manifest_path = os.path.join(shard_dir, SHARD_MANIFEST)
+    cleanup_files([manifest_path])
+
+    checkpoint = ChunkCheckpoint(shard_dir, fingerprint)
+    done = checkpoint.load_completed() if resume else {}
+    checkpoint.save()
+
+    # ============================
+    # 1 维表（只有 0 号分片写）
+    # ============================
+    dims = {}
+    if shard_index == 0:
+        ctx = prepare_context(cfg, random.Random(cfg.seed), _open_context_cache(cache_dir, engine))
+        export_dim_tables(cfg, ctx, shard_dir, time_base, out)
+
+        for table, key in DIM_TABLES:
+            path = csv_path(shard_dir, table, out)
+            dims[table] = {"file": os.path.basename(path), "rows": len(ctx[key]), **file_checksum(path)}
+
+    # ============================
+    # 2 本分片的 chunk
+    # ============================
+    tasks = [
+        (chunk_id, batch_size, start_oid, end_oid, shard_dir, out, shard_dir)
+        for chunk_id, (start_oid, end_oid) in enumerate(ranges)
+        if chunk_id % shard_count == shard_index and chunk_id not in done
+    ]
+    if resume:
+        print(f"[resume] shard {shard_index}: {len(done)} chunks reused, {len(tasks)} to generate", file=sys.stderr)
+
+    if tasks:
+        with Pool(
+            processes=min(workers, len(tasks)),
+            initializer=init_chunk_worker,
+            initargs=(mode, overrides, engine, None, cache_dir),
+        ) as pool:
+            for r in pool.imap_unordered(generate_chunk, tasks):
+                checkpoint.record(r)
+
+    # ============================
+    # 3 完成标记
+    # ============================
+    entries = [_shard_relative(checkpoint.chunks[k], shard_dir) for k in sorted(checkpoint.chunks)]
+    manifest = {
+        "fingerprint": fingerprint,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "total_chunks": len(ranges),
+        "csv_compression": csv_compression,
+        "rows": {
+            "orders": sum(e["rows"]["orders"] for e in entries),
+            "items": sum(e["rows"]["items"] for e in entries),
+        },
+        "dims": dims,
+        "chunks": entries,
+    }
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+    return {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "shard_dir": shard_dir,
+        "manifest_path": manifest_path,
+        "chunks": {
+            "total": len(ranges),
+            "shard": len(entries),
+            "resumed": len(done),
+        },
+        "rows": manifest["rows"],
+    }
+
+
+def _load_shard_manifest(shard_dir):
+    path = os.path.join(shard_dir, SHARD_MANIFEST)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        raise ValueError(f"{path} not found (shard not finished?)")
+
+
+def check_part_file(path, expected, verify):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        raise ValueError(f"missing shard file: {path}")
+    if size != expected["bytes"]:
+        raise ValueError(f"size mismatch: {path} ({size} != {expected['bytes']})")
+    if verify and file_checksum(path)["crc32"] != expected["crc32"]:
+        raise ValueError(f"checksum mismatch: {path}")
+
+
+def _validate_shards(shard_dirs, verify):
+    """
+    读各分片的 _shard.json 并校验，返回 (manifests, [(shard_dir, chunk 条目), ...])，按 chunk_id 排序
+    """
+    if not shard_dirs:
+        raise ValueError("no shard directories given")
+
+    manifests = [_load_shard_manifest(d) for d in shard_dirs]
+    first = manifests[0]
+
+    for d, m in zip(shard_dirs, manifests):
+        if m["fingerprint"] != first["fingerprint"]:
+            raise ValueError(f"{d}: generated with a different configuration")
+
+    indexes = sorted(m["shard_index"] for m in manifests)
+    if indexes != list(range(first["shard_count"])):
+        raise ValueError(f"expected shards 0..{first['shard_count'] - 1}, got {indexes}")
+
+    chunks = []
+    for d, m in zip(shard_dirs, manifests):
+        for entry in m["chunks"]:
+            for rel, expected in entry["files"].items():
+                check_part_file(os.path.join(d, rel), expected, verify)
+            chunks.append((d, entry))
+
+    chunks.sort(key=lambda c: c[1]["chunk_id"])
+    chunk_ids = [entry["chunk_id"] for _, entry in chunks]
+    if chunk_ids != list(range(first["total_chunks"])):
+        missing = sorted(set(range(first["total_chunks"])) - set(chunk_ids))
+        raise ValueError(f"chunks missing or duplicated (missing: {missing[:10]})")
+
+    dim_dir, dim_manifest = next((d, m) for d, m in zip(shard_dirs, manifests) if m["shard_index"] == 0)
+    for expected in dim_manifest["dims"].values():
+        check_part_file(os.path.join(dim_dir, expected["file"]), expected, verify)
+
+    return manifests, chunks
+
+
+def assemble_shards(shard_dirs=None, ods_dir="out/ods", layout="stitch", verify=True, do_export=True):
+    """
+    校验各分片后合成最终输出：
+    - 所有分片指纹一致、分片号 0..n-1 齐全、chunk 号 0..total-1 恰好各一个、
+      每个文件都在且大小一致（verify=True 时再核 crc32）
+    - layout="stitch"：按 chunk 顺序字节级拼成 {ods_dir}/{table}.csv[.gz|.zst]（与单机多进程的输出逐字节一致），
+      维表从 0 号分片拷贝；do_export=True 时生成 Hive 建表语句
+    - layout="index"：不拷贝数据，每张表写 {ods_dir}/{table}/_manifest.json，
+      file 是指向分片目录里 part 的相对路径（按 chunk 顺序）
+    - shard_dirs 为 None 时取 out/shards/shard-*
+    """
+    if layout not in SHARD_LAYOUTS:
+        raise ValueError(f"layout must be one of {list(SHARD_LAYOUTS)}")
+    if shard_dirs is None:
+        shard_dirs = sorted(glob.glob(os.path.join(SHARDS_DIR, "shard-*")))
+
+    manifests, chunks = _validate_shards(shard_dirs, verify)
+    dim_dir, dim_manifest = next((d, m) for d, m in zip(shard_dirs, manifests) if m["shard_index"] == 0)
+    dims = dim_manifest["dims"]
+    compression = manifests[0]["csv_compression"]
+
+    results = [
+        {**entry, **load_chunk_counters(os.path.join(d, entry["stats_path"]))}
+        for d, entry in chunks
+    ]
+    total_orders, total_items, stats = merge_chunk_stats(results)
+
+    os.makedirs(ods_dir, exist_ok=True)
+    ddl_path = None
+
+    if layout == "stitch":
+        out = validate_output_options("csv", "snappy", compression)
+        prepare_output_layout(ods_dir, out)
+
+        for table, info in dims.items():
+            _copy_file(os.path.join(dim_dir, info["file"]), csv_path(ods_dir, table, out))
+
+        with PartAssembler(csv_path(ods_dir, "ods_orders", out), ODS_SCHEMA["ods_orders"], compression) as orders_asm, \
+                PartAssembler(csv_path(ods_dir, "ods_order_items", out), ODS_SCHEMA["ods_order_items"], compression) as items_asm:
+            for d, entry in chunks:
+                orders_asm.add(entry["chunk_id"], os.path.join(d, entry["orders_path"]))
+                items_asm.add(entry["chunk_id"], os.path.join(d, entry["items_path"]))
+
+        out_bytes = {
+            "orders": os.path.getsize(orders_asm.final_file),
+            "items": os.path.getsize(items_asm.final_file),
+        }
+        if do_export:
+            ddl_path = write_ods_ddl(out)
+    else:
+        out = validate_output_options("csv", "snappy", compression, merge_parts=False)
+        prepare_output_layout(ods_dir, out)
+
+        def rel(shard_dir, path, table):
+            return os.path.relpath(os.path.join(shard_dir, path), os.path.join(ods_dir, table))
+
+        for table, info in dims.items():
+            parts = [{"file": rel(dim_dir, info["file"], table), "rows": info["rows"], "bytes": info["bytes"]}]
+            write_table_manifest(
+                ods_dir, table, parts,
+                format="csv", compression=compression, header=True, columns=ODS_SCHEMA[table],
+            )
+
+        for table, key in (("ods_orders", "orders"), ("ods_order_items", "items")):
+            parts = [
+                {
+                    **entry["parts"][key][0],
+                    "file": rel(d, entry[f"{key}_path"], table),
+                    "chunk_id": entry["chunk_id"],
+                }
+                for d, entry in chunks
+            ]
+            # 压缩的 part 不带表头
+            write_table_manifest(
+                ods_dir, table, parts,
+                format="csv", compression=compression, header=compression is None, columns=ODS_SCHEMA[table],
+            )
+
+        out_bytes = {
+            "orders": sum(entry["bytes"]["orders"] for _, entry in chunks),
+            "items": sum(entry["bytes"]["items"] for _, entry in chunks),
+        }
+
+    return {
+        "ods_dir": ods_dir,
+        "layout": layout,
+        "shards": len(manifests),
+        "chunks": len(chunks),
+        "rows": {
+            "users": dims["ods_user_dim"]["rows"],
+            "shops": dims["ods_shop_dim"]["rows"],
+            "skus": dims["ods_sku_dim"]["rows"],
+            "orders": total_orders,
+            "items": total_items,
+        },
+        "bytes": out_bytes,
+        "status_dist": dict(stats["status_dist"]),
+        "paid_ratio": round(stats["paid_cnt"] / max(total_orders, 1), 6),
+        "refund_ratio_in_paid": round(stats["refund_paid"] / max(stats["paid_cnt"], 1), 6),
+        "top10_users": stats["top_users"].most_common(10),
+        "top10_shops": stats["top_shops"].most_common(10),
+        "top10_skus": stats["top_skus"].most_common(10),
+        "top10_error": top10_error(stats),
+        "ddl_path": ddl_path,
+    }
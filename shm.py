@@ -0,0 +1,92 @@
+"""
+共享内存数组上下文：
+多进程 + numpy 引擎时，主进程只准备一次数组上下文（facts_np.prepare_*_arrays 的结果），
+把所有数组拷进一块 multiprocessing.shared_memory，worker 按元信息零拷贝挂载。
+
+- 采样器数组（cum / alias / zipf 参数）、sku_price、user_gap_days 全部共享
+- worker 不再调 prepare_stream_context（不重新生成维表 / 抽样器 / user_profiles），
+  启动开销与 user_cnt、sku_cnt 无关
+- 元信息是普通 dict（块名 + 每个数组的偏移 / dtype / shape），可以直接 pickle 给 worker
+"""
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+# 每个数组按 64 字节对齐（缓存行）
+SHM_ALIGN = 64
+
+
+def _aligned(n):
+    return -(-n // SHM_ALIGN) * SHM_ALIGN
+
+
+# =========================
+# 1) 主进程：发布
+# =========================
+class SharedArrayContext:
+    """
+    主进程持有的共享块；用完必须 close()（会 unlink）
+
+    with SharedArrayContext(actx) as shared:
+        pool.map(worker, [(shared.meta, ...), ...])
+    """
+
+    def __init__(self, actx):
+        layout = {}
+        offset = 0
+        for key, arr in actx.items():
+            arr = np.ascontiguousarray(arr)
+            layout[key] = (offset, arr.dtype.str, arr.shape)
+            offset += _aligned(arr.nbytes)
+
+        # SharedMemory 不接受 size=0
+        self.shm = SharedMemory(create=True, size=max(offset, 1))
+
+        for key, arr in actx.items():
+            off, dtype, shape = layout[key]
+            view = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=off)
+            view[...] = arr
+
+        self.meta = {
+            "name": self.shm.name,
+            "arrays": layout,
+        }
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =========================
+# 2) worker：挂载
+# =========================
+def attach_arrays(meta):
+    """
+    按元信息挂载共享块，返回 (shm, actx)。
+    actx 里的数组都是共享块上的只读视图；shm 必须在用完 actx 之前一直持有。
+    """
+    # Pool 子进程和主进程共用同一个 resource_tracker，重复登记无害，
+    # 回收（unlink）只由主进程的 SharedArrayContext.close() 负责
+    shm = SharedMemory(name=meta["name"])
+
+    actx = {}
+    for key, (off, dtype, shape) in meta["arrays"].items():
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)
+        view.flags.writeable = False
+        actx[key] = view
+
+    return shm, actx
@@ -0,0 +1,253 @@
+"""
+命令行入口：
+
+    python -m simulator stream --table ods_orders --set order_cnt=1000000 > orders.csv
+    python -m simulator stream --table ods_orders | psql -c "\\copy ods_orders FROM STDIN CSV HEADER"
+    python -m simulator stream --table ods_order_items --out /tmp/items.pipe --mkfifo
+
+    # 多机：每台机器跑一个分片（参数必须完全相同，只有 --shard-index 不同），再汇总
+    python -m simulator shard --shard-index 0 --shard-count 4 --set order_cnt=1000000000 --workers 32
+    python -m simulator assemble out/shards/shard-*
+
+    # 弹性：常驻协调进程派 chunk，worker 随时加入 / 退出
+    python -m simulator coordinator --port 7070 --set order_cnt=100000000
+    python -m simulator worker --connect 127.0.0.1:7070 --token <协调进程打印的 token> --processes 8
+
+stream 只输出一张表的 CSV，stdout 上只有数据；进度和结果摘要都写 stderr；
+shard / assemble / coordinator 的结果摘要（JSON）写 stdout（只有这一行），进度 / 日志写 stderr
+"""
+import argparse
+import ast
+import json
+import os
+import stat
+import sys
+from multiprocessing import Process
+
+from config import Config
+from exporter import ODS_SCHEMA, CSV_COMPRESSIONS
+from pipeline import ENGINES
+from service import stream_table, run_shard, assemble_shards, SHARD_LAYOUTS
+
+
+def _parse_set(text):
+    """
+    --set key=value：value 按 Python 字面量解析（数字 / 布尔 / 列表），解析不了当字符串
+    """
+    if "=" not in text:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {text!r}")
+
+    key, value = text.split("=", 1)
+    key = key.strip()
+    if not hasattr(Config(), key):
+        raise argparse.ArgumentTypeError(f"unknown config field: {key}")
+
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key, value
+
+
+def _ensure_fifo(path):
+    if os.path.exists(path):
+        if not stat.S_ISFIFO(os.stat(path).st_mode):
+            raise SystemExit(f"{path} exists and is not a FIFO")
+        return
+    os.mkfifo(path)
+
+
+def _cmd_stream(args):
+    if args.mkfifo:
+        if args.out == "-":
+            raise SystemExit("--mkfifo requires --out <path>")
+        _ensure_fifo(args.out)
+
+    progress_cb = None
+    if args.progress:
+        def progress_cb(rows):
+            print(f"[stream] {args.table} rows={rows}", file=sys.stderr, flush=True)
+
+    try:
+        result = stream_table(
+            args.table,
+            out_path=args.out,
+            mode=args.mode,
+            overrides=dict(args.set),
+            batch_size=args.batch_size,
+            engine=args.engine,
+            header=not args.no_header,
+            csv_compression=args.compression,
+            progress_callback=progress_cb,
+        )
+    except BrokenPipeError:
+        # 下游提前退出（如 | head）：不打 traceback
+        print(f"[stream] {args.table}: reader closed the pipe", file=sys.stderr)
+        return 1
+
+    print(json.dumps(result), file=sys.stderr)
+    return 0
+
+
+def _cmd_shard(args):
+    result = run_shard(
+        args.shard_index,
+        args.shard_count,
+        shard_dir=args.shard_dir,
+        mode=args.mode,
+        overrides=dict(args.set),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        engine=args.engine,
+        chunks=args.chunks,
+        csv_compression=args.compression,
+        cache_dir=args.cache_dir,
+        resume=args.resume,
+    )
+    print(json.dumps(result))
+    return 0
+
+
+def _cmd_assemble(args):
+    try:
+        result = assemble_shards(
+            args.shard_dirs or None,
+            ods_dir=args.ods_dir,
+            layout=args.layout,
+            verify=not args.skip_checksums,
+            do_export=not args.no_ddl,
+        )
+    except ValueError as e:
+        print(f"[assemble] {e}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(result))
+    return 0
+
+
+def _cmd_coordinator(args):
+    # 协议模块只有这两个子命令用到
+    from coordinator import ELASTIC_DIR, run_coordinator
+
+    result = run_coordinator(
+        host=args.host,
+        port=args.port,
+        mode=args.mode,
+        overrides=dict(args.set),
+        batch_size=args.batch_size,
+        engine=args.engine,
+        chunks=args.chunks,
+        csv_compression=args.compression,
+        lease_seconds=args.lease_seconds,
+        ods_dir=args.ods_dir,
+        do_export=not args.no_ddl,
+        keep_parts=args.keep_parts,
+        resume=args.resume,
+        cache_dir=args.cache_dir,
+        token=args.token,
+        worker_roots=args.worker_root or (ELASTIC_DIR,),
+    )
+    # cfg 里有 datetime
+    print(json.dumps(result, default=str))
+    return 0
+
+
+def _parse_address(text):
+    host, sep, port = text.rpartition(":")
+    if not sep or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected host:port, got {text!r}")
+    return host, int(port)
+
+
+def _cmd_worker(args):
+    from coordinator import run_worker
+
+    if args.processes == 1:
+        print(json.dumps(run_worker(args.connect, args.token, work_dir=args.work_dir, name=args.name)))
+        return 0
+
+    # 多个 worker 进程各自连接、各自领 chunk（名字 / 目录按 pid 区分）
+    procs = [Process(target=run_worker, args=(args.connect, args.token)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return 0 if all(p.exitcode == 0 for p in procs) else 1
+
+
+def _add_generation_args(p, batch_size):
+    p.add_argument("--mode", default="prod")
+    p.add_argument("--set", action="append", default=[], type=_parse_set, metavar="KEY=VALUE",
+                   help="config override, repeatable")
+    p.add_argument("--batch-size", type=int, default=batch_size)
+    p.add_argument("--engine", default="python", choices=list(ENGINES))
+    p.add_argument("--compression", default=None, choices=[c for c in CSV_COMPRESSIONS if c])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="simulator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("stream", help="stream one ODS table as CSV to stdout / a FIFO")
+    p.add_argument("--table", required=True, choices=list(ODS_SCHEMA))
+    p.add_argument("--out", default="-", help="output path or FIFO, '-' for stdout (default)")
+    _add_generation_args(p, batch_size=50000)
+    p.add_argument("--no-header", action="store_true")
+    p.add_argument("--mkfifo", action="store_true", help="create --out as a FIFO if missing")
+    p.add_argument("--progress", action="store_true", help="print progress to stderr")
+    p.set_defaults(func=_cmd_stream)
+
+    p = sub.add_parser("shard", help="generate one shard of a multi-host run")
+    p.add_argument("--shard-index", type=int, required=True)
+    p.add_argument("--shard-count", type=int, required=True)
+    p.add_argument("--shard-dir", default=None, help="default out/shards/shard-III-of-NNN")
+    _add_generation_args(p, batch_size=100000)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--chunks", type=int, default=None, help="total chunks over all shards (must match)")
+    p.add_argument("--cache-dir", default=None, help="context cache dir (numpy engine)")
+    p.add_argument("--resume", action="store_true", help="reuse verified chunks from an interrupted run")
+    p.set_defaults(func=_cmd_shard)
+
+    p = sub.add_parser("assemble", help="validate shard manifests and build the final ODS output")
+    p.add_argument("shard_dirs", nargs="*", help="shard directories (default out/shards/shard-*)")
+    p.add_argument("--ods-dir", default="out/ods")
+    p.add_argument("--layout", default="stitch", choices=list(SHARD_LAYOUTS),
+                   help="stitch: concatenate into single files; index: write manifests pointing at the shards")
+    p.add_argument("--skip-checksums", action="store_true", help="check sizes only, not crc32")
+    p.add_argument("--no-ddl", action="store_true")
+    p.set_defaults(func=_cmd_assemble)
+
+    p = sub.add_parser("coordinator", help="serve order chunks to elastic workers over TCP")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7070, help="0 picks a free port")
+    _add_generation_args(p, batch_size=100000)
+    p.add_argument("--chunks", type=int, default=256)
+    p.add_argument("--lease-seconds", type=float, default=60)
+    p.add_argument("--ods-dir", default="out/ods")
+    p.add_argument("--cache-dir", default=None, help="context cache dir passed to workers (numpy engine)")
+    p.add_argument("--keep-parts", action="store_true")
+    p.add_argument("--resume", action="store_true", help="reuse verified chunks from an interrupted run")
+    p.add_argument("--no-ddl", action="store_true")
+    p.add_argument("--token", default=None, help="shared secret workers must send (random if omitted)")
+    p.add_argument("--worker-root", action="append", default=None,
+                   help="directory worker parts must live under (repeatable, default out/elastic)")
+    p.set_defaults(func=_cmd_coordinator)
+
+    p = sub.add_parser("worker", help="pull chunks from a coordinator until the run is done")
+    p.add_argument("--connect", type=_parse_address, default=("127.0.0.1", 7070), metavar="HOST:PORT")
+    p.add_argument("--token", required=True, help="token printed by the coordinator")
+    p.add_argument("--processes", type=int, default=1)
+    p.add_argument("--work-dir", default=None, help="where parts are written (single process only)")
+    p.add_argument("--name", default=None, help="worker name (single process only)")
+    p.set_defaults(func=_cmd_worker)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+整数分钟时间：
+time_mode="minute" 时，facts / dims / pipeline 内部的时间一律是
+相对 cfg.base_time 的分钟偏移（int），只在写出时才转成文本。
+
+MinuteFormatter 用“日期前缀表 + 1440 个时分后缀”拼字符串，
+结果与 datetime.strftime("%Y-%m-%d %H:%M:%S") 逐字节一致。
+"""
+from datetime import timedelta
+from functools import lru_cache
+
+
+ONE_MINUTE = timedelta(minutes=1)
+
+TIME_MODES = ("datetime", "minute")
+
+
+def time_origin(cfg):
+    """
+    时间原点：datetime 模式是 base_time，minute 模式是 0
+    """
+    return 0 if cfg.time_mode == "minute" else cfg.base_time
+
+
+def time_unit(cfg):
+    """
+    一分钟：datetime 模式是 timedelta，minute 模式是 1
+    origin + n * unit 两种模式通用
+    """
+    return 1 if cfg.time_mode == "minute" else ONE_MINUTE
+
+
+def minute_time_base(cfg):
+    """
+    给 exporter 用：minute 模式返回 base_time（时间列需要格式化），否则 None
+    """
+    return cfg.base_time if cfg.time_mode == "minute" else None
+
+
+class MinuteFormatter:
+    def __init__(self, base_time):
+        self.midnight = base_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.base_minute_of_day = base_time.hour * 60 + base_time.minute
+
+        # 秒数固定来自 base_time（偏移都是整分钟）
+        sec = base_time.second
+        self.hm_suffix = [
+            f" {h:02d}:{m:02d}:{sec:02d}"
+            for h in range(24)
+            for m in range(60)
+        ]
+        self.day_prefix = {}
+
+    def _prefix(self, day):
+        prefix = (self.midnight + timedelta(days=day)).strftime("%Y-%m-%d")
+        self.day_prefix[day] = prefix
+        return prefix
+
+    def __call__(self, minute):
+        day, minute_of_day = divmod(self.base_minute_of_day + minute, 24 * 60)
+        prefix = self.day_prefix.get(day)
+        if prefix is None:
+            prefix = self._prefix(day)
+        return prefix + self.hm_suffix[minute_of_day]
+
+
+@lru_cache(maxsize=8)
+def get_minute_formatter(base_time):
+    return MinuteFormatter(base_time)
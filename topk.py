@@ -0,0 +1,224 @@
+"""
+可合并的 ID 计数器（流式 / 多进程统计 Top 10 用）
+
+每个 chunk 都要数 user / shop / sku 各出现多少次，最后合并取 Top 10。
+Counter 每个出现过的 ID 占一项，整份 pickle 回主进程再 update，ID 空间一大内存和 IPC 都跟着涨；
+这里换成两种大小有上界的结构：
+
+- DenseIdCounter：ID 是 1..n 的连续整数，n <= DENSE_MAX_IDS 时开 n+1 长的 int64 数组，
+  每批 np.bincount 累加，合并就是数组相加，结果精确
+- HeavyHitterCounter：n 更大时（无表采样那一档）改用 Misra-Gries 摘要，最多留 capacity 个 ID。
+  每批先精确计数再并进摘要，超出容量就所有计数减去第 capacity+1 大的计数、丢掉 <= 0 的；
+  合并也是"相加再裁剪"，按任意顺序合并误差上界都一样：
+  每个 ID 的计数偏小不超过 error（累计减掉的量），error <= 总次数 / (capacity + 1)
+
+两种计数器接口相同：update(ids)、merge(other)、most_common(n)（次数降序，同次数按 ID 升序）、
+error（稠密计数恒为 0；摘要的 most_common 次数是下界，排名也只在误差范围内可信，结果里要带上它）；
+to_arrays() / counter_from_arrays() 给 .npz 和 JSON 报文用，pickle 时只带非零项
+"""
+import numpy as np
+
+
+# ID 空间不超过这个数时用精确的稠密数组（每个计数器最多 16MB）
+DENSE_MAX_IDS = 2_000_000
+# Misra-Gries 摘要保留的 ID 数
+HEAVY_HITTER_CAPACITY = 10_000
+
+COUNTER_DENSE = 0
+COUNTER_HEAVY_HITTER = 1
+
+# to_arrays() 的字段
+COUNTER_FIELDS = ("kind", "size", "keys", "counts", "error")
+
+
+def _as_ids(ids):
+    if isinstance(ids, np.ndarray):
+        return ids.astype(np.int64, copy=False)
+    return np.fromiter(ids, dtype=np.int64)
+
+
+def _top_n(keys, counts, n):
+    """
+    (keys, counts) 里计数最大的 n 个 -> [(id, count), ...]
+    """
+    if len(counts) > n:
+        kth = np.partition(counts, len(counts) - n)[len(counts) - n]
+        keep = counts >= kth
+        keys, counts = keys[keep], counts[keep]
+
+    order = np.lexsort((keys, -counts))[:n]
+    return [(int(k), int(c)) for k, c in zip(keys[order].tolist(), counts[order].tolist())]
+
+
+# =========================
+# 1) 稠密计数（精确）
+# =========================
+class DenseIdCounter:
+    """
+    counts[id] = 次数。反序列化后先保留稀疏的 (keys, counts)，
+    第一次 update / merge / most_common 时才展开成稠密数组（主进程里攒着的 chunk 结果不占 n 长的内存）
+    """
+
+    # 精确计数，和 HeavyHitterCounter.error 对齐
+    error = 0
+
+    def __init__(self, size):
+        self.size = int(size)
+        self._counts = None
+        self._sparse = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def _dense(self, min_size=0):
+        if self._counts is None:
+            keys, counts = self._sparse
+            self._counts = np.zeros(max(self.size, min_size), dtype=np.int64)
+            self._counts[keys] = counts
+            self._sparse = None
+        elif len(self._counts) < min_size:
+            self._counts = np.concatenate([self._counts, np.zeros(min_size - len(self._counts), dtype=np.int64)])
+        self.size = len(self._counts)
+        return self._counts
+
+    def _items(self):
+        if self._counts is None:
+            return self._sparse
+        keys = np.flatnonzero(self._counts)
+        return keys, self._counts[keys]
+
+    def update(self, ids):
+        ids = _as_ids(ids)
+        if len(ids) == 0:
+            return
+        add = np.bincount(ids, minlength=self.size)
+        self._dense(len(add))[:len(add)] += add
+
+    def merge(self, other):
+        if not isinstance(other, DenseIdCounter):
+            raise ValueError("cannot merge a dense counter with a heavy-hitter summary")
+        keys, counts = other._items()
+        if len(keys) == 0:
+            return
+        self._dense(int(keys[-1]) + 1)[keys] += counts
+
+    def most_common(self, n):
+        keys, counts = self._items()
+        return _top_n(keys, counts, n)
+
+    def to_arrays(self):
+        keys, counts = self._items()
+        return {
+            "kind": np.array(COUNTER_DENSE),
+            "size": np.array(self.size),
+            "keys": keys.astype(np.int64, copy=False),
+            "counts": counts,
+            "error": np.array(0),
+        }
+
+    def __reduce__(self):
+        return counter_from_arrays, (self.to_arrays(),)
+
+
+# =========================
+# 2) Heavy hitter 摘要（Misra-Gries，近似）
+# =========================
+class HeavyHitterCounter:
+    """
+    keys / counts 按 ID 升序，最多 capacity 项；counts 是下界，真实次数 <= count + error
+    """
+
+    def __init__(self, capacity=HEAVY_HITTER_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity must > 0")
+        self.capacity = int(capacity)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.error = 0
+
+    def _absorb(self, keys, counts, error):
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        self.error += error
+
+        if len(keys) > self.capacity:
+            # 第 capacity+1 大的计数：减掉之后最多剩 capacity 个正数
+            cut = int(np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1])
+            counts -= cut
+            keep = counts > 0
+            keys, counts = keys[keep], counts[keep]
+            self.error += cut
+
+        self.keys, self.counts = keys, counts
+
+    def update(self, ids):
+        ids = _as_ids(ids)
+        if len(ids) == 0:
+            return
+        keys, counts = np.unique(ids, return_counts=True)
+        self._absorb(keys, counts.astype(np.int64), 0)
+
+    def merge(self, other):
+        if not isinstance(other, HeavyHitterCounter):
+            raise ValueError("cannot merge a heavy-hitter summary with a dense counter")
+        self._absorb(other.keys, other.counts, other.error)
+
+    def most_common(self, n):
+        return _top_n(self.keys, self.counts, n)
+
+    def to_arrays(self):
+        return {
+            "kind": np.array(COUNTER_HEAVY_HITTER),
+            "size": np.array(self.capacity),
+            "keys": self.keys,
+            "counts": self.counts,
+            "error": np.array(self.error),
+        }
+
+    def __reduce__(self):
+        return counter_from_arrays, (self.to_arrays(),)
+
+
+# =========================
+# 3) 构造 / 序列化
+# =========================
+def new_id_counter(id_cnt):
+    """
+    ID 为 1..id_cnt 的计数器：小 ID 空间精确计数，大 ID 空间用 heavy hitter 摘要
+    """
+    if id_cnt <= DENSE_MAX_IDS:
+        return DenseIdCounter(id_cnt + 1)
+    return HeavyHitterCounter()
+
+
+def counter_from_arrays(arrays):
+    """
+    to_arrays() 的逆；arrays 的值可以是 numpy 数组，也可以是 JSON 解出来的 list / int
+    """
+    kind = int(np.asarray(arrays["kind"]))
+    size = int(np.asarray(arrays["size"]))
+    keys = np.asarray(arrays["keys"], dtype=np.int64)
+    counts = np.asarray(arrays["counts"], dtype=np.int64)
+
+    if kind == COUNTER_DENSE:
+        counter = DenseIdCounter(size)
+        counter._sparse = (keys, counts)
+        return counter
+    if kind == COUNTER_HEAVY_HITTER:
+        counter = HeavyHitterCounter(size)
+        counter.keys, counter.counts = keys, counts
+        counter.error = int(np.asarray(arrays["error"]))
+        return counter
+    raise ValueError(f"unknown counter kind: {kind}")
+
+
+def merge_id_counters(counters):
+    """
+    多个同类计数器 -> 合并后的新计数器（不改动输入）
+    """
+    merged = None
+    for c in counters:
+        if merged is None:
+            merged = counter_from_arrays(c.to_arrays())
+        else:
+            merged.merge(c)
+    return merged if merged is not None else DenseIdCounter(0)
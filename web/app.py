@@ -9,7 +9,9 @@ from datetime import datetime
 import uuid
 import threading
 
-from service import run_once_stream
+from service import run_once_stream, validate_output_options
+from pipeline import ENGINES
+from ctxcache import DEFAULT_CACHE_DIR
 
 
 # ========================
@@ -52,6 +54,10 @@ MAX_SKU_CNT = 1_000_000
 MAX_USER_CNT = 2_000_000
 MAX_BATCH_SIZE = 500_000
 MAX_ACTIVE_JOBS = 3
+MAX_BUCKETS = 1024
+
+# numpy 引擎的任务共用一个上下文缓存目录（重跑同一配置时不再重建维表 / 抽样器）
+CTX_CACHE_DIR = DEFAULT_CACHE_DIR
 
 
 class JobReq(BaseModel):
@@ -59,6 +65,12 @@ class JobReq(BaseModel):
     overrides: dict = {}
     batch_size: int = 50000
     do_export: bool = True
+    engine: str = "python"
+    output_format: str = "csv"
+    csv_compression: str | None = None
+    partition_by: str | None = None
+    bucket_by: str | None = None
+    buckets: int | None = None
 
 
 def _apply_guardrails(req: JobReq) -> None:
@@ -108,6 +120,25 @@ def _apply_guardrails(req: JobReq) -> None:
     if bs > MAX_BATCH_SIZE:
         raise HTTPException(400, f"batch_size too large (max {MAX_BATCH_SIZE})")
 
+    if req.engine not in ENGINES:
+        raise HTTPException(400, f"engine must be one of {list(ENGINES)}")
+
+    # 输出参数的组合校验与 service 共用；parquet_compression 用 run_once_stream 的默认值（web 不暴露）
+    try:
+        validate_output_options(
+            req.output_format,
+            "snappy",
+            req.csv_compression,
+            partition_by=req.partition_by,
+            bucket_by=req.bucket_by,
+            buckets=req.buckets,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if req.buckets is not None and req.buckets > MAX_BUCKETS:
+        raise HTTPException(400, f"buckets too large (max {MAX_BUCKETS})")
+
 
 def _active_jobs_count() -> int:
     return sum(
@@ -130,6 +161,13 @@ def worker(task_id: str, req: JobReq):
             batch_size=req.batch_size,
             do_export=req.do_export,
             progress_callback=progress_cb,
+            engine=req.engine,
+            cache_dir=CTX_CACHE_DIR if req.engine == "numpy" else None,
+            output_format=req.output_format,
+            csv_compression=req.csv_compression,
+            partition_by=req.partition_by,
+            bucket_by=req.bucket_by,
+            buckets=req.buckets,
         )
 
         TASKS[task_id]["status"] = "done"
@@ -159,6 +197,12 @@ def _create_task(req: JobReq) -> str:
             "overrides": req.overrides,
             "batch_size": req.batch_size,
             "do_export": req.do_export,
+            "engine": req.engine,
+            "output_format": req.output_format,
+            "csv_compression": req.csv_compression,
+            "partition_by": req.partition_by,
+            "bucket_by": req.bucket_by,
+            "buckets": req.buckets,
         },
         "source": "normal",
     }
@@ -222,12 +266,24 @@ def rerun_job(task_id: str):
     overrides = req_obj.get("overrides", {}) or {}
     batch_size = int(req_obj.get("batch_size", 50000))
     do_export = bool(req_obj.get("do_export", True))
+    engine = req_obj.get("engine", "python")
+    output_format = req_obj.get("output_format", "csv")
+    csv_compression = req_obj.get("csv_compression")
+    partition_by = req_obj.get("partition_by")
+    bucket_by = req_obj.get("bucket_by")
+    buckets = req_obj.get("buckets")
 
     new_req = JobReq(
         mode=mode,
         overrides=overrides,
         batch_size=batch_size,
         do_export=do_export,
+        engine=engine,
+        output_format=output_format,
+        csv_compression=csv_compression,
+        partition_by=partition_by,
+        bucket_by=bucket_by,
+        buckets=buckets,
     )
 
     new_task_id = _create_task(new_req)